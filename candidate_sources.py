@@ -0,0 +1,221 @@
+"""
+Candidate sources: Yahoo Finance screener pages behind one pooled HTTP client.
+
+- Every source (momentum screeners and the trending list) is fetched
+  concurrently, once per run; callers asking for the same source share the
+  in-flight request.
+- Requests reuse one keep-alive requests.Session and send If-None-Match /
+  If-Modified-Since, so an unchanged page costs a 304 with no body.
+- Only the Symbol column of the screener table is parsed (lxml), instead of
+  pd.read_html on every table of the page.
+- The last good symbol list per source is kept in data/screener_cache.json
+  and used when a source fails or comes back empty.
+"""
+import threading
+import concurrent.futures
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+import lxml.html
+
+import data_provider
+import rate_limiter
+import reference_cache
+
+CACHE_PATH = "data/screener_cache.json"
+
+SCREENER_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+# Momentum universe sources (get_momentum_candidates)
+MOMENTUM_SOURCES = {
+    'gainers': "https://finance.yahoo.com/markets/stocks/gainers/",
+    'most-active': "https://finance.yahoo.com/markets/stocks/most-active/",
+    '52-week-gainers': "https://finance.yahoo.com/markets/stocks/52-week-gainers/",
+    '52-week-losers': "https://finance.yahoo.com/markets/stocks/52-week-losers/",  # Reversal Hunting
+}
+# Trending tickers (update_data) = the most-active page, shared with the momentum sources
+TRENDING_SOURCE = 'most-active'
+
+SOURCES = dict(MOMENTUM_SOURCES)
+
+# Results are shared for this long within one process (one nightly run)
+MEMO_TTL = timedelta(minutes=10)
+# Last good result is still used as a fallback up to this age
+FALLBACK_MAX_AGE = timedelta(days=7)
+
+
+def parse_symbols(html):
+    """
+    Symbols from the first table with a 'Symbol' header, in page order.
+    Cells look like 'NVDA NVIDIA Corporation' -> first token.
+    """
+    doc = lxml.html.fromstring(html)
+    for table in doc.iter('table'):
+        headers = [th.text_content().strip() for th in table.xpath('./thead//th')]
+        if not headers:
+            first_row = table.xpath('.//tr[1]')
+            headers = [c.text_content().strip() for c in first_row[0].xpath('./th|./td')] if first_row else []
+        if 'Symbol' not in headers:
+            continue
+        col = headers.index('Symbol')
+        rows = table.xpath('./tbody/tr') or table.xpath('.//tr')[1:]
+        symbols = []
+        for tr in rows:
+            cells = tr.xpath('./td')
+            if len(cells) > col:
+                text = cells[col].text_content().split()
+                if text:
+                    symbols.append(text[0])
+        return symbols
+    return []
+
+
+class ScreenerCache(reference_cache.JsonCache):
+    """{url: {'symbols': [...], 'etag': str, 'last_modified': str, 'fetched_at': ISO timestamp}}"""
+
+    def __init__(self, path=CACHE_PATH):
+        super().__init__(path)
+
+    def last_good(self, url, max_age=FALLBACK_MAX_AGE):
+        entry = self.data.get(url) or {}
+        if not entry.get('symbols'):
+            return None
+        try:
+            if datetime.now() - datetime.fromisoformat(entry['fetched_at']) > max_age:
+                return None
+        except (KeyError, ValueError):
+            return None
+        return entry['symbols']
+
+    def store(self, url, symbols, etag=None, last_modified=None):
+        with self._lock:
+            entry = self.data.setdefault(url, {})
+            entry['symbols'] = symbols
+            entry['fetched_at'] = datetime.now().isoformat(timespec='seconds')
+            if etag is not None:
+                entry['etag'] = etag
+            if last_modified is not None:
+                entry['last_modified'] = last_modified
+
+
+class ScreenerClient:
+    """Pooled, conditional HTTP client for screener pages (used by YFinanceProvider.screener)."""
+
+    def __init__(self, cache=None, limiter=None, pool_size=8, timeout=5):
+        self.cache = cache or get_cache()
+        self.limiter = limiter or rate_limiter.get_limiter()
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(SCREENER_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.stats = {'requests': 0, 'not_modified': 0}
+
+    def _get(self, url, headers):
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        # Raise inside the limiter call so a 429 backs off and retries
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    def fetch(self, url):
+        """Symbols on a screener page (304 Not Modified -> cached symbols)."""
+        entry = self.cache.data.get(url) or {}
+        headers = {}
+        if entry.get('symbols'):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = self.limiter.call(self._get, url, headers)
+        self.stats['requests'] += 1
+        if response.status_code == 304:
+            self.stats['not_modified'] += 1
+            self.cache.store(url, entry['symbols'])
+            return list(entry['symbols'])
+
+        symbols = parse_symbols(response.content)
+        if symbols:
+            self.cache.store(url, symbols,
+                             etag=response.headers.get('ETag'),
+                             last_modified=response.headers.get('Last-Modified'))
+        return symbols
+
+
+_cache = None
+_client = None
+_memo = {}  # url -> (started, Future)
+_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = ScreenerCache()
+        return _cache
+
+
+def get_client():
+    """Process-wide screener client (one pooled session)."""
+    global _client
+    cache = get_cache()
+    with _lock:
+        if _client is None:
+            _client = ScreenerClient(cache=cache)
+        return _client
+
+
+def _fetch_with_fallback(url, provider):
+    cache = get_cache()
+    try:
+        symbols = provider.screener(url)
+    except Exception as e:
+        print(f"Screener fetch failed ({url}): {e}")
+        symbols = None
+    if symbols:
+        cache.store(url, symbols)  # keeps any validators stored by the client
+        return symbols
+    fallback = cache.last_good(url)
+    if fallback:
+        print(f"Screener fallback to last good result ({url}, {len(fallback)} symbols)")
+        return list(fallback)
+    return []
+
+
+def fetch_sources(names=None, provider=None):
+    """
+    Fetch screener sources concurrently (each at most once per MEMO_TTL).
+
+    Args:
+        names: source names from SOURCES (default: all)
+
+    Returns:
+        dict: {name: [symbols in page order]} (empty list if unavailable)
+    """
+    provider = provider or data_provider.get_provider()
+    names = list(names or SOURCES)
+    now = datetime.now()
+    futures = {}
+    with _lock:
+        executor = None
+        for name in names:
+            url = SOURCES[name]
+            memo = _memo.get(url)
+            if memo is None or now - memo[0] > MEMO_TTL:
+                if executor is None:
+                    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(names))
+                memo = (now, executor.submit(_fetch_with_fallback, url, provider))
+                _memo[url] = memo
+            futures[name] = memo[1]
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+    results = {name: f.result() for name, f in futures.items()}
+    get_cache().save()
+    return results
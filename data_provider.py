@@ -0,0 +1,503 @@
+"""
+Market data provider abstraction.
+
+Every data path (bulk history, fundamentals, earnings calendar, news and the
+screener pages) goes through a provider instead of calling yfinance directly:
+
+- YFinanceProvider : live Yahoo Finance, paced by the shared adaptive rate limiter
+- ReplayProvider   : file-backed, serves recorded (or deterministic synthetic) data
+                     with configurable latency -> offline, reproducible benchmarks
+- RecordingProvider: wraps another provider and records its responses in the
+                     replay layout
+
+Selection (env vars):
+    MM_PROVIDER=yfinance|replay|record   (default: yfinance)
+    MM_REPLAY_DIR=data/replay            (replay / record root)
+    MM_REPLAY_LATENCY=0.0                (seconds per request, replay only)
+    MM_REPLAY_AS_OF=YYYY-MM-DD           (replay clock; default = last recorded bar)
+
+Replay layout:
+    <root>/history/<ticker>.csv    OHLCV (Date index)
+    <root>/info/<ticker>.json      .info dict
+    <root>/calendar/<ticker>.json  .calendar dict (dates as YYYY-MM-DD)
+    <root>/news/<ticker>.json      .news list
+    <root>/screener/<name>.json    list of symbols
+"""
+import os
+import json
+import time
+import zlib
+import threading
+from datetime import datetime, date
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+import rate_limiter
+import candidate_sources
+
+OHLCV_COLS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# yfinance period strings -> trailing offsets (replay side)
+PERIOD_OFFSETS = {
+    '5d': pd.DateOffset(days=7),
+    '1mo': pd.DateOffset(months=1),
+    '3mo': pd.DateOffset(months=3),
+    '6mo': pd.DateOffset(months=6),
+    '1y': pd.DateOffset(years=1),
+    '2y': pd.DateOffset(years=2),
+    '5y': pd.DateOffset(years=5),
+}
+
+
+def normalize_bars(df):
+    """Convert a provider frame to the store layout (naive daily DatetimeIndex, OHLCV float columns)."""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=OHLCV_COLS)
+    if isinstance(df.columns, pd.MultiIndex):
+        # Single-ticker download with (Price, Ticker) columns
+        df = df.copy()
+        df.columns = df.columns.get_level_values(0)
+    missing = [c for c in OHLCV_COLS if c not in df.columns]
+    if missing:
+        return pd.DataFrame(columns=OHLCV_COLS)
+    df = df[OHLCV_COLS].copy()
+    idx = pd.DatetimeIndex(df.index)
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    df.index = idx.normalize()
+    df.index.name = 'Date'
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    return df.dropna(how='all')
+
+
+def split_download(batch_data, tickers):
+    """
+    Split a yf.download(group_by='ticker') frame into {ticker: DataFrame}.
+    Tickers with no rows are omitted.
+    """
+    out = {}
+    if batch_data is None or batch_data.empty:
+        return out
+    for t in tickers:
+        try:
+            if isinstance(batch_data.columns, pd.MultiIndex):
+                if t not in batch_data.columns.get_level_values(0):
+                    continue
+                t_data = batch_data[t]
+            else:
+                t_data = batch_data
+            t_data = normalize_bars(t_data).dropna()
+            if not t_data.empty:
+                out[t] = t_data
+        except Exception:
+            continue
+    return out
+
+
+def _file_name(ticker):
+    # Tickers such as ^GSPC / GC=F / BRK.B need escaping to be safe file names
+    return quote(ticker, safe='')
+
+
+def _json_default(obj):
+    if isinstance(obj, (datetime, date, pd.Timestamp)):
+        return obj.strftime("%Y-%m-%d")
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+
+class MarketDataProvider:
+    """Interface shared by every provider."""
+    name = "base"
+    chunk_size = 50     # tickers per bulk history request
+    max_workers = 8     # thread pool size for per-ticker requests
+
+    def download(self, tickers, start=None, period=None, known_good=()):
+        """
+        Bulk daily OHLCV (auto-adjusted). Returns {ticker: DataFrame}; missing tickers omitted.
+        known_good: tickers that are expected to return bars (live series already in the store)
+        """
+        raise NotImplementedError
+
+    def history(self, ticker, period="1y"):
+        """Daily OHLCV for one ticker (empty frame if unavailable)."""
+        raise NotImplementedError
+
+    def info(self, ticker):
+        """Fundamentals / profile dict (yfinance .info layout)."""
+        raise NotImplementedError
+
+    def calendar(self, ticker):
+        """Earnings calendar dict (yfinance .calendar layout), or None."""
+        raise NotImplementedError
+
+    def news(self, ticker):
+        """List of news items (yfinance .news layout)."""
+        raise NotImplementedError
+
+    def screener(self, url):
+        """Symbols listed on a Yahoo screener page, in page order."""
+        raise NotImplementedError
+
+
+def _new_session():
+    """HTTP session for yfinance (curl_cffi like yfinance itself; None = let yfinance create one)."""
+    try:
+        from curl_cffi import requests as curl_requests
+    except ImportError:
+        return None
+    return curl_requests.Session(impersonate="chrome")
+
+
+class YFinanceProvider(MarketDataProvider):
+    name = "yfinance"
+
+    def __init__(self, limiter=None, session=None):
+        self.limiter = limiter or rate_limiter.get_limiter()
+        # One pooled session (connections + Yahoo cookie/crumb) shared by every worker thread
+        self.session = session or _new_session()
+
+    @property
+    def chunk_size(self):
+        return self.limiter.chunk_size
+
+    @property
+    def max_workers(self):
+        return self.limiter.max_concurrency
+
+    def download(self, tickers, start=None, period=None, known_good=(), max_empty_retries=2):
+        # One request per ticker inside yf.download -> charge the whole chunk.
+        # A completely empty result is how yf.download reports throttling, but also what a single
+        # delisted / invalid ticker returns: only an empty chunk of several tickers that includes a
+        # known-good one counts as throttling (back off and retry). HTTP 429 / YFRateLimitError
+        # are handled by the limiter itself.
+        known_good = set(known_good)
+        throttle_suspect = len(tickers) > 1 and any(t in known_good for t in tickers)
+        for attempt in range(max_empty_retries + 1):
+            kwargs = dict(group_by='ticker', auto_adjust=True, progress=False, threads=self.limiter.concurrency,
+                          session=self.session)
+            if start is not None:
+                kwargs['start'] = start
+            else:
+                kwargs['period'] = period
+            batch_data = self.limiter.call(yf.download, list(tickers), cost=len(tickers), **kwargs)
+            result = split_download(batch_data, tickers)
+            if result or not throttle_suspect or attempt == max_empty_retries:
+                return result
+            self.limiter.on_throttle("empty batch")
+        return {}
+
+    def history(self, ticker, period="1y"):
+        df = self.limiter.call(yf.Ticker(ticker, session=self.session).history, period=period)
+        if df is None or df.empty:
+            # sometimes download works when history doesn't
+            df = self.limiter.call(yf.download, ticker, period=period, auto_adjust=True, progress=False,
+                                   session=self.session)
+        return normalize_bars(df)
+
+    def info(self, ticker):
+        t = yf.Ticker(ticker, session=self.session)
+        return self.limiter.call(lambda: t.info) or {}
+
+    def calendar(self, ticker):
+        t = yf.Ticker(ticker, session=self.session)
+        return self.limiter.call(lambda: t.calendar)
+
+    def news(self, ticker):
+        t = yf.Ticker(ticker, session=self.session)
+        return self.limiter.call(lambda: t.news) or []
+
+    def screener(self, url):
+        # Pooled session + conditional requests + symbol-column parsing
+        return candidate_sources.get_client().fetch(url)
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Serves recorded data from disk. Tickers without a recording get a
+    deterministic synthetic series (seeded by the ticker name) when
+    synthetic=True, so a full pipeline run needs no network at all.
+    """
+    name = "replay"
+    chunk_size = 100
+    max_workers = 16
+
+    SYNTHETIC_AS_OF = "2025-12-31"
+    SYNTHETIC_DAYS = 600
+
+    def __init__(self, root="data/replay", latency=0.0, as_of=None, synthetic=True):
+        self.root = root
+        self.latency = latency
+        self.synthetic = synthetic
+        self._as_of = pd.Timestamp(as_of) if as_of else None
+        self._cache = {}
+        self._synthetic_dates = None
+        self._lock = threading.Lock()
+
+    # --- Helpers ---
+
+    def _path(self, kind, ticker, ext):
+        return os.path.join(self.root, kind, _file_name(ticker) + ext)
+
+    def _wait(self, n=1):
+        if self.latency:
+            time.sleep(self.latency * n)
+
+    def _read_json(self, kind, ticker):
+        path = self._path(kind, ticker, ".json")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _seed(ticker):
+        # crc32 is stable across processes (hash() is salted)
+        return zlib.crc32(ticker.encode('utf-8'))
+
+    def as_of(self):
+        """Replay clock: configured date, else last recorded bar, else SYNTHETIC_AS_OF."""
+        if self._as_of is None:
+            last = None
+            hist_dir = os.path.join(self.root, "history")
+            if os.path.isdir(hist_dir):
+                for name in os.listdir(hist_dir):
+                    if not name.endswith(".csv"):
+                        continue
+                    try:
+                        tail = pd.read_csv(os.path.join(hist_dir, name), usecols=['Date'])['Date'].iloc[-1]
+                        d = pd.Timestamp(tail)
+                        last = d if last is None or d > last else last
+                    except Exception:
+                        continue
+            self._as_of = last if last is not None else pd.Timestamp(self.SYNTHETIC_AS_OF)
+        return self._as_of
+
+    def _synthetic_bars(self, ticker):
+        """
+        Synthetic series on a fixed calendar: SYNTHETIC_DAYS bars ending at SYNTHETIC_AS_OF,
+        extended day by day when the clock runs past it. Moving as_of only adds (or, via
+        _bars, hides) bars; the dates and values of the existing ones never change.
+        """
+        rng = np.random.default_rng(self._seed(ticker))
+        if self._synthetic_dates is None:
+            anchor = pd.Timestamp(self.SYNTHETIC_AS_OF)
+            start = pd.bdate_range(end=anchor, periods=self.SYNTHETIC_DAYS)[0]
+            self._synthetic_dates = pd.bdate_range(start=start, end=max(anchor, self.as_of()), name='Date')
+        dates = self._synthetic_dates
+        n = self.SYNTHETIC_DAYS
+        drift = rng.normal(0.0004, 0.0008)
+        vol = rng.uniform(0.01, 0.045)
+        close = rng.uniform(5, 400) * np.exp(np.cumsum(rng.normal(drift, vol, n)))
+        open_ = close * (1 + rng.normal(0, vol / 3, n))
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, vol / 2, n)))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, vol / 2, n)))
+        volume_mean = np.log(rng.uniform(3e5, 2e7))
+        volume = rng.lognormal(volume_mean, 0.5, n).round()
+
+        extra = len(dates) - n
+        if extra > 0:
+            # One row of draws per extra day, so a later clock keeps the earlier extra bars
+            z = np.random.default_rng([self._seed(ticker), 1]).standard_normal((extra, 5))
+            close_x = close[-1] * np.exp(np.cumsum(drift + vol * z[:, 0]))
+            open_x = close_x * (1 + vol / 3 * z[:, 1])
+            high_x = np.maximum(open_x, close_x) * (1 + np.abs(vol / 2 * z[:, 2]))
+            low_x = np.minimum(open_x, close_x) * (1 - np.abs(vol / 2 * z[:, 3]))
+            volume_x = np.exp(volume_mean + 0.5 * z[:, 4]).round()
+            close, open_ = np.concatenate([close, close_x]), np.concatenate([open_, open_x])
+            high, low = np.concatenate([high, high_x]), np.concatenate([low, low_x])
+            volume = np.concatenate([volume, volume_x])
+        return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume}, index=dates)
+
+    def _bars(self, ticker):
+        with self._lock:
+            if ticker in self._cache:
+                return self._cache[ticker]
+        path = self._path("history", ticker, ".csv")
+        if os.path.exists(path):
+            df = pd.read_csv(path, index_col='Date', parse_dates=['Date'], float_precision='round_trip')
+            df = normalize_bars(df)
+        elif self.synthetic:
+            df = self._synthetic_bars(ticker)
+        else:
+            df = pd.DataFrame(columns=OHLCV_COLS, index=pd.DatetimeIndex([], name='Date'), dtype=float)
+        df = df[df.index <= self.as_of()]
+        with self._lock:
+            self._cache[ticker] = df
+        return df
+
+    def _slice(self, df, start=None, period=None):
+        if df.empty:
+            return df
+        if start is not None:
+            return df[df.index >= pd.Timestamp(start)]
+        offset = PERIOD_OFFSETS.get(period or '1y')
+        if offset is None:
+            return df
+        return df[df.index > self.as_of() - offset]
+
+    # --- Provider API ---
+
+    def download(self, tickers, start=None, period=None, known_good=()):
+        self._wait()
+        out = {}
+        for t in tickers:
+            df = self._slice(self._bars(t), start=start, period=period)
+            if not df.empty:
+                out[t] = df.copy()
+        return out
+
+    def history(self, ticker, period="1y"):
+        self._wait()
+        return self._slice(self._bars(ticker), period=period).copy()
+
+    def info(self, ticker):
+        self._wait()
+        data = self._read_json("info", ticker)
+        if data is not None or not self.synthetic:
+            return data or {}
+        rng = np.random.default_rng(self._seed(ticker) + 1)
+        return {
+            'shortName': f"{ticker} Synthetic Corp",
+            'industry': 'Synthetic',
+            'sector': 'Synthetic',
+            'longBusinessSummary': f"{ticker} is a synthetic company served by the replay provider.",
+            'shortRatio': round(rng.uniform(0.5, 8), 2),
+            'heldPercentInstitutions': round(rng.uniform(0.1, 1.0), 4),
+            'heldPercentInsiders': round(rng.uniform(0.0, 0.3), 4),
+            'floatShares': int(rng.uniform(1e7, 5e9)),
+            'beta': round(rng.uniform(0.3, 2.5), 3),
+            'forwardPE': round(rng.uniform(5, 80), 2),
+            'marketCap': int(rng.uniform(3e8, 3e12)),
+        }
+
+    def calendar(self, ticker):
+        self._wait()
+        data = self._read_json("calendar", ticker)
+        if data is None and self.synthetic:
+            days_ahead = self._seed(ticker) % 90
+            d = (self.as_of() + pd.Timedelta(days=int(days_ahead))).strftime("%Y-%m-%d")
+            data = {'Earnings Date': [d]}
+        if not data:
+            return {}
+        # Restore date objects like yfinance returns them
+        if data.get('Earnings Date'):
+            data['Earnings Date'] = [datetime.strptime(d, "%Y-%m-%d").date() for d in data['Earnings Date']]
+        return data
+
+    def news(self, ticker):
+        self._wait()
+        return self._read_json("news", ticker) or []
+
+    def screener(self, url):
+        self._wait()
+        name = url.rstrip('/').split('/')[-1]
+        data = self._read_json("screener", name)
+        if data is not None:
+            return data
+        if not self.synthetic:
+            return []
+        rng = np.random.default_rng(self._seed(name))
+        return [f"SYN{n:03d}" for n in rng.choice(200, size=30, replace=False)]
+
+
+class RecordingProvider(MarketDataProvider):
+    """Pass-through wrapper that saves every response in the replay layout."""
+    name = "record"
+
+    def __init__(self, inner, root="data/replay"):
+        self.inner = inner
+        self.root = root
+        self._lock = threading.Lock()
+
+    @property
+    def chunk_size(self):
+        return self.inner.chunk_size
+
+    @property
+    def max_workers(self):
+        return self.inner.max_workers
+
+    def _write_json(self, kind, key, data):
+        path = os.path.join(self.root, kind, _file_name(key) + ".json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, default=_json_default)
+
+    def _write_bars(self, ticker, df):
+        if df is None or df.empty:
+            return
+        path = os.path.join(self.root, "history", _file_name(ticker) + ".csv")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            if os.path.exists(path):
+                old = pd.read_csv(path, index_col='Date', parse_dates=['Date'], float_precision='round_trip')
+                df = pd.concat([old[~old.index.isin(df.index)], df]).sort_index()
+            df.to_csv(path, index_label='Date')
+
+    def download(self, tickers, start=None, period=None, known_good=()):
+        out = self.inner.download(tickers, start=start, period=period, known_good=known_good)
+        for t, df in out.items():
+            self._write_bars(t, df)
+        return out
+
+    def history(self, ticker, period="1y"):
+        df = self.inner.history(ticker, period=period)
+        self._write_bars(ticker, df)
+        return df
+
+    def info(self, ticker):
+        data = self.inner.info(ticker)
+        self._write_json("info", ticker, data)
+        return data
+
+    def calendar(self, ticker):
+        data = self.inner.calendar(ticker)
+        if isinstance(data, dict):
+            self._write_json("calendar", ticker, data)
+        return data
+
+    def news(self, ticker):
+        data = self.inner.news(ticker)
+        self._write_json("news", ticker, data)
+        return data
+
+    def screener(self, url):
+        data = self.inner.screener(url)
+        self._write_json("screener", url.rstrip('/').split('/')[-1], data)
+        return data
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """Process-wide provider selected by MM_PROVIDER (see module docstring)."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            kind = os.environ.get('MM_PROVIDER', 'yfinance').lower()
+            root = os.environ.get('MM_REPLAY_DIR', 'data/replay')
+            if kind == 'replay':
+                _provider = ReplayProvider(
+                    root=root,
+                    latency=float(os.environ.get('MM_REPLAY_LATENCY', '0') or 0),
+                    as_of=os.environ.get('MM_REPLAY_AS_OF') or None,
+                )
+            elif kind == 'record':
+                _provider = RecordingProvider(YFinanceProvider(), root=root)
+            else:
+                _provider = YFinanceProvider()
+        return _provider
+
+
+def set_provider(provider):
+    """Override the process-wide provider (benchmarks / scripts)."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
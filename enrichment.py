@@ -0,0 +1,206 @@
+"""
+Ticker enrichment: one .info request per ticker feeds every reference cache.
+
+.info already carries everything the nightly stages need about a ticker:
+- fundamentals (shortRatio, ownership, float, beta, forwardPE, marketCap)
+- metadata (shortName, industry, longBusinessSummary)
+- the next earnings date (earningsTimestampStart / earningsTimestamp)
+
+So instead of get_fund, fetch_metadata_batch and the earnings step each
+making their own request for the same ticker, the Enricher asks every cache
+which tickers it needs, fetches .info once per ticker, and fans the result
+out to all three. .calendar is only requested as a fallback when .info has
+no upcoming earnings date for a ticker whose date needs refreshing.
+
+Tickers that keep failing on .info / .calendar are recorded in the
+quarantine registry and skipped on that endpoint for a while.
+"""
+import concurrent.futures
+from datetime import datetime
+
+import pandas as pd
+
+import data_provider
+import quarantine
+import reference_cache
+
+SUMMARY_MAX_CHARS = 300
+# .info fields holding earnings timestamps (epoch seconds)
+EARNINGS_TS_FIELDS = ('earningsTimestampStart', 'earningsTimestamp', 'earningsCallTimestampStart')
+EARNINGS_TZ = 'America/New_York'
+
+
+def metadata_entry(ticker, info):
+    """Name / industry / summary (English) for the metadata cache."""
+    name = info.get('shortName', info.get('longName', ticker))
+    industry = info.get('industry', info.get('sector', ''))
+    summary_en = info.get('longBusinessSummary', '')
+    if summary_en:
+        summary_en = summary_en[:SUMMARY_MAX_CHARS] + "..." if len(summary_en) > SUMMARY_MAX_CHARS else summary_en
+    return {'name': name, 'industry': industry, 'summary': summary_en}
+
+
+def earnings_date_from_info(info, today=None):
+    """Next earnings date ('YYYY-MM-DD', US/Eastern) from .info, or None if none upcoming."""
+    today = today or pd.Timestamp.now(tz=EARNINGS_TZ).strftime("%Y-%m-%d")
+    upcoming = []
+    for field in EARNINGS_TS_FIELDS:
+        ts = info.get(field)
+        if not isinstance(ts, (int, float)) or ts <= 0:
+            continue
+        d = pd.Timestamp(ts, unit='s', tz='UTC').tz_convert(EARNINGS_TZ).strftime("%Y-%m-%d")
+        if d >= today:
+            upcoming.append(d)
+    return min(upcoming) if upcoming else None
+
+
+def earnings_date_from_calendar(cal):
+    """First 'Earnings Date' of a .calendar result ('YYYY-MM-DD'), or None."""
+    d = None
+    if isinstance(cal, dict):
+        dates = cal.get('Earnings Date', [])
+        if dates:
+            d = dates[0]
+    elif isinstance(cal, pd.DataFrame):
+        # Handle DataFrame return (sometimes yfinance returns DF)
+        if not cal.empty and 'Earnings Date' in cal.columns:
+            d = cal['Earnings Date'].iloc[0]
+    if d is None:
+        return None
+    if isinstance(d, (datetime, pd.Timestamp)):
+        return d.strftime("%Y-%m-%d")
+    return str(d)
+
+
+def info_price(info):
+    """Price the .info snapshot refers to (reference for rescaling forwardPE / marketCap)."""
+    for field in ('regularMarketPrice', 'currentPrice', 'previousClose'):
+        if info.get(field):
+            return info[field]
+    return None
+
+
+class Enricher:
+    """
+    Usage:
+        e = Enricher(skip_earnings=etf_tickers)
+        stats = e.run(candidates)
+        e.save(export_tickers=candidates)
+    """
+
+    def __init__(self, provider=None, fundamentals=None, metadata=None, calendar=None, skip_earnings=(),
+                 registry=None):
+        self.provider = provider or data_provider.get_provider()
+        self.registry = registry if registry is not None else quarantine.get_registry()
+        self.fundamentals = fundamentals if fundamentals is not None else reference_cache.FundamentalsCache()
+        self.metadata = metadata if metadata is not None else reference_cache.MetadataCache()
+        self.calendar = calendar if calendar is not None else reference_cache.EarningsCalendar()
+        self.skip_earnings = set(skip_earnings)
+
+    def plan(self, tickers):
+        """{ticker: {'fundamentals', 'metadata', 'earnings'} parts that need a refresh}"""
+        earnings_dates = self.calendar.dates()
+        needs = {}
+        for t in self.fundamentals.stale_tickers(tickers, earnings_dates):
+            needs.setdefault(t, set()).add('fundamentals')
+        for t in self.metadata.stale_tickers(tickers):
+            needs.setdefault(t, set()).add('metadata')
+        for t in self.calendar.stale_tickers([t for t in tickers if t not in self.skip_earnings]):
+            needs.setdefault(t, set()).add('earnings')
+        return needs
+
+    def _enrich_one(self, ticker, parts):
+        """Fetch .info once and fan it out. Returns (info_ok, earnings_found)."""
+        try:
+            info = self.provider.info(ticker)
+            error = "empty .info"
+        except Exception as e:
+            info, error = None, e
+
+        if not info:
+            self.registry.record_failure(ticker, 'info', error)
+            # Keep previous entries; a new ticker gets an empty metadata placeholder (retried later)
+            if 'metadata' in parts and ticker not in self.metadata:
+                self.metadata.put(ticker, {'name': ticker, 'industry': '', 'summary': ''})
+            return False, False
+
+        self.registry.record_success(ticker, 'info')
+        self.fundamentals.put(ticker, info, price=info_price(info))
+        self.metadata.put(ticker, metadata_entry(ticker, info))
+        next_date = None if ticker in self.skip_earnings else earnings_date_from_info(info)
+        if next_date:
+            self.calendar.record(ticker, next_date)
+        for cache in (self.fundamentals, self.metadata, self.calendar):
+            cache.checkpoint()
+        return True, next_date is not None
+
+    def _calendar_one(self, ticker):
+        try:
+            date_str = earnings_date_from_calendar(self.provider.calendar(ticker))
+            # An empty calendar is a normal answer (handled by the calendar's own backoff)
+            self.registry.record_success(ticker, 'calendar')
+        except Exception as e:
+            self.registry.record_failure(ticker, 'calendar', e)
+            date_str = None
+        self.calendar.record(ticker, date_str)
+        self.calendar.checkpoint()
+
+    def run(self, tickers):
+        """
+        Refresh every cache for the tickers that need it.
+
+        Returns:
+            dict: stats {'tickers', 'info_requests', 'info_failed', 'calendar_requests', 'quarantined'}
+        """
+        needs = self.plan(tickers)
+        allowed, skipped = self.registry.filter(list(needs), 'info')
+        # Earnings for tickers quarantined on .info can still come from .calendar
+        calendar_fallback = [t for t in skipped if 'earnings' in needs[t]]
+        needs = {t: needs[t] for t in allowed}
+        stats = {'tickers': len(tickers), 'info_requests': len(needs), 'info_failed': 0, 'calendar_requests': 0,
+                 'quarantined': len(skipped)}
+        print(f"  Enriching {len(needs)} of {len(tickers)} tickers with one .info request each...")
+
+        done = 0
+        # In-flight requests are capped by the provider's rate limiter
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.provider.max_workers) as executor:
+            futures = {executor.submit(self._enrich_one, t, parts): t for t, parts in needs.items()}
+            for future in concurrent.futures.as_completed(futures):
+                t = futures[future]
+                info_ok, earnings_found = future.result()
+                if not info_ok:
+                    stats['info_failed'] += 1
+                if 'earnings' in needs[t] and not earnings_found:
+                    calendar_fallback.append(t)
+                done += 1
+                if done % 20 == 0 or done == len(needs):
+                    print(f"    Enrichment: {done}/{len(needs)}", end='\r')
+        if needs:
+            print("")
+
+        # .info had no upcoming earnings date -> ask the calendar endpoint
+        calendar_fallback, skipped = self.registry.filter(calendar_fallback, 'calendar')
+        stats['quarantined'] += len(skipped)
+        if calendar_fallback:
+            stats['calendar_requests'] = len(calendar_fallback)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.provider.max_workers) as executor:
+                list(executor.map(self._calendar_one, calendar_fallback))
+
+        print(f"  Enrichment: {stats}")
+        return stats
+
+    def save(self, export_tickers=None, earnings_path=None):
+        """
+        Persist all caches (changed tickers only). With export_tickers, also return their
+        {ticker: 'YYYY-MM-DD' or '-'} earnings dates (written to earnings_path if given)
+        and drop metadata for tickers long gone from the universe.
+        """
+        self.fundamentals.save()
+        self.registry.save()
+        if export_tickers is not None:
+            self.metadata.prune(keep=export_tickers)
+        self.metadata.save()
+        self.calendar.save()
+        if export_tickers is not None:
+            return self.calendar.export(export_tickers, earnings_path)
+        return None
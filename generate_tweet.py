@@ -8,9 +8,12 @@ from datetime import datetime
 import random
 import os
 import requests
-import yfinance as yf
 import json
 
+import price_store
+import metrics_snapshot
+import snapshot
+
 # Import sector definitions from market_logic
 from market_logic import SECTOR_DEFINITIONS, TICKER_TO_SECTOR, SECTOR_JP_MAP
 
@@ -29,13 +32,23 @@ DISCORD_WEBHOOK_URL = os.environ.get('DISCORD_WEBHOOK_URL', '')
 
 
 def get_major_indices():
-    """Fetch 1-day returns for major indices"""
+    """1-day returns for major indices (from update_data.py output, no network)"""
     results = []
     
+    cached = {}
+    indices_path = snapshot.resolve(snapshot.INDICES)
+    if os.path.exists(indices_path):
+        with open(indices_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    
     for ticker, jp_name in MAJOR_INDICES.items():
         try:
-            data = yf.Ticker(ticker)
-            hist = data.history(period="5d")
+            entry = cached.get(ticker, {})
+            if not entry.get('error', True) and '1d' in entry.get('returns', {}):
+                results.append((jp_name, entry['returns']['1d']))
+                continue
+            # Fallback: synced price store
+            hist = price_store.get_store().load(ticker, period="5d")
             if len(hist) >= 2:
                 prev_close = hist['Close'].iloc[-2]
                 last_close = hist['Close'].iloc[-1]
@@ -51,7 +64,7 @@ def get_major_indices():
 
 def load_cache():
     """Load the momentum cache"""
-    df = pd.read_csv('data/momentum_cache.csv')
+    df = metrics_snapshot.load_metrics(snapshot.resolve(snapshot.METRICS), snapshot.resolve(snapshot.METRICS_CSV))
     return df
 
 def get_top_movers(df, n=5):
@@ -481,21 +494,22 @@ def format_weekly_summary(watchlist_analyses):
 
 def get_signal_stocks_from_history():
     """Get stocks with active signals using history cache, matching Streamlit app workflow"""
-    import pickle
     import market_logic
+    import history_store
     
-    # Load history cache
-    history_cache_path = 'data/history_cache.pkl'
-    try:
-        with open(history_cache_path, 'rb') as f:
-            history_dict = pickle.load(f)
-    except FileNotFoundError:
-        print(f"⚠️ History cache not found: {history_cache_path}")
+    # Load history snapshot (memory-mapped; each ticker is read when the scan reaches it)
+    history_path = snapshot.resolve(snapshot.HISTORY)
+    history_dict = history_store.open_history(history_path)
+    if history_dict is None:
+        print(f"⚠️ History cache not found: {history_path}")
         return {}
     
-    # Get today's signals using market_logic function (same as Streamlit app)
+    # Get today's signals using market_logic function (same as Streamlit app);
+    # indicators come from the nightly streaming state where it is current for the snapshot
     try:
-        daily_signals = market_logic.get_todays_signals(history_dict)
+        import indicator_state
+        state = indicator_state.IndicatorState.load()
+        daily_signals = market_logic.get_todays_signals(history_dict, state=state)
     except Exception as e:
         print(f"⚠️ Error getting signals: {e}")
         return {}
@@ -0,0 +1,155 @@
+"""
+Columnar chart-history snapshot (data/history/), replacing data/history_cache.pkl.
+
+The pickle held ~700 DataFrames and had to be unpickled in full by every
+reader. Here every column is one flat .npy file holding all tickers back to
+back, and index.json maps each ticker to its (offset, length) slice:
+
+    data/history/
+        index.json      {'version', 'columns', 'index_name', 'rows', 'tickers': {ticker: [offset, length]}}
+        Date.npy        datetime64, one entry per row
+        Open.npy ... Volume.npy
+
+Opening is a memory map (no data is read until it is touched), a ticker's
+DataFrame is built only when it is asked for, and column() / latest() read
+straight from the mapped arrays without building any DataFrame.
+"""
+import os
+import json
+import shutil
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+HISTORY_DIR = "data/history"
+INDEX_FILE = "index.json"
+DATE_FILE = "Date.npy"
+FORMAT_VERSION = 1
+
+
+def write_history(history, root=HISTORY_DIR):
+    """
+    Write {ticker: OHLCV DataFrame} as a columnar snapshot (atomic directory swap).
+
+    Returns:
+        str: root
+    """
+    tickers = [t for t, df in history.items() if df is not None and not df.empty]
+    columns = []
+    for t in tickers:
+        for c in history[t].columns:
+            if c not in columns:
+                columns.append(c)
+    index_name = history[tickers[0]].index.name if tickers else None
+
+    offsets = {}
+    pos = 0
+    for t in tickers:
+        offsets[t] = [pos, len(history[t])]
+        pos += len(history[t])
+
+    tmp_root = root + ".tmp"
+    shutil.rmtree(tmp_root, ignore_errors=True)
+    os.makedirs(tmp_root)
+
+    if tickers:
+        dates = np.concatenate([history[t].index.values for t in tickers])
+    else:
+        dates = np.array([], dtype='datetime64[ns]')
+    np.save(os.path.join(tmp_root, DATE_FILE), dates)
+    for c in columns:
+        parts = [history[t][c].to_numpy() if c in history[t].columns else np.full(len(history[t]), np.nan)
+                 for t in tickers]
+        values = np.concatenate(parts) if parts else np.array([], dtype='float64')
+        np.save(os.path.join(tmp_root, f"{c}.npy"), values)
+
+    with open(os.path.join(tmp_root, INDEX_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'version': FORMAT_VERSION, 'columns': columns, 'index_name': index_name,
+                   'rows': pos, 'tickers': offsets}, f)
+
+    # Swap directories: readers holding the old memory maps keep their (unlinked) files
+    old_root = root + ".old"
+    shutil.rmtree(old_root, ignore_errors=True)
+    if os.path.exists(root):
+        os.rename(root, old_root)
+    os.rename(tmp_root, root)
+    shutil.rmtree(old_root, ignore_errors=True)
+    return root
+
+
+class HistoryStore(Mapping):
+    """
+    Read-only {ticker: DataFrame} view over a columnar snapshot.
+
+    history[t] builds that ticker's DataFrame (a small copy, safe to modify);
+    everything else works on the memory-mapped arrays.
+    """
+
+    def __init__(self, root=HISTORY_DIR):
+        self.root = root
+        with open(os.path.join(root, INDEX_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported history format: {meta.get('version')}")
+        self.columns = meta['columns']
+        self.index_name = meta.get('index_name')
+        self.offsets = meta['tickers']
+        self.dates = np.load(os.path.join(root, DATE_FILE), mmap_mode='r')
+        self.arrays = {c: np.load(os.path.join(root, f"{c}.npy"), mmap_mode='r') for c in self.columns}
+
+    # Pickling (e.g. st.cache_data) re-opens the snapshot instead of copying the arrays
+    def __getstate__(self):
+        return {'root': self.root}
+
+    def __setstate__(self, state):
+        self.__init__(state['root'])
+
+    def __getitem__(self, ticker):
+        off, n = self.offsets[ticker]
+        index = pd.DatetimeIndex(np.array(self.dates[off:off + n]), name=self.index_name)
+        return pd.DataFrame({c: np.array(self.arrays[c][off:off + n]) for c in self.columns}, index=index)
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, ticker):
+        return ticker in self.offsets
+
+    def column(self, ticker, column='Close'):
+        """Read-only array view of one column for one ticker (no copy)."""
+        off, n = self.offsets[ticker]
+        return self.arrays[column][off:off + n]
+
+    def latest(self, n=1):
+        """
+        Last n bars of every ticker in one frame, read straight from the mapped columns.
+
+        Returns:
+            DataFrame: MultiIndex (Ticker, Date), one column per stored column
+        """
+        tickers = list(self.offsets)
+        if not tickers:
+            return pd.DataFrame(columns=self.columns)
+        bounds = np.array([self.offsets[t] for t in tickers], dtype=np.int64)
+        take = np.minimum(bounds[:, 1], n)
+        starts = bounds[:, 0] + bounds[:, 1] - take
+        rows = np.concatenate([np.arange(s, s + k) for s, k in zip(starts, take)])
+        index = pd.MultiIndex.from_arrays(
+            [np.repeat(tickers, take), pd.DatetimeIndex(self.dates[rows])],
+            names=['Ticker', self.index_name or 'Date'])
+        return pd.DataFrame({c: self.arrays[c][rows] for c in self.columns}, index=index)
+
+    def to_dict(self):
+        """Materialize every ticker ({ticker: DataFrame}, same as the old pickle)."""
+        return {t: self[t] for t in self.offsets}
+
+
+def open_history(root=HISTORY_DIR):
+    """HistoryStore for the snapshot at root, or None if there is none yet."""
+    if not os.path.exists(os.path.join(root, INDEX_FILE)):
+        return None
+    return HistoryStore(root)
@@ -0,0 +1,419 @@
+"""
+Streaming indicator state for the daily signal scan (data/indicator_state.npz).
+
+get_todays_signals used to rebuild SMA20/50, Bollinger, RSI, RVOL, High50,
+MACD, ATR, the Chandelier Exit and Wilder's ADX from a full year of bars for
+every ticker, every night. The state keeps, per ticker, what is needed to
+advance those indicators by one bar:
+
+- EMA accumulators (MACD 12/26/9, Wilder smoothing of TR / +DM / -DM / DX),
+  advanced with pandas' own ewm(adjust=False) recurrence
+- ring buffers of the last closes / highs (50), volumes (20) and RSI gains /
+  losses / true ranges (14) for the rolling means, std, and window highs
+- the last bar (to detect history rewrites) and the indicator rows of the
+  last TAIL bars, which is all the signal rules look at
+
+update() folds in only the bars after each ticker's last state bar; tickers
+without state (or whose stored last bar no longer matches the history, e.g.
+after a split adjustment) are rebuilt from their full history. All tickers
+advance together, one vectorized step per bar.
+
+The state starts at a ticker's first bar and keeps going, so its EMAs are not
+re-seeded at the start of the trailing year like a recompute is; the
+difference dies out geometrically and verify() (python indicator_state.py
+--verify) measures it against a full recompute.
+
+Usage:
+    state = IndicatorState.load()
+    state.update(history)            # {ticker: OHLCV DataFrame} or HistoryStore
+    state.tail('NVDA')               # indicator rows of the last TAIL bars
+    state.save()
+"""
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import price_panel
+import indicators
+
+STATE_PATH = "data/indicator_state.npz"
+FORMAT_VERSION = 1
+# Indicator rows kept per ticker (the signal rules look back at most 10 bars)
+TAIL = 10
+# Tickers not updated for this many days are dropped (rebuilt if they come back)
+MAX_AGE_DAYS = 30
+
+# Columns of the indicator rows (tail), as get_todays_signals names them
+TAIL_FIELDS = ('Open', 'Close', 'SMA20', 'SMA50', 'BB_Upper', 'RSI', 'AvgVol20', 'RVOL', 'High50',
+               'MACD', 'MACD_Signal', 'MACD_Hist', 'ATR', 'Chandelier_Exit', 'ADX')
+
+# Scalar state per ticker
+SCALARS = ('bars', 'open', 'high', 'low', 'close', 'volume',
+           'ema12', 'ema12_wt', 'ema26', 'ema26_wt', 'signal', 'signal_wt',
+           'tr_smooth', 'tr_smooth_wt', 'plus_dm', 'plus_dm_wt', 'minus_dm', 'minus_dm_wt', 'adx', 'adx_wt')
+
+# Ring buffers: name -> window
+RINGS = {'close': 50, 'high': 50, 'volume': 20, 'gain': 14, 'loss': 14, 'tr': 14}
+
+
+def _ewm_alpha(span=None, alpha=None):
+    """alpha exactly as pandas derives it (via the center of mass)."""
+    com = (span - 1) / 2 if span is not None else (1 - alpha) / alpha
+    return 1. / (1. + com)
+
+
+ALPHA_12 = _ewm_alpha(span=12)
+ALPHA_26 = _ewm_alpha(span=26)
+ALPHA_9 = _ewm_alpha(span=9)
+ALPHA_WILDER = _ewm_alpha(alpha=1 / 14)
+
+
+def _ewm_step(weighted, old_wt, cur, alpha):
+    """
+    One step of ewm(alpha, adjust=False).mean() (the recurrence pandas runs, NaN handling included).
+
+    Returns:
+        (weighted, old_wt)
+    """
+    is_obs = cur == cur
+    started = weighted == weighted
+    old_wt = np.where(started, old_wt * (1. - alpha), old_wt)
+    with np.errstate(invalid='ignore'):
+        mixed = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+    update = started & is_obs
+    weighted = np.where(update & (weighted != cur), mixed, weighted)
+    old_wt = np.where(update, 1., old_wt)
+    weighted = np.where(~started & is_obs, cur, weighted)
+    return weighted, old_wt
+
+
+class IndicatorState:
+    """
+    tickers: list, dates: (N,) datetime64 of each ticker's last folded bar
+    scalars: (N, len(SCALARS)), rings: {name: (N, window)}, tail: (N, TAIL, len(TAIL_FIELDS))
+    """
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self.tickers = []
+        self.index = {}
+        self.dates = np.array([], dtype='datetime64[ns]')
+        self.scalars = np.zeros((0, len(SCALARS)))
+        self.rings = {name: np.zeros((0, w)) for name, w in RINGS.items()}
+        self.tail_rows = np.zeros((0, TAIL, len(TAIL_FIELDS)))
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        """Persisted state, or an empty one (missing / unreadable / other format version)."""
+        state = cls(path)
+        if not os.path.exists(path):
+            return state
+        try:
+            with np.load(path, allow_pickle=False) as z:
+                meta = json.loads(str(z['meta']))
+                if meta.get('version') != FORMAT_VERSION or meta.get('scalars') != list(SCALARS) \
+                        or meta.get('tail_fields') != list(TAIL_FIELDS) or meta.get('rings') != RINGS:
+                    print(f"Indicator state format changed, rebuilding ({path})")
+                    return state
+                state.tickers = z['tickers'].tolist()
+                state.dates = z['dates']
+                state.scalars = z['scalars']
+                state.rings = {name: z[f"ring_{name}"] for name in RINGS}
+                state.tail_rows = z['tail']
+        except Exception as e:
+            print(f"Indicator state unreadable, rebuilding ({path}): {e}")
+            return cls(path)
+        state.index = {t: i for i, t in enumerate(state.tickers)}
+        return state
+
+    def save(self, path=None):
+        path = path or self.path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        meta = {'version': FORMAT_VERSION, 'scalars': list(SCALARS), 'tail_fields': list(TAIL_FIELDS),
+                'rings': RINGS}
+        arrays = {f"ring_{name}": ring for name, ring in self.rings.items()}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), tickers=np.array(self.tickers, dtype=str),
+                     dates=self.dates, scalars=self.scalars, tail=self.tail_rows, **arrays)
+        os.replace(tmp_path, path)
+        return path
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def __contains__(self, ticker):
+        return ticker in self.index
+
+    def _col(self, name):
+        return SCALARS.index(name)
+
+    def bars(self, ticker):
+        """Bars folded into a ticker's state (0 if it has none)."""
+        i = self.index.get(ticker)
+        return 0 if i is None else int(self.scalars[i, self._col('bars')])
+
+    def is_current(self, ticker, date):
+        """True if the ticker's state ends at bar `date`."""
+        i = self.index.get(ticker)
+        return i is not None and self.dates[i] == np.datetime64(pd.Timestamp(date))
+
+    def current(self, tickers, dates):
+        """Vectorized is_current: (N,) bool for tickers and their last bar dates (datetime64)."""
+        idx = np.array([self.index.get(t, -1) for t in tickers], dtype=np.int64)
+        if not len(idx):
+            return np.zeros(0, dtype=bool)
+        return (idx >= 0) & (self.dates[np.maximum(idx, 0)] == np.asarray(dates, dtype=self.dates.dtype))
+
+    def tails(self, tickers):
+        """(N, TAIL, len(TAIL_FIELDS)) indicator rows of many tickers (NaN for tickers without state)."""
+        out = np.full((len(tickers), TAIL, len(TAIL_FIELDS)), np.nan)
+        pos = [(k, self.index[t]) for k, t in enumerate(tickers) if t in self.index]
+        if pos:
+            out[[k for k, _ in pos]] = self.tail_rows[[i for _, i in pos]]
+        return out
+
+    def tail(self, ticker):
+        """
+        Indicator rows of the ticker's last min(TAIL, bars) bars (oldest first).
+
+        Returns:
+            pd.DataFrame: columns=TAIL_FIELDS
+        """
+        i = self.index[ticker]
+        n = min(TAIL, self.bars(ticker))
+        rows = self.tail_rows[i, TAIL - n:]
+        return pd.DataFrame(rows, columns=list(TAIL_FIELDS))
+
+    # --- Folding ---
+
+    def _add_tickers(self, tickers):
+        n = len(tickers)
+        self.tickers += tickers
+        self.index = {t: i for i, t in enumerate(self.tickers)}
+        self.dates = np.concatenate([self.dates, np.full(n, np.datetime64('NaT'), dtype=self.dates.dtype)])
+        self.scalars = np.vstack([self.scalars, self._empty_scalars(n)])
+        self.rings = {name: np.vstack([ring, np.full((n, RINGS[name]), np.nan)]) for name, ring in self.rings.items()}
+        self.tail_rows = np.concatenate([self.tail_rows, np.full((n, TAIL, len(TAIL_FIELDS)), np.nan)])
+
+    def _reset(self, rows):
+        self.scalars[rows] = self._empty_scalars(len(rows))
+        for name in RINGS:
+            self.rings[name][rows] = np.nan
+        self.tail_rows[rows] = np.nan
+        self.dates[rows] = np.datetime64('NaT')
+
+    def _empty_scalars(self, n):
+        out = np.full((n, len(SCALARS)), np.nan)
+        out[:, self._col('bars')] = 0
+        for name in SCALARS:
+            if name.endswith('_wt'):
+                out[:, self._col(name)] = 1.
+        return out
+
+    def update(self, history):
+        """
+        Fold in every bar of `history` newer than each ticker's state.
+
+        Returns:
+            dict: {'tickers', 'updated', 'rebuilt', 'bars', 'pruned'}
+        """
+        panel = price_panel.PricePanel.from_history(history)
+        if not panel.tickers:
+            return {'tickers': 0, 'updated': 0, 'rebuilt': 0, 'bars': 0, 'pruned': 0}
+        lengths = panel.lengths()
+        fields = {f: panel.aligned(f) for f in ('Open', 'High', 'Low', 'Close', 'Volume')}
+        bar_dates = panel.aligned_dates()
+        n, width = bar_dates.shape
+
+        new = [t for t in panel.tickers if t not in self.index]
+        if new:
+            self._add_tickers(new)
+        rows = np.array([self.index[t] for t in panel.tickers], dtype=np.int64)
+
+        # New bars per ticker: everything after the state's last bar, if that bar is unchanged
+        last = self.dates[rows]
+        hit = bar_dates == last[:, None]
+        found = hit.any(axis=1)
+        pos = np.where(found, hit.argmax(axis=1), -1)
+        same = found.copy()
+        for f in ('Open', 'High', 'Low', 'Close', 'Volume'):
+            stored = self.scalars[rows, self._col(f.lower())]
+            at_pos = fields[f][np.arange(n), np.maximum(pos, 0)]
+            same &= (at_pos == stored) | (np.isnan(at_pos) & np.isnan(stored))
+        rebuild = ~same
+        self._reset(rows[rebuild])
+        n_new = np.where(rebuild, lengths, width - 1 - pos)
+
+        steps = int(n_new.max()) if n else 0
+        for col in range(width - steps, width):
+            active = n_new >= width - col
+            if not active.any():
+                continue
+            bar = {f: values[active, col] for f, values in fields.items()}
+            self._step(rows[active], bar)
+            self.dates[rows[active]] = bar_dates[active, col]
+
+        pruned = self.prune(np.max(bar_dates[:, -1]))
+        return {'tickers': n, 'updated': int((~rebuild & (n_new > 0)).sum()), 'rebuilt': int(rebuild.sum()),
+                'bars': int(n_new.sum()), 'pruned': pruned}
+
+    def _step(self, rows, bar):
+        """Advance the given state rows by one bar (dict of (k,) arrays)."""
+        s = self.scalars
+        c = lambda name: self._col(name)
+        bars = s[rows, c('bars')].astype(np.int64)
+        prev_close, prev_high, prev_low = s[rows, c('close')], s[rows, c('high')], s[rows, c('low')]
+        close, high, low, volume = bar['Close'], bar['High'], bar['Low'], bar['Volume']
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # RSI inputs (first bar: no change -> gain 0)
+            delta = close - prev_close
+            gain = np.where(delta > 0, delta, 0)
+            loss = -np.where(delta < 0, delta, 0)
+            # True range (max of the available parts) and directional movement
+            tr = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+            up_move = high - prev_high
+            down_move = prev_low - low
+            plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+            minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+
+            def ewm(name, value, alpha):
+                w, wt = _ewm_step(s[rows, c(name)], s[rows, c(name + '_wt')], value, alpha)
+                s[rows, c(name)], s[rows, c(name + '_wt')] = w, wt
+                return w
+
+            macd = ewm('ema12', close, ALPHA_12) - ewm('ema26', close, ALPHA_26)
+            macd_signal = ewm('signal', macd, ALPHA_9)
+            tr_smooth = ewm('tr_smooth', tr, ALPHA_WILDER)
+            plus_di = 100 * (ewm('plus_dm', plus_dm, ALPHA_WILDER) / tr_smooth)
+            minus_di = 100 * (ewm('minus_dm', minus_dm, ALPHA_WILDER) / tr_smooth)
+            dx = 100 * (np.abs(plus_di - minus_di) / (plus_di + minus_di))
+            adx = ewm('adx', dx, ALPHA_WILDER)
+
+            for name, value in (('close', close), ('high', high), ('volume', volume),
+                                ('gain', gain), ('loss', loss), ('tr', tr)):
+                self.rings[name][rows, bars % RINGS[name]] = value
+            bars = bars + 1
+            s[rows, c('bars')] = bars
+            for f in ('Open', 'High', 'Low', 'Close', 'Volume'):
+                s[rows, c(f.lower())] = bar[f]
+
+            def window(name, size):
+                """Last `size` values of a ring (NaN rows until `size` bars are in)."""
+                ring = self.rings[name]
+                idx = (bars[:, None] - size + np.arange(size)[None, :]) % ring.shape[1]
+                out = ring[rows[:, None], idx]
+                out[bars < size] = np.nan
+                return out
+
+            closes20 = window('close', 20)
+            sma20 = closes20.mean(axis=1)
+            sma50 = window('close', 50).mean(axis=1)
+            bb_upper = sma20 + (closes20.std(axis=1, ddof=1) * 2)
+            rsi = 100 - (100 / (1 + window('gain', 14).mean(axis=1) / window('loss', 14).mean(axis=1)))
+            avg_vol20 = window('volume', 20).mean(axis=1)
+            atr = window('tr', 14).mean(axis=1)
+            chandelier = window('high', 22).max(axis=1) - (atr * 5.0)
+            high50 = window('high', 50).max(axis=1)
+
+            row = {'Open': bar['Open'], 'Close': close, 'SMA20': sma20, 'SMA50': sma50, 'BB_Upper': bb_upper,
+                   'RSI': rsi, 'AvgVol20': avg_vol20, 'RVOL': volume / avg_vol20, 'High50': high50,
+                   'MACD': macd, 'MACD_Signal': macd_signal, 'MACD_Hist': macd - macd_signal, 'ATR': atr,
+                   'Chandelier_Exit': chandelier, 'ADX': adx}
+        self.tail_rows[rows, :-1] = self.tail_rows[rows, 1:]
+        self.tail_rows[rows, -1] = np.column_stack([row[f] for f in TAIL_FIELDS])
+
+    def prune(self, latest, max_age_days=MAX_AGE_DAYS):
+        """Drop tickers whose last bar is more than max_age_days before `latest`."""
+        if not len(self.tickers):
+            return 0
+        keep = ~(self.dates < np.datetime64(latest) - np.timedelta64(max_age_days, 'D'))
+        if keep.all():
+            return 0
+        self.tickers = [t for t, k in zip(self.tickers, keep) if k]
+        self.index = {t: i for i, t in enumerate(self.tickers)}
+        self.dates = self.dates[keep]
+        self.scalars = self.scalars[keep]
+        self.rings = {name: ring[keep] for name, ring in self.rings.items()}
+        self.tail_rows = self.tail_rows[keep]
+        return int((~keep).sum())
+
+    # --- Verification ---
+
+    def verify(self, history, rtol=1e-6, atol=1e-6):
+        """
+        Compare the state's indicator rows with a full recompute (indicators.compute, no memo)
+        on `history`. EMAs differ by their seed when the state started before the history
+        window; that difference is far below the default tolerance after a year of bars.
+
+        Returns:
+            dict: {'tickers', 'mismatched': [ticker, ...], 'max_abs': {field: x}, 'max_rel': {field: x}}
+        """
+        full_values = indicators.compute(history, indicators.SIGNAL_SET)
+        max_abs = {f: 0.0 for f in TAIL_FIELDS}
+        max_rel = {f: 0.0 for f in TAIL_FIELDS}
+        mismatched = []
+        checked = 0
+        for t in history:
+            df = history[t]
+            if t not in self.index or df is None or df.empty:
+                continue
+            last = np.datetime64(df.index[-1])
+            if self.dates[self.index[t]] != last:
+                continue
+            full = full_values[t].iloc[-TAIL:].assign(Open=df['Open'].to_numpy()[-TAIL:],
+                                                      Close=df['Close'].to_numpy()[-TAIL:])
+            mine = self.tail(t).iloc[-len(full):]
+            checked += 1
+            ok = True
+            for f in TAIL_FIELDS:
+                a, b = full[f].to_numpy(dtype=float), mine[f].to_numpy(dtype=float)
+                both = ~np.isnan(a) & ~np.isnan(b)
+                if (np.isnan(a) != np.isnan(b)).any():
+                    ok = False
+                diff = np.abs(a[both] - b[both])
+                if diff.size:
+                    max_abs[f] = max(max_abs[f], float(diff.max()))
+                    rel = diff / np.maximum(np.abs(a[both]), 1e-12)
+                    max_rel[f] = max(max_rel[f], float(rel.max()))
+                    if not np.allclose(b[both], a[both], rtol=rtol, atol=atol):
+                        ok = False
+            if not ok:
+                mismatched.append(t)
+        return {'tickers': checked, 'mismatched': mismatched, 'max_abs': max_abs, 'max_rel': max_rel}
+
+
+def print_report(report):
+    print(f"Indicator state verify: {report['tickers']} tickers, {len(report['mismatched'])} mismatched"
+          + (f" {report['mismatched'][:10]}" if report['mismatched'] else ""))
+    for f in TAIL_FIELDS:
+        print(f"  {f:16s} max abs {report['max_abs'][f]:.3g}  max rel {report['max_rel'][f]:.3g}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or verify the streaming indicator state")
+    parser.add_argument('--verify', action='store_true',
+                        help="compare the state with a full recompute on the published history snapshot")
+    args = parser.parse_args()
+
+    state = IndicatorState.load()
+    print(f"{len(state)} tickers in {state.path}")
+    if args.verify:
+        import snapshot
+        import history_store
+        history = history_store.open_history(snapshot.resolve(snapshot.HISTORY))
+        if history is None:
+            print("No history snapshot to verify against")
+            return
+        report = state.verify(history)
+        print_report(report)
+        if report['mismatched']:
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
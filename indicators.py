@@ -0,0 +1,379 @@
+"""
+Shared technical indicator engine.
+
+Every indicator the ranking, the daily signal scan, the deep dive and the
+tweet generator use is defined once here, on right-aligned (tickers x bars)
+matrices (see PricePanel.aligned), so the same code serves one ticker or the
+whole panel:
+
+- rolling windows run through price_panel.rolling_aligned and EMAs through
+  pandas ewm on the padded matrix, so every value equals the per-ticker
+  pandas computation
+- results are memoized per (ticker, last bar date, bars, last close); the
+  ranking, the signal scan and the deep dive in one process compute each
+  indicator of a ticker once, and asking for more indicators of a memoized
+  ticker only computes the missing ones
+
+Usage:
+    engine = get_engine()
+    df = engine.frame('NVDA', ohlcv_df, DEEP_DIVE_SET)       # ohlcv_df + indicator columns
+    sma50 = engine.aligned(panel, 'SMA50')                   # (N, width) like panel.aligned
+    ind = engine.aligned_many(panel, RANKING_SET)            # {name: (N, width)}, one memo pass
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import price_panel
+
+FIELDS = ('Open', 'High', 'Low', 'Close', 'Volume')
+# Memoized (ticker, last bar) entries kept per process, and the bytes of indicator
+# arrays they may hold (the app's server process keeps the engine for its lifetime)
+MAX_ENTRIES = 4096
+MAX_BYTES = 64 * 1024 * 1024
+
+# Named indicator sets (column order of the frames)
+SIGNAL_SET = ('SMA20', 'SMA50', 'BB_Upper', 'RSI', 'AvgVol20', 'RVOL', 'High50',
+              'MACD', 'MACD_Signal', 'MACD_Hist', 'ATR', 'Chandelier_Exit', 'ADX')
+DEEP_DIVE_SET = ('SMA20', 'SMA50', 'SMA150', 'SMA200', 'BB_Upper', 'BB_Lower', 'BB_Width', 'RSI',
+                 'AvgVol20', 'RVOL', 'High50', 'Low50', 'MACD', 'MACD_Signal', 'MACD_Hist', 'ATR',
+                 'Chandelier_Exit', 'MFI', 'BB_Expanding', 'ADX')
+RANKING_SET = ('SMA20', 'SMA50', 'SMA200', 'BB_Upper', 'BB_Lower', 'BB_Width', 'RSI')
+
+
+def _shift(values):
+    """Previous bar's value (NaN before the first bar), as Series.shift(1) per ticker."""
+    out = np.full_like(values, np.nan, dtype=float)
+    out[:, 1:] = values[:, :-1]
+    return out
+
+
+def _rsi(ctx):
+    delta = ctx['Close'] - _shift(ctx['Close'])
+    gain = ctx.roll(np.where(delta > 0, delta, 0), 14)
+    loss = ctx.roll(-np.where(delta < 0, delta, 0), 14)
+    rs = gain / loss
+    return 100 - (100 / (1 + rs))
+
+
+def _true_range(ctx):
+    prev_close = _shift(ctx['Close'])
+    high_low = ctx['High'] - ctx['Low']
+    high_close = np.abs(ctx['High'] - prev_close)
+    low_close = np.abs(ctx['Low'] - prev_close)
+    # max of the available parts (first bar: High - Low)
+    return np.fmax(np.fmax(high_low, high_close), low_close)
+
+
+def _adx(ctx):
+    # Wilder's smoothing (ewm alpha=1/14) of TR, +DM, -DM and DX
+    up_move = ctx['High'] - _shift(ctx['High'])
+    down_move = _shift(ctx['Low']) - ctx['Low']
+    plus_dm = ctx.bars(np.where((up_move > down_move) & (up_move > 0), up_move, 0.0))
+    minus_dm = ctx.bars(np.where((down_move > up_move) & (down_move > 0), down_move, 0.0))
+    tr_smooth = ctx.ewm(ctx['_TR'], alpha=1 / 14)
+    plus_di = 100 * (ctx.ewm(plus_dm, alpha=1 / 14) / tr_smooth)
+    minus_di = 100 * (ctx.ewm(minus_dm, alpha=1 / 14) / tr_smooth)
+    dx = 100 * (np.abs(plus_di - minus_di) / (plus_di + minus_di))
+    return ctx.ewm(dx, alpha=1 / 14)
+
+
+def _mfi(ctx):
+    typical_price = (ctx['High'] + ctx['Low'] + ctx['Close']) / 3
+    money_flow = typical_price * ctx['Volume']
+    prev_tp = _shift(typical_price)
+    up_flow = np.where(typical_price > prev_tp, money_flow, 0)
+    down_flow = np.where(typical_price < prev_tp, money_flow, 0)
+    mfi_ratio = ctx.roll(up_flow, 14, 'sum') / ctx.roll(down_flow, 14, 'sum')
+    return 100 - (100 / (1 + mfi_ratio))
+
+
+# name -> function(ctx) returning an (N, width) matrix; '_' names are intermediates
+INDICATORS = {
+    'SMA20': lambda ctx: ctx.roll(ctx['Close'], 20),
+    'SMA50': lambda ctx: ctx.roll(ctx['Close'], 50),
+    'SMA150': lambda ctx: ctx.roll(ctx['Close'], 150),
+    'SMA200': lambda ctx: ctx.roll(ctx['Close'], 200),
+    '_STD20': lambda ctx: ctx.roll(ctx['Close'], 20, 'std'),
+    # Bollinger Bands (20, 2)
+    'BB_Upper': lambda ctx: ctx['SMA20'] + (ctx['_STD20'] * 2),
+    'BB_Lower': lambda ctx: ctx['SMA20'] - (ctx['_STD20'] * 2),
+    'BB_Width': lambda ctx: (ctx['BB_Upper'] - ctx['BB_Lower']) / ctx['SMA20'],
+    'BB_Expanding': lambda ctx: ctx['BB_Width'] > _shift(ctx['BB_Width']),
+    'RSI': _rsi,
+    'AvgVol20': lambda ctx: ctx.roll(ctx['Volume'], 20),
+    'RVOL': lambda ctx: ctx['Volume'] / ctx['AvgVol20'],
+    'High50': lambda ctx: ctx.roll(ctx['High'], 50, 'max'),
+    'Low50': lambda ctx: ctx.roll(ctx['Low'], 50, 'min'),
+    # MACD (12, 26, 9)
+    '_EMA12': lambda ctx: ctx.ewm(ctx['Close'], span=12),
+    '_EMA26': lambda ctx: ctx.ewm(ctx['Close'], span=26),
+    'MACD': lambda ctx: ctx['_EMA12'] - ctx['_EMA26'],
+    'MACD_Signal': lambda ctx: ctx.ewm(ctx['MACD'], span=9),
+    'MACD_Hist': lambda ctx: ctx['MACD'] - ctx['MACD_Signal'],
+    # ATR (14) and the Chandelier Exit (long, 22-bar high - 5 ATR)
+    '_TR': _true_range,
+    'ATR': lambda ctx: ctx.roll(ctx['_TR'], 14),
+    'Chandelier_Exit': lambda ctx: ctx.roll(ctx['High'], 22, 'max') - (ctx['ATR'] * 5.0),
+    'MFI': _mfi,
+    'ADX': _adx,
+}
+
+
+class _Context:
+    """Aligned OHLCV matrices of a group of tickers + every indicator computed on them so far."""
+
+    def __init__(self, fields, lengths):
+        self.values = dict(fields)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        width = next(iter(fields.values())).shape[1]
+        self.real = np.arange(width)[None, :] >= (width - self.lengths)[:, None]
+
+    def __getitem__(self, name):
+        if name not in self.values:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.values[name] = INDICATORS[name](self)
+        return self.values[name]
+
+    def roll(self, values, window, how='mean'):
+        return price_panel.rolling_aligned(values, self.lengths, window, how)
+
+    def bars(self, values):
+        """NaN on the padding (inputs of ewm, which would otherwise start on the padding)."""
+        return np.where(self.real, values, np.nan)
+
+    def ewm(self, values, **kwargs):
+        # Leading NaN padding leaves pandas' adjust=False recurrence untouched
+        frame = pd.DataFrame(np.asarray(values, dtype=float).T)
+        return frame.ewm(adjust=False, **kwargs).mean().to_numpy().T
+
+
+def compute(history, names):
+    """
+    Indicators for every ticker of a history, without memoization.
+
+    Args:
+        history: PricePanel, HistoryStore or {ticker: OHLCV DataFrame}
+        names: indicator names (see INDICATORS)
+
+    Returns:
+        dict: {ticker: pd.DataFrame of the ticker's bars with one column per indicator}
+    """
+    panel = price_panel.PricePanel.from_history(history)
+    ctx = _Context({f: panel.aligned(f) for f in FIELDS}, panel.lengths())
+    out = {}
+    for i, t in enumerate(panel.tickers):
+        n = int(ctx.lengths[i])
+        rows = panel.mask[i]
+        out[t] = pd.DataFrame({name: ctx[name][i, -n:] if n else ctx[name][i, :0] for name in names},
+                              index=panel.dates[rows])
+    return out
+
+
+def aligned(panel, names):
+    """
+    Indicators of a PricePanel as (N, width) matrices matching panel.aligned, without
+    memoization (for one-off panels such as stacked as_of windows, which would only
+    evict the live entries from the engine's memo).
+
+    Returns:
+        dict: {name: (N, width) matrix}
+    """
+    ctx = _Context({f: panel.aligned(f) for f in FIELDS}, panel.lengths())
+    return {name: ctx[name] for name in names}
+
+
+class IndicatorEngine:
+    """
+    Memoized indicators. Entries are keyed by (ticker, last bar date, bars, last close),
+    so a ticker is recomputed only when its history gains (or changes) a bar.
+    Only public indicators are kept (intermediates such as _STD20 / _EMA12 / _TR are
+    recomputed when needed), each as its own array, and the least recently used entries
+    are dropped beyond max_entries or max_bytes.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memo = OrderedDict()  # key -> {name: 1-D array over the ticker's bars}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(ticker, last_date, n, last_close):
+        last_date = pd.Timestamp(last_date)
+        if last_date.tzinfo is not None:
+            last_date = last_date.tz_convert(None)  # as the panel's datetime64 values
+        return (ticker, last_date, int(n), float(last_close))
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._memo.get(key)
+            if entry is not None:
+                self._memo.move_to_end(key)
+            return entry
+
+    @staticmethod
+    def _nbytes(values):
+        return sum(v.nbytes for v in values.values())
+
+    def _store(self, key, values):
+        with self._lock:
+            entry = self._memo.setdefault(key, {})
+            self._bytes += self._nbytes(values) - sum(entry[name].nbytes for name in values if name in entry)
+            entry.update(values)
+            self._memo.move_to_end(key)
+            while len(self._memo) > 1 and (len(self._memo) > self.max_entries or self._bytes > self.max_bytes):
+                _, dropped = self._memo.popitem(last=False)
+                self._bytes -= self._nbytes(dropped)
+            return entry
+
+    def _compute_group(self, keys, fields, lengths, names, known=()):
+        """
+        Compute `names` for a group of tickers (aligned matrices) and memoize every result.
+        known: memo entries of the group (None where there is none); indicators all of them
+               already hold are reused instead of recomputed
+        """
+        ctx = _Context(fields, lengths)
+        width = next(iter(fields.values())).shape[1]
+        if known and all(e is not None for e in known):
+            for name in set.intersection(*(set(e) for e in known)):
+                sample = known[0][name]
+                m = np.full((len(keys), width), False if sample.dtype == bool else np.nan, dtype=sample.dtype)
+                for i, e in enumerate(known):
+                    m[i, width - int(ctx.lengths[i]):] = e[name]
+                ctx.values[name] = m
+        computed = set(ctx.values)
+        for name in names:
+            ctx[name]
+        public = [name for name in ctx.values if name not in computed and not name.startswith('_')]
+        entries = []
+        for i, key in enumerate(keys):
+            n = int(ctx.lengths[i])
+            # copies: a view would keep the whole group's matrix alive after eviction
+            values = {name: ctx.values[name][i, width - n:].copy() for name in public}
+            entries.append(self._store(key, values))
+        return entries
+
+    def compute(self, history, names):
+        """
+        Memoized indicators for every ticker of a history (missing ones computed in one pass).
+
+        Returns:
+            dict: {ticker: {name: 1-D array over the ticker's bars}}
+        """
+        panel = price_panel.PricePanel.from_history(history)
+        entries = self._panel_entries(panel, names)
+        return {t: entry for t, entry in zip(panel.tickers, entries) if entry is not None}
+
+    def compute_aligned(self, tickers, fields, lengths, last_dates, names):
+        """
+        compute() on right-aligned OHLCV matrices ({field: (N, width)}, as PricePanel.aligned)
+        with each ticker's bar count and last bar date.
+
+        Returns:
+            dict: {ticker: {name: 1-D array over the ticker's bars}}
+        """
+        entries = self._entries(tickers, fields, lengths, last_dates, names)
+        return {t: entry for t, entry in zip(tickers, entries) if entry is not None}
+
+    def _panel_entries(self, panel, names):
+        fields = {f: panel.aligned(f) for f in FIELDS}
+        return self._entries(panel.tickers, fields, panel.lengths(), panel.aligned_dates()[:, -1], names)
+
+    def _entries(self, tickers, fields, lengths, last_dates, names):
+        """Memo entries in row order (None for rows without bars); a ticker may repeat with other bars."""
+        lengths = np.asarray(lengths, dtype=np.int64)
+        close = fields['Close']
+        out, todo = [None] * len(tickers), []
+        for i, t in enumerate(tickers):
+            if not lengths[i]:
+                continue
+            key = self._key(t, last_dates[i], lengths[i], close[i, -1])
+            entry = self._lookup(key)
+            if entry is not None and all(name in entry for name in names):
+                self.hits += 1
+                out[i] = entry
+            else:
+                self.misses += 1
+                todo.append((i, key, entry))
+        if todo:
+            idx = [i for i, _, _ in todo]
+            entries = self._compute_group([k for _, k, _ in todo], {f: fields[f][idx] for f in FIELDS},
+                                          lengths[idx], names, known=[e for _, _, e in todo])
+            for (i, _, _), entry in zip(todo, entries):
+                out[i] = entry
+        return out
+
+    def aligned(self, panel, name):
+        """(N, width) matrix of one indicator matching panel.aligned (NaN padding)."""
+        return self.aligned_many(panel, [name])[name]
+
+    def aligned_many(self, panel, names):
+        """
+        aligned() for several indicators with one memo pass over the panel (rows by position,
+        so stacked panels with repeated tickers work too).
+
+        Returns:
+            dict: {name: (N, width) matrix}
+        """
+        entries = self._panel_entries(panel, names)
+        lengths = panel.lengths()
+        width = int(lengths.max()) if len(lengths) else 0
+        # Rows without bars have no entry and no cells
+        bars = np.arange(width)[None, :] >= (width - lengths)[:, None]
+        rows = [entry for entry in entries if entry is not None]
+        out = {}
+        for name in names:
+            dtype = bool if name == 'BB_Expanding' else float
+            matrix = np.full((len(panel.tickers), width), False if dtype is bool else np.nan, dtype=dtype)
+            if rows:
+                matrix[bars] = np.concatenate([entry[name] for entry in rows])
+            out[name] = matrix
+        return out
+
+    def frame(self, ticker, df, names):
+        """
+        One ticker's OHLCV DataFrame with the indicator columns added (a copy).
+        """
+        df = df.copy()
+        if df.empty:
+            for name in names:
+                df[name] = np.nan
+            return df
+        key = self._key(ticker, df.index[-1], len(df), df['Close'].iloc[-1])
+        entry = self._lookup(key)
+        if entry is not None and all(name in entry for name in names):
+            self.hits += 1
+        else:
+            self.misses += 1
+            fields = {f: df[f].to_numpy(dtype=float)[None, :] for f in FIELDS}
+            entry = self._compute_group([key], fields, [len(df)], names, known=[entry])[0]
+        for name in names:
+            df[name] = entry[name]
+        return df
+
+    def clear(self):
+        with self._lock:
+            self._memo.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {'entries': len(self._memo), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Process-wide engine (shared by ranking, signals, deep dive and the tweet generator)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = IndicatorEngine()
+        return _engine
@@ -1,17 +1,25 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
-import requests
-from io import StringIO
 import time
 import random
-import concurrent.futures
 import re
 from datetime import datetime
-import json
-import os
 from deep_translator import GoogleTranslator
 
+import data_provider
+import candidate_sources
+import price_store
+import reference_cache
+import reference_store
+import enrichment
+import quarantine
+import price_panel
+import indicator_state
+import indicators
+import parallel
+import signal_engine
+import rank_history
+
 # --- Constants ---
 
 # "Momentum Universe" - High Beta, Liquid, & Thematic Leaders
@@ -855,18 +863,6 @@ def get_momentum_candidates(mode="hybrid"):
     Returns: List of unique ticker strings.
     """
     
-    # 1. Dynamic Sources (Yahoo Finance)
-    sources = [
-        "https://finance.yahoo.com/markets/stocks/gainers/",
-        "https://finance.yahoo.com/markets/stocks/most-active/",
-        "https://finance.yahoo.com/markets/stocks/52-week-gainers/",
-        "https://finance.yahoo.com/markets/stocks/52-week-losers/" # Added for Reversal Hunting
-    ]
-    
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-
     all_candidates = set()
     
     # Add Static List first
@@ -877,331 +873,376 @@ def get_momentum_candidates(mode="hybrid"):
     for t in THEMATIC_ETFS.values():
         all_candidates.add(t)
 
-    # Scrape Dynamic Movers (Parallel)
-    # print("Scraping Dynamic Sources...")
-    
-    def fetch_source(url):
-        try:
-            response = requests.get(url, headers=headers, timeout=5)
-            response.raise_for_status()
-            dfs = pd.read_html(StringIO(response.text))
-            if dfs:
-                return dfs[0]
-        except Exception:
-            # print(f"Source fetch failed {url}: {e}")
-            return None
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor: # Increased workers
-        futures = {executor.submit(fetch_source, url): url for url in sources}
-        for future in concurrent.futures.as_completed(futures):
-            df = future.result()
-            if df is not None:
-                 # Yahoo usually has 'Symbol' and 'Name'
-                if 'Symbol' in df.columns:
-                    # Take top 50 (was 15) to catch early/smaller moves
-                    top_df = df.head(50)
-                    for _, row in top_df.iterrows():
-                        sym = str(row['Symbol']).split()[0]
-                        all_candidates.add(sym)
-
-    return list(all_candidates)
-
-def calculate_momentum_metrics(tickers):
+    # Scrape Dynamic Movers (Yahoo screeners, fetched concurrently over one pooled session;
+    # failed sources fall back to their last good result)
+    sources = candidate_sources.fetch_sources(candidate_sources.MOMENTUM_SOURCES)
+    for symbols in sources.values():
+        # Take top 50 (was 15) to catch early/smaller moves
+        all_candidates.update(symbols[:50])
+
+    # Sorted so that runs (and replay benchmarks) are deterministic
+    return sorted(all_candidates)
+
+# --- Period Returns (vectorized across tickers) ---
+
+# {period: (k, short)}: base = Close.iloc[-k]. If the series has fewer than k bars,
+# short='zero' returns 0.0 and short='first' uses the first close instead.
+STOCK_RETURN_LOOKBACKS = {
+    '1d': (2, 'zero'), '5d': (5, 'zero'), '1mo': (21, 'zero'),
+    '3mo': (63, 'zero'), '6mo': (126, 'zero'), '1y': (252, 'first'),
+}
+# Indices: n business days back (Close.iloc[-n-1])
+INDEX_RETURN_LOOKBACKS = {
+    '1d': (2, 'first'), '5d': (6, 'first'), '1mo': (22, 'first'),
+    '3mo': (64, 'first'), '6mo': (127, 'first'), '1y': (253, 'first'),
+}
+
+# Market context series kept in the price store with every bulk sync
+# (index panel, regime check, daily tweet -> no separate network calls)
+MARKET_REFERENCE_TICKERS = list(MAJOR_INDICES) + ['^VIX', 'SPY']
+
+def compute_period_returns(history, lookbacks, ytd='prev_close', ytd_year=None):
     """
-    Calculates detailed metrics for the given tickers.
-    Optimized for batch processing (offline).
+    Period returns (%) for many tickers at once.
+    Series are right-aligned on their own last bar, so tickers with different
+    calendars (crypto, futures, new listings) can share one matrix.
+
+    Args:
+        history: PricePanel, or {ticker: DataFrame with Open/Close and a DatetimeIndex}
+        lookbacks: {period: (k, short)} (see STOCK_RETURN_LOOKBACKS)
+        ytd: 'prev_close'  = vs last close of the previous year (new listings: first Open of the year)
+             'first_close' = vs first close of the year (falls back to the first close)
+             None = no YTD column
+        ytd_year: calendar year for YTD (default: year of each ticker's last bar)
+
+    Returns:
+        pd.DataFrame: index=ticker, one column per period (+ 'YTD')
     """
-    if not tickers:
-        return None, None
+    columns = list(lookbacks) + (['YTD'] if ytd else [])
+    if isinstance(history, price_panel.PricePanel):
+        panel = history if history.lengths().all() else history.take(np.flatnonzero(history.lengths() > 0))
+        tickers = panel.tickers
+        if not tickers:
+            return pd.DataFrame(columns=columns, dtype=float)
+        n = len(tickers)
+        lengths = panel.lengths()
+        width = int(lengths.max())
+        close = panel.aligned('Close').astype(float)
+        bar_dates = panel.aligned_dates()
+        # padding sorts after any year
+        years = np.where(np.isnat(bar_dates), np.iinfo(np.int32).max,
+                         bar_dates.astype('datetime64[Y]').astype(np.int64) + 1970)
+        first_open = panel.aligned('Open').astype(float)[np.arange(n), width - lengths]
+    else:
+        tickers = [t for t, df in history.items() if df is not None and len(df) > 0]
+        if not tickers:
+            return pd.DataFrame(columns=columns, dtype=float)
+        n = len(tickers)
+        lengths = np.array([len(history[t]) for t in tickers])
+        width = int(lengths.max())
+        close = np.full((n, width), np.nan)
+        years = np.full((n, width), np.iinfo(np.int32).max, dtype=np.int64)  # padding sorts after any year
+        for i, t in enumerate(tickers):
+            df = history[t]
+            close[i, width - lengths[i]:] = df['Close'].to_numpy(dtype=float)
+            years[i, width - lengths[i]:] = df.index.year
+        first_open = np.array([history[t]['Open'].iloc[0] for t in tickers], dtype=float)
+
+    rows = np.arange(n)
+    start = width - lengths
+    last = close[:, -1]
+    first = close[rows, start]
+    out = {}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for pid, (k, short) in lookbacks.items():
+            ok = lengths >= k
+            base = close[:, -k] if k <= width else np.full(n, np.nan)
+            base = np.where(ok, base, first)
+            ret = (last - base) / base * 100
+            if short == 'zero':
+                ret = np.where(ok, ret, 0.0)
+            out[pid] = ret
+
+        if ytd:
+            year = years[:, -1] if ytd_year is None else np.full(n, ytd_year)
+            n_before = (years < year[:, None]).sum(axis=1)
+            if ytd == 'prev_close':
+                # Last close of the previous year; new listings: first Open of this year
+                has_prev = n_before > 0
+                base = close[rows, np.maximum(start + n_before - 1, 0)]
+                base = np.where(has_prev, base, first_open)
+            else:
+                has_year = (years == year[:, None]).any(axis=1)
+                base = close[rows, np.minimum(start + n_before, width - 1)]
+                base = np.where(has_year, base, first)
+            out['YTD'] = (last - base) / base * 100
 
-    # Download 1y data to calculate long-term MA and 1y return
-    # Download 1y data to calculate long-term MA and 1y return
-    # Optimized Chunking to avoid Rate Limits
-    chunk_size = 10 # Extremely conservative batch size
-    dfs = []
-    
-    print(f"Fetching data for {len(tickers)} tickers in chunks of {chunk_size}...")
-    
-    for i in range(0, len(tickers), chunk_size):
-        chunk = tickers[i:i + chunk_size]
-        try:
-            # Variable sleep to mimic human behavior slightly and respect limits
-            time.sleep(5.0) 
-            
-            # Re-enabling threads for speed within small batches, but carefully
-            # Disable threads to avoid 429 errors
-            batch_data = yf.download(chunk, period="1y", group_by='ticker', auto_adjust=True, progress=False, threads=False)
-            
-            if not batch_data.empty:
-                dfs.append(batch_data)
-                
-        except Exception as e:
-            print(f"Batch fetch failed: {e}")
-            continue
+    return pd.DataFrame(out, index=tickers)[columns]
 
-    if not dfs:
-        print("No data fetched.")
-        return None, None
+def sync_prices(tickers, max_age_hours=None):
+    """
+    Sync the persistent OHLCV store (only missing bars are fetched).
+    Index / VIX / benchmark series ride along in the same batched download.
+    max_age_hours: skip tickers synced more recently than this (used when resuming)
 
-    # Combine all batches
-    try:
-        if len(dfs) > 1:
-            # Determine if we need to adjust columns for concatenation
-            # (Usually yf.download(group_by='ticker') returns consistent MultiIndex)
-            df = pd.concat(dfs, axis=1)
-        else:
-            df = dfs[0]
-            
-    except Exception as e:
-        print(f"Data merge error: {e}")
-        return None, None
+    Returns:
+        dict: price store sync stats
+    """
+    store = price_store.get_store()
+    sync_tickers = list(dict.fromkeys(list(tickers) + MARKET_REFERENCE_TICKERS))
+    print(f"Syncing price store for {len(sync_tickers)} tickers...")
+    sync_stats = store.update(sync_tickers, max_age_hours=max_age_hours)
+    print(f"Price store sync: {sync_stats}")
+    return sync_stats
+
+
+# Signal emoji in display order: (column of compute_momentum_table flags, emoji)
+SIGNAL_FLAGS = [
+    ('_vol_spike', '⚡'), ('_bull', '🐂'), ('_dip', '🛒'), ('_bear', '🐻'), ('_hot', '🔥'), ('_cold', '🧊'),
+    ('GC_Just_Now', '✨'), ('DC_Just_Now', '💀'), ('Is_Squeeze', '🤐'), ('_near_high', '🚀'),
+]
 
-    stats_list = []
-    history_dict = {}
+def split_stale(last_bars):
+    """
+    Tickers whose last bar is older than the market's last bar (the most common last bar date).
+    A ticker the sync no longer gets bars for (delisted / quarantined / failed) keeps its stored
+    file; it must not be ranked on that old bar.
 
-    for t in tickers:
-        try:
-            # Handle df structure
-            t_data = pd.DataFrame()
-            if isinstance(df.columns, pd.MultiIndex):
-                if t in df.columns.levels[0]:
-                    t_data = df[t]
-                elif t in df.columns:
-                     t_data = df[t]
-            else:
-                 t_data = df
+    Args:
+        last_bars: {ticker: last bar date}
 
-            if t_data.empty: continue
-            if 'Close' not in t_data.columns: continue
+    Returns:
+        (current tickers, stale tickers)
+    """
+    if not last_bars:
+        return [], []
+    dates = pd.Series(pd.to_datetime(list(last_bars.values())))
+    market_last = dates.mode().max()
+    current = [t for t, d in last_bars.items() if pd.Timestamp(d) >= market_last]
+    stale = [t for t, d in last_bars.items() if pd.Timestamp(d) < market_last]
+    return current, stale
+
+def compute_momentum_table(panel, workers=None, memo=True):
+    """
+    Price-based metrics of calculate_momentum_metrics for every ticker of a panel at once:
+    penny filter, period returns / YTD, RVOL, SMA50/200 + cross flags, Bollinger bands /
+    width / squeeze (+ duration), 52w high/low, max drawdown, RSI and the Signal string.
+    Operates on the right-aligned (tickers x bars) arrays; SMAs / Bollinger / RSI come from the
+    shared indicator engine (indicators.RANKING_SET, memoized per ticker and last bar), so every
+    value equals the per-ticker pandas computation.
+    Rows are independent, so with workers (parallel.py; default MM_WORKERS, serial) the
+    tickers are split into shards over the shared panel arrays and the tables concatenated.
+    memo=False computes the indicators without the engine's memo (one-off panels).
 
-            t_data = t_data.dropna()
-            if t_data.empty: continue
-            
-            # --- 1. Validation Filter (Integrated) ---
-            # Check most recent data point
-            current_price = t_data['Close'].iloc[-1]
-            current_vol = t_data['Volume'].iloc[-1]
-            
-            # For Static List: We skipping filter (Assume they are valid)
-            # Normalize to avoid key errors
-            t_clean = t.upper()
-            if t_clean not in STATIC_MOMENTUM_WATCHLIST:
-                # For Dynamic: Strict Penny Filter
-                if current_price < 2.0 or current_vol < 200000:
-                    continue
-
-            # --- 2. Calculations ---
-            metrics = {}
-            metrics['Ticker'] = t
-            metrics['Price'] = current_price
-            
-            # Returns
-            def get_ret(days):
-                if len(t_data) < days: return 0.0
-                return (current_price - t_data['Close'].iloc[-days]) / t_data['Close'].iloc[-days] * 100
-
-            metrics['1d'] = get_ret(2)
-            metrics['5d'] = get_ret(5)
-            metrics['1mo'] = get_ret(21)
-            metrics['3mo'] = get_ret(63)
-            metrics['6mo'] = get_ret(126)
-            
-            # YTD
-            current_date = t_data.index[-1]
-            current_year = current_date.year
-            
-            # Find last trading day of previous year
-            # Condition: Year < current_year
-            prev_year_data = t_data[t_data.index.year < current_year]
-            
-            if not prev_year_data.empty:
-                # Benchmark is Close of Last Year
-                base_price = prev_year_data['Close'].iloc[-1]
-                metrics['YTD'] = (current_price - base_price) / base_price * 100
-            else:
-                # Fallback for new listings in current year: Use First Day Open
-                ytd_data = t_data[t_data.index.year == current_year]
-                if not ytd_data.empty:
-                    base_price = ytd_data['Open'].iloc[0] # Use Open instead of Close for first day
-                    metrics['YTD'] = (current_price - base_price) / base_price * 100
-                else:
-                    metrics['YTD'] = 0.0
+    Returns:
+        pd.DataFrame: index=ticker (tickers passing the filter, in panel order)
+    """
+    arrays = {'values': panel.values, 'mask': panel.mask}
+    parts = parallel.map_shards(_momentum_shard, arrays, len(panel.tickers), workers=workers,
+                                tickers=panel.tickers, dates=panel.dates, fields=panel.fields,
+                                index_name=panel.index_name, memo=memo)
+    filled = [part for part in parts if not part.empty]
+    if len(filled) <= 1:
+        return filled[0] if filled else parts[0]
+    return pd.concat(filled)
+
+def _momentum_shard(arrays, lo, hi, tickers, dates, fields, index_name, memo=True):
+    """compute_momentum_table on rows [lo, hi) of a panel (a parallel.map_shards shard)."""
+    panel = price_panel.PricePanel(arrays['values'], arrays['mask'], tickers[lo:hi], dates, fields, index_name)
+    return _momentum_table(panel, memo)
+
+def _ranking_filter(panel):
+    """Rows of a panel the ranking keeps (bool per row)."""
+    close = panel.aligned('Close', width=1)[:, 0]
+    volume = panel.aligned('Volume', width=1)[:, 0]
+    # Static List skips the filter; dynamic candidates: strict penny filter on the last bar
+    watchlist = set(STATIC_MOMENTUM_WATCHLIST)
+    static = np.array([t.upper() in watchlist for t in panel.tickers], dtype=bool)
+    return (panel.lengths() > 0) & (static | ~((close < 2.0) | (volume < 200000)))
+
+def _momentum_table(panel, memo=True):
+    eligible = _ranking_filter(panel)
+    if not eligible.all():
+        panel = panel.take(np.flatnonzero(eligible))
+    columns = ['Price'] + list(STOCK_RETURN_LOOKBACKS) + ['YTD', 'RVOL', 'SMA50', 'SMA200', 'Above_SMA50',
+               'GC_Just_Now', 'DC_Just_Now', 'BB_Upper', 'BB_Lower', 'BB_Width', 'Is_Squeeze', 'Squeeze_Days',
+               'High52', 'Low52', 'MaxDD', 'RSI', 'Signal']
+    if not panel.tickers:
+        return pd.DataFrame(columns=columns)
+
+    lengths = panel.lengths()
+    close = panel.aligned('Close')
+    volume = panel.aligned('Volume')
+    n, width = close.shape
+    price = close[:, -1]
+    current_vol = volume[:, -1]
+    if memo:
+        ind = indicators.get_engine().aligned_many(panel, indicators.RANKING_SET).get
+    else:
+        ind = indicators.aligned(panel, indicators.RANKING_SET).get
 
-            if len(t_data) >= 252:
-                metrics['1y'] = get_ret(252)
-            else:
-                # For < 1y data, return from start
-                metrics['1y'] = (current_price - t_data['Close'].iloc[0]) / t_data['Close'].iloc[0] * 100
-            
-            # RVOL
-            if len(t_data) > 21:
-                avg_vol_20 = t_data['Volume'].iloc[-21:-1].mean()
-                rvol = (current_vol / avg_vol_20) if (not pd.isna(avg_vol_20) and avg_vol_20 != 0) else 0
-            else:
-                rvol = 0
-            metrics['RVOL'] = rvol
-            
-            # --- Advanced Technicals ---
-            
-            # 1. Moving Averages & Crosses
-            sma50 = t_data['Close'].rolling(window=50).mean()
-            sma200 = t_data['Close'].rolling(window=200).mean()
-            
-            metrics['SMA50'] = sma50.iloc[-1] if len(t_data) >= 50 else 0
-            metrics['SMA200'] = sma200.iloc[-1] if len(t_data) >= 200 else 0
-            metrics['Above_SMA50'] = metrics['Price'] > metrics['SMA50']
-            
-            # Golden Cross / Death Cross Checks (Last 5 days)
-            metrics['GC_Just_Now'] = False
-            metrics['DC_Just_Now'] = False
-            
-            if len(t_data) >= 200:
-                cross_window = 5
-                # Check for 50MA crossed 200MA in the last few days
-                # Iterate last few days (index -5 to -1)
-                for i in range(2, cross_window + 2):
-                    if (len(sma50) > i) and (len(sma200) > i):
-                        was_above = sma50.iloc[-i] > sma200.iloc[-i]
-                        is_above = sma50.iloc[-i+1] > sma200.iloc[-i+1]
-                        
-                        if not was_above and is_above:
-                            metrics['GC_Just_Now'] = True
-                        if was_above and not is_above:
-                            metrics['DC_Just_Now'] = True
-
-            # 2. Bollinger Bands (20, 2)
-            if len(t_data) >= 20:
-                sma20 = t_data['Close'].rolling(window=20).mean()
-                std20 = t_data['Close'].rolling(window=20).std()
-                bb_upper = sma20 + 2 * std20
-                bb_lower = sma20 - 2 * std20
-                bb_current_upper = bb_upper.iloc[-1]
-                bb_current_lower = bb_lower.iloc[-1]
-                
-                # Check for div by zero
-                if pd.isna(sma20.iloc[-1]) or sma20.iloc[-1] == 0:
-                     bb_width = 1.0
-                else:
-                     bb_width = (bb_current_upper - bb_current_lower) / sma20.iloc[-1]
-                
-                metrics['BB_Upper'] = bb_current_upper
-                metrics['BB_Lower'] = bb_current_lower
-                metrics['BB_Width'] = bb_width
-                
-                # Squeeze: Current width < 0.8 * Average Width(20)
-                bb_width_series = (bb_upper - bb_lower) / sma20
-                avg_width_20 = bb_width_series.rolling(window=20).mean().iloc[-1]
-                
-                # Squeeze condition threshold
-                squeeze_threshold = avg_width_20 * 0.8 if not pd.isna(avg_width_20) else 0.0
-                metrics['Is_Squeeze'] = metrics['BB_Width'] < squeeze_threshold
-                
-                # Calculate Squeeze Duration (How many consecutive days)
-                squeeze_days = 0
-                if metrics['Is_Squeeze']:
-                    squeeze_days = 1
-                    # Look back up to 20 days
-                    recent_widths = bb_width_series.iloc[-20:-1][::-1] # Reverse to check backwards from yesterday
-                    # Check against dynamic threshold (using historical rolling mean would be more accurate but expensive)
-                    # Approximation: Use current threshold
-                    for w in recent_widths:
-                        if w < squeeze_threshold:
-                            squeeze_days += 1
-                        else:
-                            break
-                metrics['Squeeze_Days'] = squeeze_days
+    out = compute_period_returns(panel, STOCK_RETURN_LOOKBACKS)
+    out.insert(0, 'Price', price)
 
-            else:
-                metrics['BB_Upper'] = 999999
-                metrics['BB_Lower'] = 0
-                metrics['BB_Width'] = 1.0
-                metrics['Is_Squeeze'] = False
-                metrics['Squeeze_Days'] = 0
-
-            # 3. 52-Week High/Low
-            metrics['High52'] = t_data['Close'].max()
-            metrics['Low52'] = t_data['Close'].min()
-            
-            # Max Drawdown (1y)
-            # Calculate running max
-            running_max = t_data['Close'].cummax()
-            drawdown = (t_data['Close'] - running_max) / running_max
-            # Max drawdown is the minimum value (e.g., -0.25 for -25%)
-            # We store it as positive percentage (25.0)
-            metrics['MaxDD'] = abs(drawdown.min()) * 100 if not drawdown.empty else 0.0
-
-            # RSI
-            rsi_series = calculate_rsi(t_data['Close'], 14)
-            metrics['RSI'] = rsi_series.iloc[-1] if not rsi_series.empty else 50
-            
-            # Signals
-            signals = []
-            if metrics['RVOL'] > 2.0: signals.append('⚡')
-            if metrics['Above_SMA50'] and metrics['3mo'] > 0: signals.append('🐂')
-            
-            # 🛒 Dip Buy: Uptrend (Above SMA50) but Short-term cool (RSI < 45)
-            if metrics['Above_SMA50'] and metrics['RSI'] < 45: signals.append('🛒')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # RVOL (vs average of the 20 bars before the last one)
+        if width > 21:
+            avg_vol_20 = volume[:, -21:-1].mean(axis=1)
+            rvol = np.where(~np.isnan(avg_vol_20) & (avg_vol_20 != 0), current_vol / avg_vol_20, 0)
+        else:
+            rvol = np.zeros(n)
+        out['RVOL'] = np.where(lengths > 21, rvol, 0)
+
+        # Moving averages & golden / death cross of SMA50 / SMA200 within the last 5 bars
+        sma50 = ind('SMA50')
+        sma200 = ind('SMA200')
+        out['SMA50'] = np.where(lengths >= 50, sma50[:, -1], 0)
+        out['SMA200'] = np.where(lengths >= 200, sma200[:, -1], 0)
+        out['Above_SMA50'] = price > out['SMA50'].to_numpy()
+        if width >= 6:
+            above = sma50[:, -6:] > sma200[:, -6:]
+            was, now = above[:, :-1], above[:, 1:]
+            out['GC_Just_Now'] = (lengths >= 200) & (~was & now).any(axis=1)
+            out['DC_Just_Now'] = (lengths >= 200) & (was & ~now).any(axis=1)
+        else:
+            out['GC_Just_Now'] = False
+            out['DC_Just_Now'] = False
+
+        # Bollinger Bands (20, 2), squeeze = width < 0.8 x its 20-bar average
+        has_bb = lengths >= 20
+        sma20 = ind('SMA20')
+        bb_upper = ind('BB_Upper')
+        bb_lower = ind('BB_Lower')
+        last_sma20 = sma20[:, -1]
+        bb_width = np.where(np.isnan(last_sma20) | (last_sma20 == 0), 1.0,
+                            (bb_upper[:, -1] - bb_lower[:, -1]) / last_sma20)
+        width_series = ind('BB_Width')
+        avg_width_20 = price_panel.rolling_aligned(width_series, lengths, 20)[:, -1]
+        squeeze_threshold = np.where(np.isnan(avg_width_20), 0.0, avg_width_20 * 0.8)
+        is_squeeze = has_bb & (bb_width < squeeze_threshold)
+        # Duration: consecutive bars back from yesterday (up to 19) below the current threshold
+        if width >= 20:
+            recent = width_series[:, -20:-1][:, ::-1] < squeeze_threshold[:, None]
+            run = np.cumprod(recent, axis=1).sum(axis=1)
+        else:
+            run = np.zeros(n, dtype=np.int64)
+        out['BB_Upper'] = np.where(has_bb, bb_upper[:, -1], 999999)
+        out['BB_Lower'] = np.where(has_bb, bb_lower[:, -1], 0)
+        out['BB_Width'] = np.where(has_bb, bb_width, 1.0)
+        out['Is_Squeeze'] = is_squeeze
+        out['Squeeze_Days'] = np.where(is_squeeze, 1 + run, 0)
+
+        # 52-week high / low, max drawdown (%, positive)
+        out['High52'] = np.nanmax(close, axis=1)
+        out['Low52'] = np.nanmin(close, axis=1)
+        running_max = np.fmax.accumulate(close, axis=1)
+        out['MaxDD'] = np.abs(np.nanmin((close - running_max) / running_max, axis=1)) * 100
+
+        # RSI (14, simple averages as calculate_rsi)
+        rsi = ind('RSI')[:, -1]
+        out['RSI'] = rsi
+
+    # Signals
+    ret_3mo = out['3mo'].to_numpy()
+    above = out['Above_SMA50'].to_numpy()
+    flags = {
+        '_vol_spike': out['RVOL'].to_numpy() > 2.0,
+        '_bull': above & (ret_3mo > 0),
+        '_dip': above & (rsi < 45),                      # Uptrend but short-term cool
+        '_bear': ~above & (ret_3mo < 0),                 # Downtrend & negative momentum
+        '_hot': rsi > 70,
+        '_cold': rsi < 30,
+        '_near_high': price >= out['High52'].to_numpy() * 0.98,
+    }
+    signal = np.full(n, '', dtype=object)
+    for col, emoji in SIGNAL_FLAGS:
+        flag = flags[col] if col in flags else out[col].to_numpy()
+        signal = signal + np.where(flag, emoji, '')
+    out['Signal'] = signal
+    return out[columns]
+
+def calculate_momentum_metrics(tickers, sync=True, enrich=True):
+    """
+    Calculates detailed metrics for the given tickers.
+    Optimized for batch processing (offline).
+    sync: sync the price store first (False when the caller already ran sync_prices)
+    enrich: refresh stale fundamentals first (False when the caller already ran the Enricher)
+    """
+    if not tickers:
+        return None, None
 
-            # 🐻 Bear Trend: Downtrend (Below SMA50) & Negative Mom
-            if not metrics['Above_SMA50'] and metrics['3mo'] < 0: signals.append('🐻')
+    if sync:
+        sync_prices(tickers)
+    store = price_store.get_store()
 
-            if metrics['RSI'] > 70: signals.append('🔥')
-            if metrics['RSI'] < 30: signals.append('🧊')
-            
-            # New Signals
-            if metrics['GC_Just_Now']: signals.append('✨')
-            if metrics['DC_Just_Now']: signals.append('💀')
-            if metrics['Is_Squeeze']: signals.append('🤐')
-            # Check price vs High52 for New Highs (approaching high)
-            if metrics['Price'] >= metrics['High52'] * 0.98: signals.append('🚀')
-
-            metrics['Signal'] = "".join(signals)
-            
-            stats_list.append(metrics)
-            
-            # Save full OHLCV history for signal detection (not just normalized close)
-            history_dict[t] = t_data[['Open', 'High', 'Low', 'Close', 'Volume']].copy()
+    history = store.load_many(tickers, period="1y")
+    if not history:
+        print("No data fetched.")
+        return None, None
+    _, stale = split_stale({t: df.index[-1] for t, df in history.items() if not df.empty})
+    if stale:
+        print(f"Skipping {len(stale)} tickers without the latest bar (delisted / not synced): {stale[:10]}")
+    history = {t: df.dropna() for t, df in history.items() if t not in stale}
 
-        except Exception as e:
-            # print(f"Error calc {t}: {e}")
+    stats_list = []
+    history_dict = {}
+    registry = quarantine.get_registry()
+
+    # All price-based metrics in one pass over the panel (compute_momentum_table)
+    ohlcv = ['Open', 'High', 'Low', 'Close', 'Volume']
+    usable = {}
+    for t in dict.fromkeys(tickers):
+        t_data = history.get(t)
+        if t_data is None or t_data.empty or 'Close' not in t_data.columns: continue
+        missing = [c for c in ohlcv if c not in t_data.columns]
+        if missing:
+            # Recorded with the reason (python quarantine.py --endpoint metrics)
+            registry.record_failure(t, 'metrics', KeyError(f"missing columns {missing}"))
             continue
+        usable[t] = t_data
+    table = compute_momentum_table(price_panel.PricePanel.from_history(usable))
+
+    for t, row in zip(table.index, table.to_dict('records')):
+        metrics = {'Ticker': t}
+        metrics.update(row)
+        stats_list.append(metrics)
+        registry.record_success(t, 'metrics')
+        # Save full OHLCV history for signal detection (not just normalized close)
+        history_dict[t] = usable[t][ohlcv].copy()
+    registry.save()
 
     # --- Fetch Fundamentals (ShortRatio + Crash Risk Indicators) for valid tickers ---
     if stats_list:
         valid_tickers = [m['Ticker'] for m in stats_list]
-        
-        def get_fund(tick):
-            """Fetch fundamental data including crash risk indicators."""
-            try:
-                inf = yf.Ticker(tick).info
-                return (
-                    tick, 
-                    inf.get('shortRatio', 0),
-                    inf.get('heldPercentInstitutions', 0),  # Institutional ownership %
-                    inf.get('heldPercentInsiders', 0),       # Insider ownership %
-                    inf.get('floatShares', 0),               # Float shares
-                    inf.get('beta', 1.0),                    # Beta (volatility)
-                    inf.get('forwardPE', 0),                 # Forward P/E ratio
-                    inf.get('marketCap', 0),                 # Market cap for context
-                )
-            except:
-                return (tick, 0, 0, 0, 0, 1.0, 0, 0)
-        
-        # Limit max workers to avoid overload
-        with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
-             results = list(executor.map(get_fund, valid_tickers))
+        price_map = {m['Ticker']: m['Price'] for m in stats_list}
+        provider = data_provider.get_provider()
+        
+        # Fundamentals change slowly: only tickers with an expired field (per-field TTL,
+        # or an earnings report since the last fetch) go back to .info.
+        # In the nightly pipeline the enrich stage has already done this (failed tickers are not retried here).
+        fund_cache = reference_cache.FundamentalsCache()
+        stale = fund_cache.stale_tickers(valid_tickers, reference_cache.load_earnings_dates(fund_cache.store)) if enrich else []
+        print(f"Fundamentals: {len(stale)} to refresh, {len(valid_tickers) - len(stale)} from cache")
+        if stale:
+            # One .info per ticker also refreshes metadata / earnings dates
+            enricher = enrichment.Enricher(provider=provider, fundamentals=fund_cache,
+                                           skip_earnings=set(THEMATIC_ETFS.values()))
+            enricher.run(stale)
+            enricher.save()
         
         # Build fund_map with all indicators
         fund_map = {}
-        for r in results:
-            fund_map[r[0]] = {
-                'ShortRatio': r[1] if r[1] else 0,
-                'InstOwnership': r[2] if r[2] else 0,
-                'InsiderOwnership': r[3] if r[3] else 0,
-                'Float': r[4] if r[4] else 0,
-                'Beta': r[5] if r[5] else 1.0,
-                'ForwardPE': r[6] if r[6] else 0,
-                'MarketCap': r[7] if r[7] else 0,
+        for t in valid_tickers:
+            f = fund_cache.get(t, price=price_map.get(t))
+            fund_map[t] = {
+                'ShortRatio': f.get('shortRatio') or 0,
+                'InstOwnership': f.get('heldPercentInstitutions') or 0,  # Institutional ownership %
+                'InsiderOwnership': f.get('heldPercentInsiders') or 0,   # Insider ownership %
+                'Float': f.get('floatShares') or 0,                      # Float shares
+                'Beta': f.get('beta') or 1.0,                            # Beta (volatility)
+                'ForwardPE': f.get('forwardPE') or 0,                    # Forward P/E ratio
+                'MarketCap': f.get('marketCap') or 0,                    # Market cap for context
             }
         
         for m in stats_list:
@@ -1265,56 +1306,100 @@ def calculate_momentum_metrics(tickers):
     
     return df_metrics, history_dict
 
-def check_opportunity_alerts(df, period='3mo', top_n=10):
+# Row x calendar cells of one stacked batch of momentum_metrics_as_of_many (~40 bytes each)
+AS_OF_BATCH_CELLS = 2000000
+
+def momentum_metrics_as_of(date, tickers=None, workers=None):
+    """
+    Price-based metrics of calculate_momentum_metrics (the compute_momentum_table columns) as
+    they would have been computed on a past date, from the price store: the 1y history of that
+    day is a window of the store's panel (PriceStore.as_of), nothing is fetched or re-read.
+    Fundamentals are only known as of today and are not included.
+    tickers: default every stored ticker except the index / VIX / SPY reference series
+
+    Returns:
+        pd.DataFrame: index=ticker
+    """
+    store = price_store.get_store()
+    return compute_momentum_table(_as_of_panel(store, date, _as_of_tickers(store, tickers)), workers=workers)
+
+def momentum_metrics_as_of_many(dates, tickers=None, workers=None):
+    """
+    momentum_metrics_as_of for many dates. The store panel is read once; the ranked rows of
+    every date's window are stacked (PricePanel.stack) and go through compute_momentum_table
+    together (indicators unmemoized), in batches of up to AS_OF_BATCH_CELLS cells (the stack
+    copies the windows).
+
+    Returns:
+        pd.DataFrame: index=(Date, Ticker)
+    """
+    store = price_store.get_store()
+    tickers = _as_of_tickers(store, tickers)
+    frames, batch, cells = [], [], 0
+    for d in dates:
+        panel = _as_of_panel(store, d, tickers, ranked=True)
+        batch.append((pd.Timestamp(d), panel))
+        cells += panel.mask.size
+        if cells >= AS_OF_BATCH_CELLS:
+            frames.append(_momentum_table_stacked(batch, workers))
+            batch, cells = [], 0
+    if batch:
+        frames.append(_momentum_table_stacked(batch, workers))
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames) if len(frames) > 1 else frames[0]
+
+def _as_of_tickers(store, tickers):
+    if tickers is None:
+        reference = set(MARKET_REFERENCE_TICKERS)
+        tickers = [t for t in store.tickers() if t not in reference]
+    return tickers
+
+def _as_of_panel(store, date, tickers, ranked=False):
+    """Window of a date without stale tickers (ranked: only the rows _ranking_filter keeps)."""
+    panel = store.as_of(date, tickers, period="1y", dropna=True)
+    # Same as the live ranking: tickers without that day's bar are not ranked
+    current, _ = split_stale(dict(zip(panel.tickers, panel.aligned_dates(width=1)[:, 0])))
+    keep = np.isin(panel.tickers, current)
+    if ranked:
+        keep &= _ranking_filter(panel)
+    return panel.take(np.flatnonzero(keep))
+
+def _momentum_table_stacked(batch, workers):
+    """compute_momentum_table of several dates' (already filtered) panels in one pass."""
+    table = compute_momentum_table(price_panel.PricePanel.stack([p for _, p in batch]), workers=workers, memo=False)
+    dates = np.repeat([d for d, _ in batch], [len(p.tickers) for _, p in batch])
+    table.index = pd.MultiIndex.from_arrays([pd.DatetimeIndex(dates), table.index], names=['Date', 'Ticker'])
+    return table
+
+def build_rank_history(history, days=rank_history.DEFAULT_DAYS):
+    """
+    Period returns / top-N ranks / RVOL of the last `days` dates in one pass, with
+    calculate_momentum_metrics' penny filter (static watchlist always passes).
+
+    Returns:
+        rank_history.RankHistory
+    """
+    return rank_history.RankHistory.build(history, STOCK_RETURN_LOOKBACKS,
+                                          static=STATIC_MOMENTUM_WATCHLIST, days=days)
+
+def check_opportunity_alerts(history, period='3mo', top_n=10, days=3, min_rvol=2.0):
     """
     Checks for 'Opportunity Alert':
-    1. Ticker is in Top N for Today, Yesterday, and 2 Days Ago (Persistence).
+    1. Ticker is in Top N for Today, Yesterday, and 2 Days Ago (Persistence, `days` dates).
     2. Volume Spike: Current Volume > 2.0 * 20-day Average (RVOL > 2.0).
+
+    history: RankHistory (build_rank_history; the app keeps one per snapshot), or a
+             PricePanel / {ticker: DataFrame} to build it from
     """
     try:
-        # T0 (Today)
-        metrics_t0, _ = calculate_momentum_metrics(df)
-        if metrics_t0.empty: return []
-        top_t0 = metrics_t0.sort_values(period, ascending=False).head(top_n)['Ticker'].tolist()
-        
-        # T-1 (Yesterday)
-        # Check sufficient length
-        if len(df) <= 1: return [] # Cannot slice
-        
-        # Slice MultiIndex df: we need to slice on the index (Date) level
-        # df.iloc[:-1] works for MultiIndex columns if the index is Date
-        df_t1 = df.iloc[:-1]
-        metrics_t1, _ = calculate_momentum_metrics(df_t1)
-        if metrics_t1.empty: return []
-        top_t1 = metrics_t1.sort_values(period, ascending=False).head(top_n)['Ticker'].tolist()
-        
-        # T-2 (2 Days Ago)
-        if len(df) <= 2: return []
-        df_t2 = df.iloc[:-2]
-        metrics_t2, _ = calculate_momentum_metrics(df_t2)
-        if metrics_t2.empty: return []
-        top_t2 = metrics_t2.sort_values(period, ascending=False).head(top_n)['Ticker'].tolist()
-        
-        # Intersection
-        persistent_tickers = set(top_t0) & set(top_t1) & set(top_t2)
-        
-        alerts = []
-        for t in persistent_tickers:
-            row = metrics_t0[metrics_t0['Ticker'] == t].iloc[0]
-            rvol = row.get('RVOL', 0)
-            
-            # If RVOL wasn't calculated for some reason, try manual check or skip
-            if rvol >= 2.0:
-                alerts.append({
-                    'Ticker': t,
-                    'Gain': row.get(period, 0),
-                    'RVOL': rvol
-                })
-                
-        return alerts
+        ranks = history if isinstance(history, rank_history.RankHistory) else build_rank_history(history, days=days)
+        # persistent() returns nothing when there are fewer than `days` dates
+        hits = ranks.persistent(period, top_n=top_n, days=days, min_rvol=min_rvol)
+        return [{'Ticker': t, 'Gain': row['Gain'], 'RVOL': row['RVOL']} for t, row in hits.iterrows()]
 
     except Exception as e:
-        # print(f"Alert Check Failed: {e}")
+        print(f"Alert Check Failed: {e}")
         return []
 
 # --- AI Stock Recommendation Scoring ---
@@ -2006,10 +2091,11 @@ def calculate_market_regime(df_metrics):
     Returns: (regime_key, display_label, color_code)
     """
     try:
-        # 1. Fetch VIX
-        vix_ticker = yf.Ticker("^VIX")
-        # Get latest price efficiently
-        vix_hist = vix_ticker.history(period="5d")
+        # 1. VIX (synced into the price store with the nightly bulk download)
+        store = price_store.get_store()
+        vix_hist = store.load("^VIX", period="5d")
+        if vix_hist.empty:
+            vix_hist = data_provider.get_provider().history("^VIX", period="5d")
         if not vix_hist.empty:
             vix = vix_hist['Close'].iloc[-1]
         else:
@@ -2023,7 +2109,9 @@ def calculate_market_regime(df_metrics):
             spy_sma200 = spy_row.iloc[0]['SMA200']
         else:
             # Fallback if SPY not in metrics
-            s = yf.Ticker("SPY").history(period="1y")
+            s = store.load("SPY", period="1y")
+            if s.empty:
+                s = data_provider.get_provider().history("SPY", period="1y")
             spy_price = s['Close'].iloc[-1]
             spy_sma50 = s['Close'].rolling(50).mean().iloc[-1]
             spy_sma200 = s['Close'].rolling(200).mean().iloc[-1]
@@ -2243,10 +2331,111 @@ def get_ai_stock_picks(df_metrics, etf_metrics=None, news_checker=None, top_n=3,
     
     return results
 
-def get_todays_signals(history_dict):
+# Signal lists of get_todays_signals by detected signal type
+SIGNAL_LISTS = {'Breakout': 'Buy_Breakout', 'Reversal': 'Buy_Reversal', 'Reentry': 'Buy_Reentry',
+                'Sell_Stop': 'Sell', 'Sell_Profit': 'Sell'}
+# Minimum bars for a ticker to be scanned
+SIGNAL_MIN_BARS = 55
+
+def _signal_entry(ticker, row, prev, reason):
+    """
+    get_todays_signals entry (BullScore etc.) of a ticker with a signal on its latest bar
+    (row / prev: indicator values of the latest and the previous bar).
+
+    Returns:
+        dict
+    """
+    # === Calculate Bull Trend Probability Score (for Reversals) ===
+    daily_change = (row['Close'] - prev['Close']) / prev['Close'] * 100 if prev['Close'] > 0 else 0
+    sma50_distance = (row['SMA50'] - row['Close']) / row['SMA50'] * 100 if row['SMA50'] > 0 else 0  # % below SMA50
+    hist_improvement = row['MACD_Hist'] - prev['MACD_Hist'] if not pd.isna(prev['MACD_Hist']) else 0
+    
+    # RSI score: 30-50 is ideal (oversold but recovering)
+    rsi_score = 0
+    if 30 <= row['RSI'] <= 50:
+        rsi_score = 1.0  # Perfect zone
+    elif 20 <= row['RSI'] < 30:
+        rsi_score = 0.7  # Very oversold
+    elif 50 < row['RSI'] <= 55:
+        rsi_score = 0.5  # Slightly high but ok
+    else:
+        rsi_score = 0.3
+    
+    # Composite Score for Bull Trend Probability
+    # Higher = more likely to transition to bull trend
+    bull_score = (
+        daily_change * 3.0 +          # 30% weight - momentum
+        min(row['RVOL'], 5) * 5.0 +   # 25% weight - volume confirmation (cap at 5x)
+        max(0, 15 - sma50_distance) * 1.67 +  # 25% weight - closer to SMA50 = better
+        rsi_score * 10 +              # 10% weight - RSI position
+        hist_improvement * 100        # 10% weight - MACD hist improvement
+    )
+    
+    # === Add to signals ===
+    entry = {
+        'Ticker': ticker,
+        'Price': row['Close'],
+        'RVOL': row['RVOL'],
+        'RSI': row['RSI'],
+        'Reason': reason,
+        'DailyPct': daily_change,
+        'BullScore': bull_score,
+        'SMA50Dist': sma50_distance,
+        'ADX': row['ADX'],
+        'High50': row['High50'],
+        'MACD': row['MACD'],
+        'MACD_Signal': row['MACD_Signal'],
+        'Chandelier_Exit': row['Chandelier_Exit']
+    }
+    
+    return entry
+
+def _scan_shard(arrays, lo, hi, tickers):
+    """
+    Signal detection for rows [lo, hi) of get_todays_signals' arrays (a parallel.map_shards shard):
+    indicator rows from the state where 'current', else computed by the indicator engine, then
+    the last bar of signal_engine.scan over them.
+
+    Returns:
+        tuple: ([(signal_type, entry)] in row order, [(ticker, error)] of skipped tickers)
+    """
+    tickers = tickers[lo:hi]
+    tail = indicator_state.TAIL
+    names = list(indicator_state.TAIL_FIELDS)
+    ind = {name: arrays['tail'][:, :, k].copy() for k, name in enumerate(names)}
+    rows = np.flatnonzero(~arrays['current'])
+    if len(rows):
+        computed = indicators.get_engine().compute_aligned(
+            [tickers[i] for i in rows], {f: arrays[f][rows] for f in indicators.FIELDS},
+            arrays['lengths'][rows], arrays['last_date'][rows], indicators.SIGNAL_SET)
+        for i in rows:
+            values = computed.get(tickers[i])
+            for name in names:
+                if name in ('Open', 'Close'):
+                    ind[name][i] = arrays[name][i, -tail:]
+                elif values is not None:
+                    ind[name][i] = values[name][-tail:]
+
+    types, reasons = signal_engine.scan(ind)
+    found, skipped = [], []
+    for i in np.flatnonzero(types[:, -1]):
+        try:
+            row = {name: ind[name][i, -1] for name in names}
+            prev = {name: ind[name][i, -2] for name in names}
+            reason = signal_engine.scan_reason(reasons[i, -1], row['RSI'])
+            found.append((signal_engine.SCAN_TYPES[types[i, -1]], _signal_entry(tickers[i], row, prev, reason)))
+        except Exception as e:
+            skipped.append((tickers[i], f"{type(e).__name__}: {e}"))
+    return found, skipped
+
+def get_todays_signals(history_dict, state=None, workers=None):
     """
     Scan all cached history to find signals on the LATEST day only.
     OPTIMIZED: No full history loop - only check latest day conditions.
+    state: IndicatorState already updated with this history -> its indicator rows are used
+           instead of recomputing the indicators (tickers it is not current for go through
+           the shared indicator engine)
+    workers: process pool size for the scan (parallel.py; default MM_WORKERS, serial)
     
     Performance: ~10x faster than full history scan.
     """
@@ -2259,217 +2448,35 @@ def get_todays_signals(history_dict):
     
     if not history_dict:
         return signals
-        
+
+    scan = {}
     for ticker, df_raw in history_dict.items():
-        if df_raw is None or df_raw.empty or len(df_raw) < 55:
+        if df_raw is None or df_raw.empty or len(df_raw) < SIGNAL_MIN_BARS:
             continue
-            
-        try:
-            df = df_raw.copy()
-            
-            # === Fast Indicator Calculation (Vectorized) ===
-            df['SMA20'] = df['Close'].rolling(20).mean()
-            df['SMA50'] = df['Close'].rolling(50).mean()
-            
-            std20 = df['Close'].rolling(20).std()
-            df['BB_Upper'] = df['SMA20'] + (std20 * 2)
-            
-            delta = df['Close'].diff()
-            gain = (delta.where(delta > 0, 0)).rolling(14).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-            rs = gain / loss
-            df['RSI'] = 100 - (100 / (1 + rs))
-            
-            df['AvgVol20'] = df['Volume'].rolling(20).mean()
-            df['RVOL'] = df['Volume'] / df['AvgVol20']
-            df['High50'] = df['High'].rolling(50).max()
-            
-            ema12 = df['Close'].ewm(span=12, adjust=False).mean()
-            ema26 = df['Close'].ewm(span=26, adjust=False).mean()
-            df['MACD'] = ema12 - ema26
-            df['MACD_Signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
-            df['MACD_Hist'] = df['MACD'] - df['MACD_Signal']
-            
-            high_low = df['High'] - df['Low']
-            high_close = (df['High'] - df['Close'].shift(1)).abs()
-            low_close = (df['Low'] - df['Close'].shift(1)).abs()
-            tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-            df['ATR'] = tr.rolling(14).mean()
-            df['Chandelier_Exit'] = df['High'].rolling(22).max() - (df['ATR'] * 5.0)
-            
-            up_move = df['High'] - df['High'].shift(1)
-            down_move = df['Low'].shift(1) - df['Low']
-            plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
-            minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
-            tr_smooth = pd.Series(tr, index=df.index).ewm(alpha=1/14, adjust=False).mean()
-            plus_di = 100 * (pd.Series(plus_dm, index=df.index).ewm(alpha=1/14, adjust=False).mean() / tr_smooth)
-            minus_di = 100 * (pd.Series(minus_dm, index=df.index).ewm(alpha=1/14, adjust=False).mean() / tr_smooth)
-            dx = 100 * (abs(plus_di - minus_di) / (plus_di + minus_di))
-            df['ADX'] = dx.ewm(alpha=1/14, adjust=False).mean()
-            
-            # === LATEST DAY ONLY - Fast Check ===
-            row = df.iloc[-1]
-            prev = df.iloc[-2]
-            prev2 = df.iloc[-3] if len(df) > 2 else prev
-            
-            # --- Detect signal type on latest day ---
-            signal_type = None
-            reason = ''
-            
-            # BUY BREAKOUT
-            cond_trend = (row['Close'] > row['SMA50']) or (row['Close'] > row['SMA20'])
-            cond_bb_break = (row['Close'] > row['BB_Upper'])
-            cond_near_high = (row['Close'] >= row['High50'] * 0.98)
-            cond_breakout = cond_bb_break or cond_near_high
-            cond_vol = (row['RVOL'] > 1.1)
-            cond_macd = (row['MACD'] > row['MACD_Signal']) or (row['MACD'] > 0)
-            cond_safe_rsi = (row['RSI'] < 80)
-            
-            if cond_trend and cond_breakout and cond_vol and cond_macd and cond_safe_rsi:
-                signal_type = 'Breakout'
-                reason = 'BB Break' if cond_bb_break else '50日高値圏'
-            
-            # BUY REVERSAL (Only for downtrend)
-            if signal_type is None:
-                cond_downtrend = (row['Close'] < row['SMA50'])
-                cond_rsi_low = (row['RSI'] < 55)
-                cross_today = (row['MACD'] > row['MACD_Signal']) and (prev['MACD'] <= prev['MACD_Signal'])
-                cross_yest = (prev['MACD'] > prev['MACD_Signal']) and (prev2['MACD'] <= prev2['MACD_Signal'])
-                cond_macd_cross = cross_today or cross_yest
-                cond_hist_up = (row['MACD_Hist'] > prev['MACD_Hist']) and (prev['MACD_Hist'] > prev2['MACD_Hist'])
-                cond_early = cond_rsi_low and cond_hist_up and (row['MACD_Hist'] < 0)
-                cond_big = (row['Close'] > row['Open'] * 1.03) and (row['RVOL'] > 1.2)
-                
-                if cond_downtrend and cond_rsi_low and cond_macd_cross:
-                    signal_type = 'Reversal'
-                    reason = 'MACD GC'
-                elif cond_downtrend and cond_early and (row['RVOL'] > 1.0):
-                    signal_type = 'Reversal'
-                    reason = 'Early Turn (Hist↑)'
-                elif cond_downtrend and cond_big:
-                    signal_type = 'Reversal'
-                    reason = 'Big Bounce'
-            
-            # BUY REENTRY
-            if signal_type is None:
-                cond_trend_up = (row['ADX'] > 15) and (row['Close'] > row['SMA50'])
-                cond_pullback = (40 < row['RSI'] < 60)
-                cross_today = (row['MACD'] > row['MACD_Signal']) and (prev['MACD'] <= prev['MACD_Signal'])
-                cond_hist_up = (row['MACD_Hist'] > prev['MACD_Hist']) and (prev['MACD_Hist'] > prev2['MACD_Hist'])
-                
-                if cond_trend_up and cond_pullback and (cross_today or cond_hist_up):
-                    signal_type = 'Reentry'
-                    reason = 'Dip Buy (押し目)'
-            
-            # SELL
-            if signal_type is None:
-                chandelier_break = (row['Close'] < row['Chandelier_Exit']) and (prev['Close'] >= prev['Chandelier_Exit'])
-                rsi_climax = (row['RSI'] > 90) and (prev['RSI'] <= 90)
-                rsi_was_high = df['RSI'].iloc[-10:].max() > 70 if len(df) >= 10 else False
-                macd_dead = (row['MACD'] < row['MACD_Signal']) and (prev['MACD'] >= prev['MACD_Signal'])
-                profit_take = macd_dead and (row['RSI'] < 60) and rsi_was_high
-                
-                if chandelier_break:
-                    signal_type = 'Sell_Stop'
-                    reason = 'Stop Loss (Chandelier)'
-                elif rsi_climax:
-                    signal_type = 'Sell_Profit'
-                    reason = f"RSI Climax ({row['RSI']:.0f})"
-                elif profit_take:
-                    signal_type = 'Sell_Profit'
-                    reason = 'Profit Take (MACD DC)'
-            
-            # === Skip if no signal on latest day ===
-            if signal_type is None:
-                continue
-            
-            # === Quick Cooldown Check (last 5 days only) ===
-            # Check if same signal type was triggered recently
-            recent = df.iloc[-6:-1]  # Last 5 days (excluding today)
-            
-            if signal_type in ['Breakout', 'Reversal', 'Reentry']:
-                # Check if any BUY signal was already triggered in last 5 days
-                has_recent_buy = False
-                for i in range(-5, -1):
-                    if len(df) + i < 0:
-                        continue
-                    r = df.iloc[i]
-                    p = df.iloc[i-1] if len(df) + i - 1 >= 0 else r
-                    
-                    # Quick buy check
-                    trend_ok = (r['Close'] > r['SMA50']) or (r['Close'] > r['SMA20'])
-                    bb_ok = (r['Close'] > r['BB_Upper']) or (r['Close'] >= r['High50'] * 0.98)
-                    vol_ok = (r['RVOL'] > 1.1)
-                    macd_ok = (r['MACD'] > r['MACD_Signal']) or (r['MACD'] > 0)
-                    rsi_ok = (r['RSI'] < 80)
-                    if trend_ok and bb_ok and vol_ok and macd_ok and rsi_ok:
-                        has_recent_buy = True
-                        break
-                    
-                    # Reversal check
-                    down_ok = (r['Close'] < r['SMA50'])
-                    cross_ok = (r['MACD'] > r['MACD_Signal']) and (p['MACD'] <= p['MACD_Signal'])
-                    if down_ok and (r['RSI'] < 55) and cross_ok:
-                        has_recent_buy = True
-                        break
-                
-                if has_recent_buy:
-                    continue  # Skip - cooldown active
-            
-            # === Calculate Bull Trend Probability Score (for Reversals) ===
-            daily_change = (row['Close'] - prev['Close']) / prev['Close'] * 100 if prev['Close'] > 0 else 0
-            sma50_distance = (row['SMA50'] - row['Close']) / row['SMA50'] * 100 if row['SMA50'] > 0 else 0  # % below SMA50
-            hist_improvement = row['MACD_Hist'] - prev['MACD_Hist'] if not pd.isna(prev['MACD_Hist']) else 0
-            
-            # RSI score: 30-50 is ideal (oversold but recovering)
-            rsi_score = 0
-            if 30 <= row['RSI'] <= 50:
-                rsi_score = 1.0  # Perfect zone
-            elif 20 <= row['RSI'] < 30:
-                rsi_score = 0.7  # Very oversold
-            elif 50 < row['RSI'] <= 55:
-                rsi_score = 0.5  # Slightly high but ok
-            else:
-                rsi_score = 0.3
-            
-            # Composite Score for Bull Trend Probability
-            # Higher = more likely to transition to bull trend
-            bull_score = (
-                daily_change * 3.0 +          # 30% weight - momentum
-                min(row['RVOL'], 5) * 5.0 +   # 25% weight - volume confirmation (cap at 5x)
-                max(0, 15 - sma50_distance) * 1.67 +  # 25% weight - closer to SMA50 = better
-                rsi_score * 10 +              # 10% weight - RSI position
-                hist_improvement * 100        # 10% weight - MACD hist improvement
-            )
-            
-            # === Add to signals ===
-            entry = {
-                'Ticker': ticker,
-                'Price': row['Close'],
-                'RVOL': row['RVOL'],
-                'RSI': row['RSI'],
-                'Reason': reason,
-                'DailyPct': daily_change,
-                'BullScore': bull_score,
-                'SMA50Dist': sma50_distance,
-                'ADX': row['ADX'],
-                'High50': row['High50'],
-                'MACD': row['MACD'],
-                'MACD_Signal': row['MACD_Signal'],
-                'Chandelier_Exit': row['Chandelier_Exit']
-            }
-            
-            if signal_type == 'Breakout':
-                signals['Buy_Breakout'].append(entry)
-            elif signal_type == 'Reversal':
-                signals['Buy_Reversal'].append(entry)
-            elif signal_type == 'Reentry':
-                signals['Buy_Reentry'].append(entry)
-            elif signal_type.startswith('Sell'):
-                signals['Sell'].append(entry)
+        scan[ticker] = df_raw
+    if not scan:
+        return signals
 
-        except Exception as e:
-            continue
+    # One set of ticker-row arrays for all shards (shared memory when running on a pool)
+    panel = price_panel.PricePanel.from_history(scan)
+    tickers = panel.tickers
+    arrays = {f: panel.aligned(f) for f in indicators.FIELDS}
+    arrays['lengths'] = panel.lengths()
+    arrays['last_date'] = panel.aligned_dates()[:, -1]
+    if state is not None:
+        arrays['current'] = state.current(tickers, arrays['last_date'])
+        arrays['tail'] = state.tails(tickers)
+    else:
+        arrays['current'] = np.zeros(len(tickers), dtype=bool)
+        arrays['tail'] = np.full((len(tickers), indicator_state.TAIL, len(indicator_state.TAIL_FIELDS)), np.nan)
+
+    skipped = []
+    for found, failed in parallel.map_shards(_scan_shard, arrays, len(tickers), workers=workers, tickers=tickers):
+        for signal_type, entry in found:
+            signals[SIGNAL_LISTS[signal_type]].append(entry)
+        skipped.extend(failed)
+    if skipped:
+        print(f"Signal scan skipped {len(skipped)} tickers: {skipped[:5]}")
     
     # === Sort by BullScore (descending) ===
     for key in ['Buy_Breakout', 'Buy_Reversal', 'Buy_Reentry']:
@@ -2479,6 +2486,9 @@ def get_todays_signals(history_dict):
 
 # === Momentum Analyzer Logic (New) ===
 
+# Deep dive reuses store data synced within this window (nightly update covers it)
+DEEP_DIVE_MAX_AGE_HOURS = 12
+
 def analyze_stock_history(ticker, period="1y"):
     """
     Fetch history and calculate detailed signals for a specific ticker.
@@ -2492,21 +2502,24 @@ def analyze_stock_history(ticker, period="1y"):
         tuple: (DataFrame with signals, dict summary_status)
     """
     try:
-        # Fetch history with retry logic
-        max_retries = 3
+        # Read from the persistent price store first (only missing bars are fetched)
         df = pd.DataFrame()
+        if period in price_store.PERIOD_OFFSETS:
+            try:
+                store = price_store.get_store()
+                store.update([ticker], max_age_hours=DEEP_DIVE_MAX_AGE_HOURS)
+                df = store.load(ticker, period)
+            except Exception:
+                df = pd.DataFrame()
+
+        # Fetch history with retry logic (store miss / unsupported period)
+        max_retries = 3 if df.empty else 0
+        provider = data_provider.get_provider()
         
         for attempt in range(max_retries):
             try:
-                # Method 1: Ticker.history (Standard)
-                ticker_obj = yf.Ticker(ticker)
-                df = ticker_obj.history(period=period)
-                
-                if df.empty:
-                    # Method 2: yf.download (Fallback)
-                    # sometimes download works when history doesn't
-                    time.sleep(1)
-                    df = yf.download(ticker, period=period, progress=False)
+                # Ticker.history, falling back to download inside the provider
+                df = provider.history(ticker, period=period)
                 
                 if not df.empty:
                     break
@@ -2535,310 +2548,17 @@ def analyze_stock_history(ticker, period="1y"):
              df = df.T.groupby(level=0).first().T
 
         
-        # Calculate Indicators
-        # SMA
-        df['SMA20'] = df['Close'].rolling(window=20).mean()
-        df['SMA50'] = df['Close'].rolling(window=50).mean()
-        df['SMA150'] = df['Close'].rolling(window=150).mean()
-        df['SMA200'] = df['Close'].rolling(window=200).mean()
-        
-        # Bollinger Bands (20, 2)
-        sma20 = df['SMA20']
-        std20 = df['Close'].rolling(window=20).std()
-        df['BB_Upper'] = sma20 + (std20 * 2)
-        df['BB_Lower'] = sma20 - (std20 * 2)
-        # Handle division by zero or NaN
-        df['BB_Width'] = (df['BB_Upper'] - df['BB_Lower']) / sma20
-        
-        # RSI (14)
-        delta = df['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        df['RSI'] = 100 - (100 / (1 + rs))
-        
-        # RVOL (20-day average volume)
-        df['AvgVol20'] = df['Volume'].rolling(window=20).mean()
-        df['RVOL'] = df['Volume'] / df['AvgVol20']
-        
-        # 50-day High/Low
-        df['High50'] = df['High'].rolling(window=50).max()
-        df['Low50'] = df['Low'].rolling(window=50).min()
-
-        # === Advanced Indicators (v2) ===
-        # 1. MACD (12, 26, 9)
-        ema12 = df['Close'].ewm(span=12, adjust=False).mean()
-        ema26 = df['Close'].ewm(span=26, adjust=False).mean()
-        df['MACD'] = ema12 - ema26
-        df['MACD_Signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
-        df['MACD_Hist'] = df['MACD'] - df['MACD_Signal']
-        
-        # 2. ATR (14) - For Volatility & Stop Loss
-        high_low = df['High'] - df['Low']
-        high_close = (df['High'] - df['Close'].shift(1)).abs()
-        low_close = (df['Low'] - df['Close'].shift(1)).abs()
-        tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-        df['ATR'] = tr.rolling(window=14).mean()
-        
-        # 3. Chandelier Exit (Long) - Stop Loss Line (Widened for Momentum Swing)
-        # Standard is 3.0, but user reported "Stop Loss Poor" in chop.
-        # Widen to 5.0 to allow for volatility in momentum stocks.
-        rolling_high_22 = df['High'].rolling(window=22).max()
-        df['Chandelier_Exit'] = rolling_high_22 - (df['ATR'] * 5.0)
-        
-        # 4. MFI (14) - Money Flow Index
-        typical_price = (df['High'] + df['Low'] + df['Close']) / 3
-        money_flow = typical_price * df['Volume']
-        
-        # Positive/Negative Flow using comparison with previous typical price, not diff of itself for vectorized
-        up_flow = money_flow.where(typical_price > typical_price.shift(1), 0)
-        down_flow = money_flow.where(typical_price < typical_price.shift(1), 0)
-        
-        mfi_period = 14
-        up_sum = up_flow.rolling(window=mfi_period).sum()
-        down_sum = down_flow.rolling(window=mfi_period).sum()
-        
-        mfi_ratio = up_sum / down_sum
-        df['MFI'] = 100 - (100 / (1 + mfi_ratio))
-        
-        # 5. BB Expansion (Squeeze Release)
-        df['BB_Expanding'] = df['BB_Width'] > df['BB_Width'].shift(1)
-
-        # 6. ADX (Average Directional Index) - Trend Strength Filter
-        # Measures if trend is strong (ADX > 25) or ranging (ADX < 20).
-        # Calculation:
-        # +DM = High - PrevHigh (if > 0 and > |Low - PrevLow|)
-        # -DM = PrevLow - Low (if > 0 and > |High - PrevHigh|)
-        # TR is already calc'd.
-        
-        up_move = df['High'] - df['High'].shift(1)
-        down_move = df['Low'].shift(1) - df['Low']
-        
-        plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
-        minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
-        
-        # Smooth TR, +DM, -DM (EMA-like smoothing usually, or Rolling sum for simplified ADX)
-        # Standard ADX uses Wilder's Smoothing. Let's use EWM with span=14 (approx).
-        # Or simple rolling for robustness in pandas (Wilder's is slightly different).
-        # Let's use EWM com=13 (span=27 roughly matches Wilder's 1/14).
-        
-        tr_smooth = pd.Series(tr).ewm(alpha=1/14, adjust=False).mean()
-        plus_di = 100 * (pd.Series(plus_dm).ewm(alpha=1/14, adjust=False).mean() / tr_smooth)
-        minus_di = 100 * (pd.Series(minus_dm).ewm(alpha=1/14, adjust=False).mean() / tr_smooth)
-        
-        dx = 100 * (abs(plus_di - minus_di) / (plus_di + minus_di))
-        df['ADX'] = dx.ewm(alpha=1/14, adjust=False).mean()
+        # Calculate Indicators (SMA20/50/150/200, Bollinger + width / expansion, RSI, RVOL,
+        # 50-day high / low, MACD, ATR, Chandelier Exit (ATR x5, widened for momentum swings),
+        # MFI, ADX): shared engine, reuses what the signal scan already computed for this bar
+        df = indicators.get_engine().frame(ticker, df, indicators.DEEP_DIVE_SET)
         
         # === Signal Detection (v3: Ultra-Relaxed for Candidate Discovery) ===
-        df['Signal'] = None 
-        df['Reason'] = ''
-        
-        # Helper: Event happened in last N days
-        def happened_recently(series_bool, window=3):
-            # Check if any True in rolling window (but we just have the column, need to roll it)
-            # Efficient way for single row logic: Just check current.
-            # But for scanners, we might want "Signal triggered yesterday".
-            # For now, let's stick to "Current Condition" to avoid "Old News", but relax the precision.
-            return series_bool
-            
-        # --- BUY Condition (Breakout) ---
-        # 1. Trend: Above SMA50 OR Above SMA20 (Short term momentum)
-        cond_trend = (df['Close'] > df['SMA50']) | (df['Close'] > df['SMA20'])
-        
-        # 2. Breakout Trigger
-        # Close > Upper Band OR Close near 50d High (>98%)
-        cond_bb_break = (df['Close'] > df['BB_Upper'])
-        cond_near_high = (df['Close'] >= df['High50'] * 0.98) 
-        cond_breakout = cond_bb_break | cond_near_high
-        
-        # 3. Volume (Relaxed)
-        # 1.1x volume is enough if price action is strong
-        cond_vol = (df['RVOL'] > 1.1)
-        
-        # 4. Momentum (MACD Positive or Rising)
-        cond_macd = (df['MACD'] > df['MACD_Signal']) | (df['MACD'] > 0)
-        
-        # 5. RSI Safety (Not > 80)
-        cond_safe_rsi = (df['RSI'] < 80)
-        
-        buy_mask = cond_trend & cond_breakout & cond_vol & cond_macd & cond_safe_rsi
-        
-        # --- REOVERSAL BUY Condition (Bottom Fish) ---
-        # Strategy: Catch the Turn.
-        
-        # 1. Oversold Context (RSI < 55)
-        cond_rsi_low = (df['RSI'] < 55)
-        
-        # 2. Golden Cross (MACD Cross UP) - Check Last 2 Days
-        # Today Cross OR Yesterday Cross (so we don't miss it by a few hours)
-        cross_today = (df['MACD'] > df['MACD_Signal']) & (df['MACD'].shift(1) <= df['MACD_Signal'].shift(1))
-        cross_yesterday = (df['MACD'].shift(1) > df['MACD_Signal'].shift(1)) & (df['MACD'].shift(2) <= df['MACD_Signal'].shift(2))
-        cond_macd_cross = cross_today | cross_yesterday
-        
-        # 3. Early Turn (Histogram Improving while Negative) - "Approaching Cross"
-        # Captures the V-bounce before the actual cross
-        cond_hist_improving = (df['MACD_Hist'] > df['MACD_Hist'].shift(1)) & (df['MACD_Hist'].shift(1) > df['MACD_Hist'].shift(2))
-        cond_early_turn = cond_rsi_low & cond_hist_improving & (df['MACD_Hist'] < 0)
-        
-        # 4. Big Candle (Panic Reversal)
-        cond_big_candle = (df['Close'] > df['Open'] * 1.03)
-        
-        # Logic A: Classic Golden Cross (Recent)
-        cond_reversal_classic = cond_rsi_low & cond_macd_cross
-        
-        # Logic B: Early Turn (Aggressive)
-        cond_reversal_early = cond_early_turn & (df['RVOL'] > 1.0) # Require slight vol for early turn
-        
-        # Logic C: Big Bounce
-        cond_reversal_bounce = cond_big_candle & (df['RVOL'] > 1.2)
-        
-        reversal_mask = cond_reversal_classic | cond_reversal_early | cond_reversal_bounce
-        
-        # --- RE-ENTRY BUY Condition (Dip Buy) ---
-        # Trend Up + Pullback + Turn Up
-        cond_trend_up = (df['ADX'] > 15) & (df['Close'] > df['SMA50'])
-        cond_pullback = (df['RSI'] < 60) & (df['RSI'] > 40) # Healthy pullback zone
-        cond_turn_up = cond_hist_improving | cond_macd_cross
-        
-        reentry_mask = cond_trend_up & cond_pullback & cond_turn_up
-        
-        # --- SELL Condition ---
-        # TRIGGER:
-        # 1. RSI Extreme: Crosses ABOVE 90 (Climax)
-        # 2. MACD Dead Cross: ONLY if we were recently overheated.
-        #    If we just wobbled around RSS 50, a MACD cross is noise. 
-        #    Rule: Max RSI of last 10 days must be > 70 for a MACD Profit Take to be valid.
-        
-        rsi_was_high = (df['RSI'].rolling(10).max() > 70)
-        
-        # RSI Climax (> 90)
-        rsi_climax_90 = (df['RSI'] > 90) & (df['RSI'].shift(1) <= 90)
-        
-        # MACD Dead Cross (Strict: Only if RSI < 60 AND we were recently high)
-        # BUG FIX: If MACD crosses while RSI > 60, we ignore it (good).
-        # But if price continues to drop, RSI falls below 60, and MACD is STILL dead... we missed the exit!
-        # ADDITION: Trigger if "MACD is Dead" AND "RSI crosses below 60".
-        
-        macd_is_dead = (df['MACD'] < df['MACD_Signal'])
-        rsi_cross_down_60 = (df['RSI'] < 60) & (df['RSI'].shift(1) >= 60)
-        
-        # 2a. Standard DC with RSI < 60 (Define it here as we deleted the previous definition)
-        cond_dc_immediate = (df['MACD'] < df['MACD_Signal']) & (df['MACD'].shift(1) >= df['MACD_Signal'].shift(1)) & (df['RSI'] < 60) & rsi_was_high
-        
-        # 2b. Delayed DC (RSI confirmation)
-        cond_dc_delayed = macd_is_dead & rsi_cross_down_60 & rsi_was_high
-        
-        sell_profit_mask = rsi_climax_90 | cond_dc_immediate | cond_dc_delayed
-        
-        # --- SELL Condition (Stop Loss / Trend End) ---
-        # TRIGGER:
-        # 1. Close Crosses Below Chandelier Exit (Robust)
-        # 2. REMOVED: SMA50 Break. (Caused too many whipsaws in flat markets. Chandelier @ ATRx5 is safer.)
-        
-        chandelier_break = (df['Close'] < df['Chandelier_Exit']) & (df['Close'].shift(1) >= df['Chandelier_Exit'].shift(1))
-        # sma50_break = (df['Close'] < df['SMA50']) & (df['Close'].shift(1) >= df['SMA50'].shift(1))
-        
-        sell_stop_mask = chandelier_break 
-        
-        # Combine all Buy triggers
-        # Priority logic inside iter loop or pre-merge?
-        # Let's merge basic buys.
-        
-        # We need to iterate to apply "Cool Down" (No multiple buys in 15 days)
-        # This prevents "Cluster Buying".
-        
-        # 1. Initialize Signal Series
-        df['Signal'] = None
-        df['Reason'] = ''
-        
-        # Convert masks to boolean series for easier access
-        s_buy = buy_mask
-        s_reversal = reversal_mask
-        s_reentry = reentry_mask
-        
-        s_sell_profit = sell_profit_mask
-        s_sell_stop = sell_stop_mask
-        
-        cooldown_days = 0 
-        cooldown_sell_days = 0 # Added Sell Cooldown
-        trend_buy_count = 0 # Count number of buys in current trend (Max 3)
-        
-        # 2. Iterative Application
-        # We start from index 0. 
-        # Note: Iterating pandas is slow? For 1 ticker (max 3000 rows) it is sub-second. safe.
-        
-        for i in range(len(df)):
-            # Decrease cooldowns
-            if cooldown_days > 0:
-                cooldown_days -= 1
-            if cooldown_sell_days > 0:
-                cooldown_sell_days -= 1
-                
-            # Check Trend Status for Reset (If Trend Logic Breaks, Reset Count)
-            # REVERT: Don't silent reset on SMA50 break. Rely on Chandelier Stop.
-            # If we dip below SMA50 but hold Chandelier, we are still IN.
-            # current_close = df['Close'].iloc[i]
-            # current_sma50 = df['SMA50'].iloc[i]
-            # if current_close < current_sma50:
-            #      trend_buy_count = 0
-            
-            # Check Sell First (Priority: Stop > Profit)
-            # Sell always overrides Buy? Yes.
-            
-            # STOP LOSS (Must trigger regardless of cooldown usually, but if we just sold, maybe ignore?
-            # Actually Stop Loss is distinct. If we hit stop, we hit stop.
-            # But let's apply cooldown to avoid noise if it flickers.
-            is_sell = False
-            reason_sell = ''
-            
-            if s_sell_stop.iloc[i] and cooldown_sell_days == 0:
-                is_sell = True
-                reason_sell = '損切り/撤退 (サポートライン割れ)'
-                
-            elif s_sell_profit.iloc[i] and cooldown_sell_days == 0:
-                is_sell = True
-                reason_sell = '利確推奨 (RSI90超/トレンド転換)'
-                
-            if is_sell:
-                # STRICT RULE: Only Sell if we actually "Bought" (Count > 0)
-                # This prevents "Phantom Sells" when we are already flat.
-                if trend_buy_count > 0:
-                    df.at[df.index[i], 'Signal'] = 'Sell'
-                    df.at[df.index[i], 'Reason'] = reason_sell
-                    cooldown_days = 0 
-                    cooldown_sell_days = 5 # Prevent repetitive sells
-                    trend_buy_count = 0 # Reset buy count on Sell (Full Exit)
-                
-                # If trend_buy_count == 0, we ignore the Sell (we are flat).
-                continue
-                
-            # BUY LOGIC (Only if cooldown is 0 AND Buy Count < 3)
-            if cooldown_days == 0 and trend_buy_count < 3:
-                is_buy = False
-                reason_buy = ''
-                
-                # Check Triggers (Priority: Buy > Reversal > Reentry)
-                if s_buy.iloc[i]:
-                    is_buy = True
-                    reason_buy = 'モメンタム始動 (ブレイク+出来高+MACD)'
-                elif s_reversal.iloc[i]:
-                    is_buy = True
-                    reason_buy = 'トレンド転換 (大陽線/MACD好転)'
-                elif s_reentry.iloc[i]:
-                    is_buy = True
-                    reason_buy = '再エントリー (押し目完了/MACD好転)'
-                    
-                if is_buy:
-                    # Also check if we recently sold? (wash sale / noise)
-                    # If is_buy is True, and we passed checks.
-                    
-                    df.at[df.index[i], 'Signal'] = 'Buy'
-                    df.at[df.index[i], 'Reason'] = reason_buy
-                    cooldown_days = 5 # Wait 5 days (1 week) to prevent immediate cluster buys
-                    trend_buy_count += 1 # Increment buy count
-                    
-        # Done.
-        # Note: This replaces the vectorized assignments above.
+        # Breakout / Reversal / Re-entry buys and Stop / Profit sells with the 5-day cooldowns,
+        # max 3 buys per trend and sells only while holding (signal_engine.trades)
+        codes, reasons = signal_engine.trades(signal_engine.frame_inputs(df))
+        df['Signal'] = pd.Series(np.array(signal_engine.TRADE_SIGNALS, dtype=object)[codes[0]], index=df.index, dtype=object)
+        df['Reason'] = np.array(signal_engine.TRADE_REASONS, dtype=object)[reasons[0]]
 
 
         # === Current Status Determination ===
@@ -2998,17 +2718,13 @@ def get_ticker_metadata_jp(tickers):
     Returns:
         dict: {ticker: {'name': '銘柄和名', 'sector': 'セクター和名'}}
     """
-    metadata_path = "data/metadata_cache.json"
-    cache = {}
-    
-    # Load cache
-    if os.path.exists(metadata_path):
-        try:
-            with open(metadata_path, 'r', encoding='utf-8') as f:
-                cache = json.load(f)
-        except Exception as e:
-            print(f"Error loading metadata cache: {e}")
-            cache = {}
+    # Load cache (point lookups for these tickers only)
+    store = reference_store.get_store()
+    try:
+        cache = store.get_many(reference_store.METADATA, tickers)
+    except Exception as e:
+        print(f"Error loading metadata cache: {e}")
+        cache = {}
             
     # Identify missing or non-Japanese entries
     missing_tickers = []
@@ -3054,10 +2770,11 @@ def get_ticker_metadata_jp(tickers):
     print(f"Fetching/Translating metadata for {len(missing_tickers)} tickers...")
     translator = GoogleTranslator(source='auto', target='ja')
     
+    provider = data_provider.get_provider()
+    fetched = {}
     for t in missing_tickers:
         try:
-            ticker_obj = yf.Ticker(t)
-            info = ticker_obj.info
+            info = provider.info(t)
             
             # Get English name
             name_en = info.get('shortName', info.get('longName', t))
@@ -3078,20 +2795,18 @@ def get_ticker_metadata_jp(tickers):
             cache[t]['name'] = name_jp
             cache[t]['industry'] = sector_en # Keep EN industry in cache for reference
             cache[t]['summary'] = info.get('longBusinessSummary', '') # Might be English if not translated here
-
-            # Sleep to avoid rate limits
-            time.sleep(0.1)
+            fetched[t] = cache[t]
             
         except Exception as e:
             print(f"Error fetching metadata for {t}: {e}")
             # Fallback
             if t not in cache:
                 cache[t] = {'name': t, 'industry': ''}
+                fetched[t] = cache[t]
 
-    # Save cache
+    # Save cache (upsert only the fetched tickers)
     try:
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(cache, f, ensure_ascii=False, indent=2)
+        store.upsert_many(reference_store.METADATA, fetched)
     except Exception as e:
         print(f"Error saving metadata cache: {e}")
         
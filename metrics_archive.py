@@ -0,0 +1,260 @@
+"""
+Append-only archive of the daily metrics and signals tables (data/archive/).
+
+The snapshot of a run only holds the latest answers; the archive keeps every
+trading day's metrics table and signal list so persistence checks,
+rank-history charts and backtests can read stored results instead of
+recomputing them from price history.
+
+    data/archive/
+        index.json                  {'version', 'kinds': {kind: {'YYYY-MM-DD': partition file}}}
+        metrics/2026-10-17.npz      one compressed partition per trading day ...
+        metrics/2026-09.npz         ... merged into one per month once the month is over (compact)
+        signals/...
+
+Partitions use the typed .npz layout of metrics_snapshot (compressed), with a
+Date column. Writing a day that is already archived replaces that day only;
+days are never dropped. load() / load_range() read only the partitions that
+hold the requested dates (via index.json) and return one columnar frame.
+
+Usage:
+    python metrics_archive.py                # archived dates per table
+    python metrics_archive.py --compact      # merge finished months
+"""
+import os
+import json
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+import history_store
+import metrics_snapshot
+
+ARCHIVE_DIR = "data/archive"
+INDEX_FILE = "index.json"
+FORMAT_VERSION = 1
+
+METRICS = 'metrics'
+SIGNALS = 'signals'
+KINDS = (METRICS, SIGNALS)
+
+# Tickers repeat every day -> categorical (codes + one list of names per partition)
+# Signals: other columns are float64 (as computed)
+SIGNAL_SCHEMA = {
+    'Date': 'datetime64[ns]',
+    'Type': 'category',
+    'Ticker': 'category',
+    'Reason': 'category',
+}
+SCHEMAS = {
+    METRICS: dict(metrics_snapshot.SCHEMA, Date='datetime64[ns]', Ticker='category'),
+    SIGNALS: SIGNAL_SCHEMA,
+}
+
+
+def _day(date):
+    return pd.Timestamp(date).strftime('%Y-%m-%d')
+
+
+def market_date(history):
+    """Date of the latest bar in a history ({ticker: DataFrame} or HistoryStore)."""
+    if isinstance(history, history_store.HistoryStore):
+        return pd.Timestamp(np.max(history.dates)).normalize()
+    return max(df.index[-1] for df in history.values() if df is not None and len(df) > 0).normalize()
+
+
+def signals_frame(daily_signals):
+    """{'Buy_Breakout': [{'Ticker': ..., ...}], ...} -> one row per signal with a Type column."""
+    rows = [dict(item, Type=kind) for kind, items in daily_signals.items() for item in items]
+    if not rows:
+        return pd.DataFrame(columns=['Type', 'Ticker'])
+    df = pd.DataFrame(rows)
+    return df[['Type'] + [c for c in df.columns if c != 'Type']]
+
+
+def signals_dict(frame):
+    """Inverse of signals_frame (the daily_signals_cache.json layout)."""
+    out = {}
+    for kind, part in frame.drop(columns=['Date'], errors='ignore').groupby('Type', observed=True, sort=False):
+        out[kind] = part.drop(columns=['Type']).to_dict('records')
+    return out
+
+
+class MetricsArchive:
+    """
+    Usage:
+        archive = MetricsArchive()
+        archive.append('metrics', '2026-10-17', df_metrics)
+        df = archive.load_range('metrics', '2026-09-01', '2026-10-17', columns=['Ticker', '3mo'])
+    """
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self._lock = threading.Lock()
+        self.index = {k: {} for k in KINDS}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('version') != FORMAT_VERSION:
+                raise ValueError(f"Unsupported archive version: {meta.get('version')}")
+            for kind, days in meta.get('kinds', {}).items():
+                self.index.setdefault(kind, {}).update(days)
+
+    def _save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': FORMAT_VERSION,
+                       'kinds': {k: dict(sorted(v.items())) for k, v in self.index.items()}}, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def _path(self, kind, name):
+        return os.path.join(self.root, kind, name)
+
+    def _write(self, kind, name, df):
+        path = self._path(kind, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        metrics_snapshot.save_snapshot(df, path, schema=SCHEMAS[kind], compressed=True)
+
+    def _read(self, kind, name, columns=None):
+        return metrics_snapshot.load_snapshot(self._path(kind, name), columns)
+
+    def dates(self, kind=METRICS):
+        """Archived dates of a table (sorted Timestamps)."""
+        return [pd.Timestamp(d) for d in sorted(self.index.get(kind, {}))]
+
+    def append(self, kind, date, df):
+        """
+        Archive one day's table (replaces that day if it is already archived).
+
+        Returns:
+            str: partition path
+        """
+        day = _day(date)
+        df = df.reset_index(drop=True).copy()
+        df.insert(0, 'Date', pd.Timestamp(day))
+        with self._lock:
+            name = f"{day}.npz"
+            self._write(kind, name, df)
+            self.index.setdefault(kind, {})[day] = name
+            self._save_index()
+        return self._path(kind, name)
+
+    def compact(self, kind=None, before=None):
+        """
+        Merge the daily partitions of every month before `before` (default: the month of
+        the latest archived day) into one partition per month.
+
+        Returns:
+            int: number of daily partitions merged
+        """
+        merged = 0
+        for k in ([kind] if kind else KINDS):
+            days = self.index.get(k, {})
+            if not days:
+                continue
+            limit = pd.Timestamp(before or max(days)).strftime('%Y-%m')
+            months = {}
+            for day, name in days.items():
+                if day[:7] < limit and name != f"{day[:7]}.npz":
+                    months.setdefault(day[:7], []).append(day)
+            for month, new_days in sorted(months.items()):
+                with self._lock:
+                    name = f"{month}.npz"
+                    parts = []
+                    if os.path.exists(self._path(k, name)):
+                        old = self._read(k, name)
+                        # Days re-archived after compaction replace their old rows
+                        parts.append(old[~old['Date'].isin(pd.to_datetime(new_days))])
+                    parts += [self._read(k, days[d]) for d in sorted(new_days)]
+                    frame = _concat(parts).sort_values('Date', kind='stable').reset_index(drop=True)
+                    self._write(k, name, frame)
+                    for d in new_days:
+                        old_name = days[d]
+                        days[d] = name
+                        if os.path.exists(self._path(k, old_name)):
+                            os.remove(self._path(k, old_name))
+                    self._save_index()
+                    merged += len(new_days)
+        return merged
+
+    def load(self, kind, date, columns=None):
+        """One archived day (empty frame if it is not archived)."""
+        return self.load_range(kind, date, date, columns)
+
+    def load_range(self, kind, start=None, end=None, columns=None):
+        """
+        Every archived day in [start, end] (inclusive, None = open) as one frame.
+
+        Returns:
+            DataFrame: Date column first, rows ordered by date
+        """
+        days = self.index.get(kind, {})
+        lo = _day(start) if start is not None else ''
+        hi = _day(end) if end is not None else '9999'
+        wanted = sorted(d for d in days if lo <= d <= hi)
+        read_columns = None if columns is None else ['Date'] + [c for c in columns if c != 'Date']
+        parts = []
+        for name in dict.fromkeys(days[d] for d in wanted):  # partitions in date order, once each
+            df = self._read(kind, name, read_columns)
+            if name.count('-') == 1:  # monthly partition: keep the requested days only
+                dates = df['Date'].to_numpy()
+                keep = (dates >= np.datetime64(wanted[0])) & (dates <= np.datetime64(wanted[-1]))
+                if not keep.all():
+                    df = df[keep]
+            parts.append(df)
+        if not parts:
+            return pd.DataFrame(columns=['Date'] + list(columns or []))
+        return _concat(parts).reset_index(drop=True)
+
+
+def _concat(parts):
+    """pd.concat that keeps categorical columns categorical when the categories differ."""
+    if len(parts) == 1:
+        return parts[0]
+    df = pd.concat(parts, ignore_index=True)
+    for c, dtype in parts[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype('category')
+    return df
+
+
+def get_archive():
+    return MetricsArchive()
+
+
+def archive_run(df_metrics, daily_signals, date, root=ARCHIVE_DIR):
+    """
+    Archive one run's metrics table and signals, then compact finished months.
+
+    Returns:
+        dict: {'date', 'metrics_rows', 'signals_rows', 'compacted'}
+    """
+    archive = MetricsArchive(root)
+    archive.append(METRICS, date, df_metrics)
+    signals = signals_frame(daily_signals or {})
+    archive.append(SIGNALS, date, signals)
+    return {'date': _day(date), 'metrics_rows': len(df_metrics), 'signals_rows': len(signals),
+            'compacted': archive.compact()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or compact the daily metrics / signals archive")
+    parser.add_argument('--compact', action='store_true', help="merge the daily partitions of finished months")
+    args = parser.parse_args()
+
+    archive = get_archive()
+    if args.compact:
+        print(f"Merged {archive.compact()} daily partitions")
+    for kind in KINDS:
+        dates = archive.dates(kind)
+        files = sorted(set(archive.index.get(kind, {}).values()))
+        span = f"{dates[0].date()} .. {dates[-1].date()}" if dates else "empty"
+        print(f"{kind}: {len(dates)} days ({span}) in {len(files)} partitions")
+
+
+if __name__ == "__main__":
+    main()
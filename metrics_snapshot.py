@@ -0,0 +1,179 @@
+"""
+Typed binary snapshot of the momentum metrics table (data/momentum_cache.npz).
+
+momentum_cache.csv stored every float with its full repr, and every reader
+re-parsed the text and re-inferred the bool / int columns. The snapshot is an
+uncompressed .npz with an explicit schema; numeric / bool columns are stored
+as one 2-D block per dtype (few archive members = fast to open):
+
+- float64 for Price, the period returns (ranking keys) and every price level
+  compared against Price (52w high / low, SMAs, Bollinger bands)
+- float32 only for ratios and oscillators (RVOL, RSI, BB width, ownership, PE, ...)
+- real bools for the flag columns, int64 for Float / MarketCap
+- Signal as a categorical (codes + categories, empty = missing as with the CSV)
+
+Loading returns exactly the frame that was saved (same values and dtypes).
+The CSV is still written when asked for (update_data.py --export-csv).
+"""
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_PATH = "data/momentum_cache.npz"
+CSV_PATH = "data/momentum_cache.csv"
+SCHEMA_VERSION = 1
+
+# Column -> dtype ('str' / 'category' / numpy dtype name), in table order
+SCHEMA = {
+    'Ticker': 'str',
+    'Signal': 'category',
+    'Price': 'float64',
+    '1d': 'float64',
+    '5d': 'float64',
+    '1mo': 'float64',
+    '3mo': 'float64',
+    '6mo': 'float64',
+    'YTD': 'float64',
+    '1y': 'float64',
+    'RVOL': 'float32',
+    'RSI': 'float32',
+    'ShortRatio': 'float32',
+    'High52': 'float64',
+    'Low52': 'float64',
+    'SMA50': 'float64',
+    'SMA200': 'float64',
+    'BB_Upper': 'float64',
+    'BB_Lower': 'float64',
+    'Is_Squeeze': 'bool',
+    'BB_Width': 'float32',
+    'GC_Just_Now': 'bool',
+    'DC_Just_Now': 'bool',
+    'Above_SMA50': 'bool',
+    'InstOwnership': 'float32',
+    'InsiderOwnership': 'float32',
+    'Float': 'int64',
+    'Beta': 'float32',
+    'ForwardPE': 'float32',
+    'MarketCap': 'int64',
+    'SMA50_Deviation': 'float32',
+}
+
+
+def _column_dtype(name, series, schema=SCHEMA):
+    """Schema dtype, or a safe default for columns the schema does not know yet."""
+    if name in schema:
+        return schema[name]
+    if pd.api.types.is_bool_dtype(series):
+        return 'bool'
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'datetime64[ns]'
+    if pd.api.types.is_numeric_dtype(series):
+        return 'float64'
+    return 'str'
+
+
+def to_typed(df, schema=SCHEMA):
+    """Cast a metrics frame to the snapshot schema (the frame load_snapshot returns)."""
+    out = {}
+    for c in df.columns:
+        kind = _column_dtype(c, df[c], schema)
+        s = df[c]
+        if kind == 'str':
+            out[c] = s.astype(str)
+        elif kind == 'category':
+            # Empty strings read back as missing, as they did from the CSV
+            out[c] = s.where(s.notna() & (s.astype(str) != ''), None).astype('category')
+        elif kind == 'bool':
+            out[c] = s.fillna(False).astype(bool)
+        elif kind == 'int64':
+            out[c] = pd.to_numeric(s, errors='coerce').fillna(0).astype(np.int64)
+        elif kind.startswith('datetime64'):
+            out[c] = pd.to_datetime(s).astype(kind)
+        else:
+            out[c] = pd.to_numeric(s, errors='coerce').astype(kind)
+    return pd.DataFrame(out, index=pd.RangeIndex(len(df)))
+
+
+def save_snapshot(df, path=SNAPSHOT_PATH, schema=SCHEMA, compressed=False):
+    """
+    Write the metrics table as a typed .npz (atomic replace).
+    schema: column dtypes (other tables can use the same layout with their own)
+    compressed: zip-deflate the members (archives; slower to load)
+
+    Returns:
+        pd.DataFrame: the typed frame that was written
+    """
+    typed = to_typed(df, schema)
+    arrays, columns, blocks = {}, [], {}
+    for i, c in enumerate(typed.columns):
+        kind = _column_dtype(c, df[c], schema)
+        s = typed[c]
+        if kind == 'category':
+            arrays[f"c{i}"] = s.cat.codes.to_numpy(dtype=np.int32)
+            arrays[f"k{i}"] = np.array(s.cat.categories.tolist(), dtype=str)
+            columns.append([c, kind, None])
+        elif kind == 'str':
+            arrays[f"c{i}"] = np.array(s.tolist(), dtype=str)
+            columns.append([c, kind, None])
+        else:
+            block = blocks.setdefault(kind, [])
+            columns.append([c, kind, len(block)])  # row in the dtype block
+            block.append(s.to_numpy(dtype=kind))
+    for kind, block in blocks.items():
+        arrays[f"block_{kind}"] = np.vstack(block)
+    arrays['schema'] = np.array(json.dumps({'version': SCHEMA_VERSION, 'columns': columns}))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        (np.savez_compressed if compressed else np.savez)(f, **arrays)
+    os.replace(tmp_path, path)
+    return typed
+
+
+def load_snapshot(path=SNAPSHOT_PATH, columns=None):
+    """
+    Read a snapshot written by save_snapshot (same columns, values and dtypes).
+    columns: only these columns (members holding no requested column are not read)
+    """
+    with np.load(path, allow_pickle=False) as z:
+        schema = json.loads(str(z['schema']))
+        if schema.get('version') != SCHEMA_VERSION:
+            raise ValueError(f"Unsupported metrics snapshot version: {schema.get('version')}")
+        wanted = None if columns is None else set(columns)
+        blocks = {}
+        out = {}
+        for i, (c, kind, row) in enumerate(schema['columns']):
+            if wanted is not None and c not in wanted:
+                continue
+            if kind == 'category':
+                out[c] = pd.Categorical.from_codes(z[f"c{i}"], categories=z[f"k{i}"].tolist())
+            elif kind == 'str':
+                out[c] = pd.array(z[f"c{i}"].tolist(), dtype='str')
+            else:
+                if kind not in blocks:
+                    blocks[kind] = z[f"block_{kind}"]
+                out[c] = blocks[kind][row]
+    return pd.DataFrame(out)
+
+
+def export_csv(df, path=CSV_PATH):
+    df.to_csv(path, index=False)
+    return path
+
+
+def load_metrics(path=SNAPSHOT_PATH, csv_path=CSV_PATH):
+    """Metrics table from the snapshot, or from the CSV when only that exists (older data)."""
+    if os.path.exists(path):
+        return load_snapshot(path)
+    return pd.read_csv(csv_path)
+
+
+def snapshot_path(path=SNAPSHOT_PATH, csv_path=CSV_PATH):
+    """Path of the metrics file a reader would load (for mtime-based cache keys), or None."""
+    for p in (path, csv_path):
+        if os.path.exists(p):
+            return p
+    return None
@@ -1,5 +1,4 @@
 import streamlit as st
-import yfinance as yf
 # from deep_translator import GoogleTranslator # Lazy load
 import time
 import pandas as pd
@@ -13,10 +12,15 @@ from datetime import datetime, date
 # import plotly.express as px # Lazy load
 # import plotly.graph_objects as go # Lazy load
 import re
-import pickle
 import os
 import json
 import discord_utils
+import data_provider
+import history_store
+import price_panel
+import metrics_snapshot
+import snapshot
+import reference_store
 # from newspaper import Article, Config # Lazy load
 
 # import nltk # Lazy load
@@ -121,7 +125,7 @@ def get_ticker_news(ticker, company_name=None):
     3. Relevance (Title must contain Ticker or Company Name)
     """
     try:
-        news = yf.Ticker(ticker).news
+        news = data_provider.get_provider().news(ticker)
         if not news: return []
         
         results = []
@@ -234,22 +238,27 @@ def get_ticker_news(ticker, company_name=None):
 # THEMATIC_ETFS is imported.
 
 # --- Risk Management Helpers ---
+@st.cache_resource # 接続はセッション間で共有 (スナップショットごとに1つ)
+def load_reference_store(version):
+    """
+    スナップショットの参照データストア (メタデータ・決算日) を読み取り専用で開く。
+    version: キャッシュの無効化（更新検知）に使われるスナップショットバージョン
+    """
+    return reference_store.open_readonly(snapshot.resolve(snapshot.REFERENCE))
+
 @st.cache_data(ttl=3600*12)
-def get_earnings_next(ticker):
+def get_earnings_next(ticker, version=None):
     """
     Fetches the next earnings date from CACHE.
+    version: snapshot version (cache key, a new snapshot re-reads the file)
     Returns: formatted string (e.g., '⚠️ In 3 days' or '2025-10-30') or '-'
     """
-    # Load cache only once per cached run (though function is cached, file read is cheap)
-    earnings_path = "data/earnings_cache.json"
-    
+    # Point lookup in the snapshot's reference store (no file parse per ticker)
     next_date_str = "-"
-    
-    if os.path.exists(earnings_path):
+    store = load_reference_store(version)
+    if store is not None:
         try:
-            with open(earnings_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                next_date_str = data.get(ticker, "-")
+            next_date_str = (store.get(reference_store.EARNINGS, ticker) or {}).get('date') or "-"
         except:
             pass
             
@@ -280,7 +289,7 @@ def get_ticker_news(ticker, company_name=None):
     3. Relevance (Title must contain Ticker or Company Name)
     """
     try:
-        news = yf.Ticker(ticker).news
+        news = data_provider.get_provider().news(ticker)
         if not news: return []
         
         results = []
@@ -482,7 +491,7 @@ def get_data(tickers, period):
             if t.startswith('---'): continue # Skip separators just in case
             try:
                 # Fetch one by one to avoid bulk download header/cache issues
-                df = yf.download(t, period=period, auto_adjust=True, progress=False)
+                df = data_provider.get_provider().history(t, period=period)
                 
                 # Check if data is empty
                 if df is None or df.empty:
@@ -539,13 +548,13 @@ def calculate_stats(df_prices):
     return returns, corr_matrix, cumulative_returns
 
 @st.cache_data(ttl=3600)
-def get_dynamic_trending_tickers():
+def get_dynamic_trending_tickers(version=None):
     """
-    Fetches 'Most Active' tickers from CACHE (data/trending_cache.json).
+    Fetches 'Most Active' tickers from CACHE (trending_cache.json of the current snapshot).
     Falls back to static list if cache missing.
     """
     fallback_tickers = ['RKLB', 'MU', 'OKLO', 'LLY', 'SOFI']
-    cache_path = "data/trending_cache.json"
+    cache_path = snapshot.resolve(snapshot.TRENDING)
     
     if os.path.exists(cache_path):
         try:
@@ -805,47 +814,27 @@ def translate_to_japanese(text):
     except Exception as e:
         return text
 
-@st.cache_data(ttl=None)
-def load_metadata_cache(mtime):
-    """
-    メタデータキャッシュを読み込み
-    mtime: キャッシュ無効化のための更新時刻パラメータ
-    Returns: dict {ticker: {'name': str, 'industry': str, 'summary': str}}
-    """
-    cache_path = "data/metadata_cache.json"
-    if os.path.exists(cache_path):
-        try:
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
-
-@st.cache_data(ttl=3600)  # フォールバック用キャッシュ（1時間）
+# 参照データストアへの主キー検索のみ (ファイル全体の読み込みなし)
 def get_ticker_metadata(ticker):
     """
     Fetches info (Short Name, Sector/Industry, Summary) for a single ticker.
     Returns: (name, category_label, summary_text)
     キャッシュ優先、なければAPI呼び出し
     """
-    # 1. Try Cache First (Fast Path)
-    # ファイルの更新時刻を取得してキャッシュキーにする
-    cache_path = "data/metadata_cache.json"
-    mtime = 0
-    if os.path.exists(cache_path):
-        mtime = os.path.getmtime(cache_path)
-    
-    metadata_cache = load_metadata_cache(mtime)
-    
-    
     # Init variables
     name = ticker
     industry = ''
     summary = ''
     
-    # 1. Try Cache
-    if ticker in metadata_cache:
-        data = metadata_cache[ticker]
+    # 1. Try Cache (スナップショットのストア、バージョンがキャッシュキー)
+    store = load_reference_store(snapshot.current_version())
+    data = None
+    if store is not None:
+        try:
+            data = store.get(reference_store.METADATA, ticker)
+        except:
+            data = None
+    if data:
         name = data.get('name', ticker)
         industry = data.get('industry', '')
         summary = data.get('summary', '')
@@ -868,26 +857,63 @@ def get_ticker_metadata(ticker):
          
     return name, category, summary
 
-@st.cache_data(ttl=None) # TTLなし。引数のmtimeが変わるまでキャッシュ維持
-def load_cached_data(mtime_param):
+@st.cache_resource # メモリマップはセッション間で共有 (cache_dataだと毎回コピーされる)
+def load_history_store(version):
+    """
+    チャート用履歴 (スナップショットの history/) をメモリマップで開く。銘柄ごとのDataFrameは参照時に生成。
+    version: キャッシュの無効化（更新検知）に使われるスナップショットバージョン
+    """
+    return history_store.open_history(snapshot.resolve(snapshot.HISTORY))
+
+@st.cache_resource # スナップショットごとに1回だけ構築 (アラート・相関で共有)
+def load_price_panel(version):
+    """
+    チャート用履歴を ticker x date x OHLCV のパネルに変換する。
+    version: キャッシュの無効化（更新検知）に使われるスナップショットバージョン
+    """
+    history = load_history_store(version)
+    return price_panel.PricePanel.from_history(history) if history is not None else None
+
+@st.cache_resource # スナップショットごとに1回だけ構築 (期間・Top N・日数を変えてもクエリのみ)
+def load_rank_history(version):
+    """直近の各営業日の期間リターン・順位・RVOL (Opportunity Alert の持続性チェック用)"""
+    panel = load_price_panel(version)
+    return market_logic.build_rank_history(panel) if panel is not None else None
+
+@st.cache_resource
+def load_return_correlations(version):
+    """パネルの日次リターン相関行列 (スナップショットごとに1回だけ計算)"""
+    panel = load_price_panel(version)
+    return panel.corr() if panel is not None else pd.DataFrame()
+
+@st.cache_data(ttl=None) # TTLなし。引数のversionが変わるまでキャッシュ維持
+def load_cached_tables(version):
     """
-    保存されたCSVとPickleを読み込む。
-    mtime_param: キャッシュの無効化（更新検知）に使われる擬似パラメータ
+    保存されたランキングデータと更新時刻を読み込む。
+    version: キャッシュの無効化（更新検知）に使われるスナップショットバージョン
     """
-    if os.path.exists("data/momentum_cache.csv") and os.path.exists("data/history_cache.pkl"):
+    df = metrics_snapshot.load_metrics(snapshot.resolve(snapshot.METRICS), snapshot.resolve(snapshot.METRICS_CSV))
+    
+    # 更新時刻の確認
+    last_update = "Unknown"
+    txt_path = snapshot.resolve(snapshot.LAST_UPDATED)
+    if os.path.exists(txt_path):
+        with open(txt_path, "r") as f:
+            last_update = f.read().strip()
+    return df, last_update
+
+def load_cached_data(version):
+    """
+    ランキングデータ (cache_data) と履歴スナップショット (cache_resource) を読み込む。
+    version: キャッシュの無効化（更新検知）に使われるスナップショットバージョン
+    """
+    if version is not None:
         try:
-            # キャッシュからロード
-            df = pd.read_csv("data/momentum_cache.csv")
-            with open("data/history_cache.pkl", "rb") as f:
-                history = pickle.load(f)
-            
-            # 更新時刻の確認
-            last_update = "Unknown"
-            if os.path.exists("data/last_updated.txt"):
-                with open("data/last_updated.txt", "r") as f:
-                    last_update = f.read().strip()
-                    
-            return df, history, last_update
+            # キャッシュからロード (全て同じスナップショットから)
+            df, last_update = load_cached_tables(version)
+            history = load_history_store(version)
+            if history is None:
+                raise FileNotFoundError(snapshot.resolve(snapshot.HISTORY))
             return df, history, last_update
         except Exception as e:
             st.error(f"Cache load failed: {e}. Please run update_data.py.")
@@ -984,7 +1010,7 @@ def render_correlation_radar():
         st.header("⚙️ Radar Settings")
         
         # 1. Fetch Trending for Radar
-        trending_tickers = get_dynamic_trending_tickers()
+        trending_tickers = get_dynamic_trending_tickers(snapshot.current_version())
         popular_tickers = []
         if trending_tickers:
             popular_tickers.extend(["--- 🔥 Trending (Yahoo Finance) ---"] + trending_tickers)
@@ -1241,9 +1267,9 @@ def generate_dynamic_comment(ticker, row):
 
 @st.cache_data(show_spinner=False, ttl=300)  # 5分キャッシュ
 @st.cache_data(show_spinner=False, ttl=300)  # 5分キャッシュ (Reloading file essentially)
-def get_major_indices_data(period: str):
-    """Fetch major indices returns for the specified period from CACHE"""
-    indices_path = "data/indices_cache.json"
+def get_major_indices_data(period: str, version=None):
+    """Fetch major indices returns for the specified period from CACHE (version: snapshot cache key)"""
+    indices_path = snapshot.resolve(snapshot.INDICES)
     
     # Default structure on error
     results = {}
@@ -1279,7 +1305,7 @@ def get_major_indices_data(period: str):
 
 def render_major_indices(period: str):
     """Render major indices section"""
-    indices_data = get_major_indices_data(period)
+    indices_data = get_major_indices_data(period, snapshot.current_version())
     
     # 2行3列で表示
     cols = st.columns(6)
@@ -1304,9 +1330,8 @@ def render_momentum_master():
     import plotly.graph_objects as go
     import time
     
-    # Check File Modification Time (Trigger Cache Invalidation)
-    cache_path = "data/momentum_cache.csv"
-    mtime = os.path.getmtime(cache_path) if os.path.exists(cache_path) else 0
+    # Snapshot version (data/CURRENT) keys every cache -> one small read per rerun
+    data_version = snapshot.current_version()
 
     # Load Data First
     import importlib
@@ -1314,7 +1339,7 @@ def render_momentum_master():
     
     t0 = time.time()
     with st.spinner('Loading data...'):
-        df_metrics, history_dict, last_updated = load_cached_data(mtime)
+        df_metrics, history_dict, last_updated = load_cached_data(data_version)
     
     # Display Title & Update Time
     col_title, col_time = st.columns([0.7, 0.3])
@@ -1506,7 +1531,7 @@ def render_momentum_master():
         strategies.append(generate_dynamic_comment(t, row))
         
         # 3. Earnings Date (Lazy fetch for Top 10 only)
-        earnings_dates.append(get_earnings_next(t))
+        earnings_dates.append(get_earnings_next(t, data_version))
         
     top_10['Name'] = names
     top_10['Sector'] = sectors
@@ -1612,7 +1637,7 @@ def render_momentum_master():
              # daily_signals = market_logic.get_todays_signals(history_dict) # OLD: Slow
              
              # NEW: Load Pre-calculated Cache
-             sig_path = "data/daily_signals_cache.json"
+             sig_path = snapshot.resolve(snapshot.SIGNALS)
              if os.path.exists(sig_path):
                  with open(sig_path, 'r', encoding='utf-8') as f:
                      daily_signals = json.load(f)
@@ -1729,7 +1754,7 @@ def render_momentum_master():
             b_sectors.append(f"🌊 {d_cat}")
         
         b_strategies.append(generate_dynamic_comment(t, row))
-        b_earnings.append(get_earnings_next(t))
+        b_earnings.append(get_earnings_next(t, data_version))
         
     bottom_10['Name'] = b_names
     bottom_10['Sector'] = b_sectors
@@ -1743,17 +1768,14 @@ def render_momentum_master():
 
 
     # --- 🚨 Opportunity Alert (Short-Term Focus) ---
-    # Reconstruct raw DF from history_dict for retroactive calculation
+    # Returns / ranks of the last days are built once per snapshot (rank history); the alert is a query on it
     # Only run if we have history
     if history_dict:
         try:
-             # Reconstruct MultiIndex DF: columns=(Ticker, Attributes)
-             # This allows check_opportunity_alerts to slice by date easily.
-             raw_history_df = pd.concat(history_dict.values(), axis=1, keys=history_dict.keys())
+             rank_history_data = load_rank_history(data_version)
              
              # Calculate Alerts (Using selected period for ranking)
-             # Note: This might take a second, so ideally we catch it.
-             alerts = market_logic.check_opportunity_alerts(raw_history_df, period=selected_period)
+             alerts = market_logic.check_opportunity_alerts(rank_history_data, period=selected_period)
              
              if alerts:
                  for a in alerts:
@@ -2737,8 +2759,8 @@ def render_momentum_master():
     # Need correlation matrix for Bento Box
     with st.spinner("Calculating portfolio correlations..."):
         try:
-             price_history_df = pd.DataFrame(history_dict)
-             corr_matrix = price_history_df.corr()
+             # Daily-return correlation on the shared calendar of the snapshot's panel
+             corr_matrix = load_return_correlations(snapshot.current_version())
              if corr_matrix.empty:
                  corr_matrix = pd.DataFrame()
         except Exception as e:
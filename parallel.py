@@ -0,0 +1,122 @@
+"""
+Process-pool backend for per-ticker work over the price panel.
+
+map_shards() splits the rows (tickers) of a set of numpy arrays into
+contiguous shards and runs a shard function on each:
+
+- serial (default): the function runs once, in this process, on all rows
+- pool (MM_WORKERS=N or update_data.py --workers N): the arrays are copied
+  once into shared memory, every worker maps them (no DataFrames or price
+  buffers are pickled per task) and receives only its row range
+
+Shard results come back in shard order, so merging them (concat / extend)
+gives exactly what the serial run gives. Shard functions must be module-level
+functions (workers import them by name) and must not depend on rows outside
+their shard.
+
+    MM_WORKERS=0|1     serial (default)
+    MM_WORKERS=N       N worker processes
+    MM_WORKERS=auto    one per CPU
+"""
+import os
+import concurrent.futures
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+WORKERS_ENV = "MM_WORKERS"
+# Fewer rows per shard than this are not worth a worker
+MIN_SHARD_ROWS = 64
+
+
+def configured_workers(workers=None):
+    """Worker count from the argument, else MM_WORKERS (0 = serial)."""
+    value = workers if workers is not None else os.environ.get(WORKERS_ENV, '0')
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value == 'auto':
+            return os.cpu_count() or 1
+        try:
+            value = int(value or 0)
+        except ValueError:
+            print(f"Ignoring {WORKERS_ENV}={value!r} (expected a number or 'auto')")
+            return 0
+    return max(int(value), 0)
+
+
+class SharedArrays:
+    """
+    Numpy arrays copied into shared memory blocks for the lifetime of the context.
+    spec() is the small picklable description workers attach to.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.blocks = []
+        self._spec = {}
+
+    def __enter__(self):
+        for name, arr in self.arrays.items():
+            arr = np.ascontiguousarray(arr)
+            block = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            self.blocks.append(block)
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=block.buf)[...] = arr
+            self._spec[name] = (block.name, arr.shape, arr.dtype.str)
+        return self
+
+    def spec(self):
+        return dict(self._spec)
+
+    def __exit__(self, *exc):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def _attach(spec):
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+
+def _run_shard(fn, spec, lo, hi, kwargs):
+    """Worker side: map the shared arrays, run fn on rows [lo, hi)."""
+    blocks, arrays = _attach(spec)
+    try:
+        return fn({name: arr[lo:hi] for name, arr in arrays.items()}, lo, hi, **kwargs)
+    finally:
+        del arrays
+        for block in blocks:
+            block.close()
+
+
+def shard_bounds(n_rows, workers, min_rows=MIN_SHARD_ROWS):
+    """Contiguous [lo, hi) row ranges, at most one per worker and at least min_rows each."""
+    n_shards = max(1, min(workers, n_rows // max(min_rows, 1)))
+    edges = np.linspace(0, n_rows, n_shards + 1).astype(int)
+    return [(int(lo), int(hi)) for lo, hi in zip(edges[:-1], edges[1:])]
+
+
+def map_shards(fn, arrays, n_rows, workers=None, min_rows=MIN_SHARD_ROWS, **kwargs):
+    """
+    Run fn(arrays_for_rows, lo, hi, **kwargs) over row shards of `arrays`
+    (every array's first axis is the row / ticker axis).
+
+    Returns:
+        list: shard results in row order (one element when running serially)
+    """
+    workers = configured_workers(workers)
+    bounds = shard_bounds(n_rows, workers, min_rows) if workers > 1 else [(0, n_rows)]
+    if len(bounds) == 1:
+        return [fn(arrays, 0, n_rows, **kwargs)]
+    # spawn: the nightly stages run in threads, which fork would copy mid-flight
+    ctx = multiprocessing.get_context('spawn')
+    with SharedArrays(arrays) as shared:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(bounds), mp_context=ctx) as pool:
+            futures = [pool.submit(_run_shard, fn, shared.spec(), lo, hi, kwargs) for lo, hi in bounds]
+            return [f.result() for f in futures]
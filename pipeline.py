@@ -0,0 +1,240 @@
+"""
+Minimal stage-graph runner for the nightly update.
+
+Each stage declares the stages it depends on (its inputs) and the artifacts
+it writes (its outputs). A stage starts as soon as all of its dependencies
+have finished, so independent stages run concurrently; network-bound stages
+still share the process-wide rate limiter. Every stage writes its own
+artifacts, which therefore land on disk as soon as they are ready, and the
+total wall time is bounded by the slowest dependency chain instead of the
+sum of all steps.
+
+If a stage fails, the stages that depend on it are skipped and the rest keep
+running.
+
+With a RunState, every finished stage is checkpointed to disk (its result is
+pickled, or re-read from its outputs by the stage's `load` function). A
+resumed run restores completed stages instead of re-running them; the state
+is cleared once a run completes.
+"""
+import os
+import json
+import time
+import pickle
+import shutil
+import traceback
+import concurrent.futures
+from datetime import datetime
+
+CHECKPOINT_DIR = "data/checkpoints"
+
+
+class Stage:
+    def __init__(self, name, fn, deps=(), outputs=(), load=None, after=()):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.after = tuple(after)  # ordering-only dependencies (results not passed to fn)
+        self.outputs = tuple(outputs)
+        self.load = load  # () -> result, rebuilt from the stage's outputs on resume
+
+    @property
+    def requires(self):
+        """Every stage that must finish first (deps + after)."""
+        return self.deps + tuple(d for d in self.after if d not in self.deps)
+
+
+class RunState:
+    """
+    Checkpoint state of one pipeline run (CHECKPOINT_DIR/state.json).
+
+    state.json: {'started': ISO timestamp, 'completed': {stage: ISO timestamp}}
+    Stage results without a `load` function are pickled next to it.
+    """
+
+    def __init__(self, root=CHECKPOINT_DIR, resume=False):
+        self.root = root
+        self.path = os.path.join(root, "state.json")
+        self.resumed = False
+        self.started = datetime.now()
+        self.completed = {}
+        if resume and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                self.started = datetime.fromisoformat(state['started'])
+                self.completed = state.get('completed', {})
+                self.resumed = True
+                print(f"Resuming run started {self.started} (completed: {', '.join(self.completed) or 'none'})")
+            except Exception as e:
+                print(f"Checkpoint state unreadable, starting a fresh run: {e}")
+        elif resume:
+            print("No checkpoint to resume from, starting a fresh run")
+        if not self.resumed:
+            self.clear()
+        self._save()
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'started': self.started.isoformat(timespec='seconds'), 'completed': self.completed}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def _result_path(self, name):
+        return os.path.join(self.root, f"{name}.pkl")
+
+    def is_done(self, name):
+        return name in self.completed
+
+    def hours_since_start(self):
+        return (datetime.now() - self.started).total_seconds() / 3600
+
+    def mark_done(self, stage, result):
+        if stage.load is None and result is not None:
+            tmp_path = self._result_path(stage.name) + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(result, f)
+            os.replace(tmp_path, self._result_path(stage.name))
+        self.completed[stage.name] = datetime.now().isoformat(timespec='seconds')
+        self._save()
+
+    def restore(self, stage):
+        """Result of a stage completed by the interrupted run."""
+        if stage.load is not None:
+            return stage.load()
+        path = self._result_path(stage.name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class Pipeline:
+    """
+    Usage:
+        p = Pipeline()
+        p.add('candidates', get_candidates, outputs=[])
+        p.add('metrics', calc_metrics, deps=['candidates'], outputs=['data/momentum_cache.csv'])
+        results, status = p.run()
+
+    A stage function is called with the results of its dependencies as
+    keyword arguments named after them: calc_metrics(candidates=[...]).
+    Stages that only have to finish first (their result is not an input)
+    go in after=[...].
+    """
+
+    def __init__(self, name="pipeline"):
+        self.name = name
+        self.stages = {}
+        self.timings = {}  # {stage: seconds} of the current run (filled as stages finish)
+
+    def add(self, name, fn, deps=(), outputs=(), load=None, after=()):
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        self.stages[name] = Stage(name, fn, deps, outputs, load, after)
+        return self
+
+    def stage(self, name, deps=(), outputs=(), load=None, after=()):
+        """Decorator form of add()."""
+        def wrap(fn):
+            self.add(name, fn, deps, outputs, load, after)
+            return fn
+        return wrap
+
+    def validate(self):
+        """Raise ValueError on unknown dependencies or cycles."""
+        for s in self.stages.values():
+            for d in s.requires:
+                if d not in self.stages:
+                    raise ValueError(f"Stage '{s.name}' depends on unknown stage '{d}'")
+        visiting, visited = set(), set()
+
+        def visit(name, path):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle in pipeline: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for d in self.stages[name].requires:
+                visit(d, path + [name])
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name, [])
+
+    def _run_stage(self, stage, inputs):
+        print(f"[{stage.name}] started")
+        t0 = time.perf_counter()
+        result = stage.fn(**inputs)
+        elapsed = time.perf_counter() - t0
+        outputs = f" -> {', '.join(stage.outputs)}" if stage.outputs else ""
+        print(f"[{stage.name}] done in {elapsed:.1f}s{outputs}")
+        return result, elapsed
+
+    def run(self, max_workers=None, state=None):
+        """
+        Run every stage once, as early as its dependencies allow.
+        With a RunState, finished stages are checkpointed and stages completed
+        by a resumed run are restored instead of re-run.
+
+        Returns:
+            tuple: (results {stage: return value}, status {stage: 'done' | 'failed' | 'skipped'})
+        """
+        self.validate()
+        results, status = {}, {}
+        timings = self.timings
+        timings.clear()
+        pending = dict(self.stages)
+        running = {}
+        t0 = time.perf_counter()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or max(1, len(self.stages))) as executor:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    dep_status = [status.get(d) for d in stage.requires]
+                    if any(s in ('failed', 'skipped') for s in dep_status):
+                        status[name] = 'skipped'
+                        del pending[name]
+                        print(f"[{name}] skipped (dependency failed)")
+                    elif all(s == 'done' for s in dep_status):
+                        if state is not None and state.is_done(name):
+                            try:
+                                results[name] = state.restore(stage)
+                                status[name] = 'done'
+                                del pending[name]
+                                print(f"[{name}] restored from checkpoint")
+                                continue
+                            except Exception as e:
+                                print(f"[{name}] checkpoint unusable, re-running: {e}")
+                        inputs = {d: results[d] for d in stage.deps}
+                        running[executor.submit(self._run_stage, stage, inputs)] = name
+                        del pending[name]
+
+                if not running:
+                    continue  # stages were only skipped this round; re-scan what is left
+
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name], timings[name] = future.result()
+                        status[name] = 'done'
+                        if state is not None:
+                            state.mark_done(self.stages[name], results[name])
+                    except Exception as e:
+                        status[name] = 'failed'
+                        print(f"[{name}] FAILED: {e}")
+                        traceback.print_exc()
+
+        if state is not None and all(s == 'done' for s in status.values()):
+            state.clear()
+
+        total = time.perf_counter() - t0
+        summary = ", ".join(f"{n} {timings[n]:.1f}s" for n in self.stages if n in timings)
+        print(f"{self.name} finished in {total:.1f}s ({summary})")
+        return results, status
@@ -0,0 +1,297 @@
+"""
+Dense ticker x date x field price panel.
+
+All tickers share one trading calendar (the union of their dates); values is
+one (tickers, dates, fields) array, and mask marks which (ticker, date) cells
+hold a real bar. Build it once per history snapshot and hand it to the
+indicator / ranking / correlation routines instead of re-assembling the
+per-ticker DataFrames with pd.concat / pd.DataFrame on every call.
+
+PricePanel is also a read-only {ticker: DataFrame} Mapping, so code written
+for the history dict keeps working with it.
+"""
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+from pandas.api.indexers import BaseIndexer
+
+import history_store
+
+FIELDS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+
+class _SegmentWindow(BaseIndexer):
+    """Trailing fixed window that never reaches back past the start of its segment (ticker)."""
+
+    def __init__(self, window_size, segment_starts):
+        super().__init__(window_size=window_size)
+        self.segment_starts = segment_starts  # per position: index of its segment's first value
+
+    def get_window_bounds(self, num_values=0, min_periods=None, center=None, closed=None, step=None):
+        end = np.arange(1, num_values + 1, dtype=np.int64)
+        start = np.maximum(end - self.window_size, self.segment_starts)
+        return start, end
+
+
+def rolling_aligned(values, lengths, window, how='mean'):
+    """
+    Rolling mean / std over each row of a right-aligned (N, width) matrix (see PricePanel.aligned),
+    as Series.rolling(window) would give on each ticker's own bars.
+
+    All rows run through one pandas rolling call: the bars are laid end to end and each
+    window stops at its ticker's first bar, so pandas restarts its running sums there and
+    every value is bit-identical to the per-ticker Series computation.
+
+    Returns:
+        np.ndarray: (N, width), NaN on the padding
+    """
+    n, width = values.shape
+    lengths = np.asarray(lengths, dtype=np.int64)
+    real = np.arange(width)[None, :] >= (width - lengths)[:, None]
+    flat = values[real]
+    seg_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    roller = pd.Series(flat).rolling(_SegmentWindow(window, seg_starts), min_periods=window)
+    out = np.full((n, width), np.nan)
+    out[real] = getattr(roller, how)().to_numpy()
+    return out
+
+
+class PricePanel(Mapping):
+    """
+    values: (N, T, F) float array, NaN where mask is False
+    mask:   (N, T) bool, True where the ticker has a bar on that date
+    tickers / dates / fields, with ticker_index {ticker: i} and date_index {Timestamp: j}
+    """
+
+    def __init__(self, values, mask, tickers, dates, fields=FIELDS, index_name='Date'):
+        self.values = values
+        self.mask = mask
+        self.tickers = list(tickers)
+        self.dates = pd.DatetimeIndex(dates, name=index_name)
+        self.fields = list(fields)
+        self.index_name = index_name
+        self.ticker_index = {t: i for i, t in enumerate(self.tickers)}
+        self.date_index = {d: j for j, d in enumerate(self.dates)}
+        self.field_index = {f: k for k, f in enumerate(self.fields)}
+        self._lengths = None
+        self._layouts = {}  # width -> (target, source) masks of aligned()
+
+    @classmethod
+    def from_history(cls, history, fields=FIELDS, dtype=np.float64):
+        """
+        Build from {ticker: OHLCV DataFrame} or a HistoryStore (read straight from its columns).
+
+        Returns:
+            PricePanel
+        """
+        if isinstance(history, cls):
+            return history
+        if isinstance(history, history_store.HistoryStore):
+            tickers = list(history.offsets)
+            lengths = np.array([history.offsets[t][1] for t in tickers], dtype=np.int64)
+            starts = np.array([history.offsets[t][0] for t in tickers], dtype=np.int64)
+            rows = np.concatenate([np.arange(s, s + n) for s, n in zip(starts, lengths)]) if tickers else np.array([], dtype=np.int64)
+            row_dates = np.asarray(history.dates[rows])
+            columns = {f: (history.arrays[f][rows] if f in history.arrays else None) for f in fields}
+            index_name = history.index_name or 'Date'
+        else:
+            tickers = [t for t, df in history.items() if df is not None and len(df) > 0]
+            lengths = np.array([len(history[t]) for t in tickers], dtype=np.int64)
+            if tickers:
+                row_dates = np.concatenate([history[t].index.values for t in tickers])
+                columns = {f: np.concatenate([history[t][f].to_numpy(dtype=float) if f in history[t].columns
+                                              else np.full(len(history[t]), np.nan) for t in tickers])
+                           for f in fields}
+            else:
+                row_dates = np.array([], dtype='datetime64[ns]')
+                columns = {f: np.array([], dtype=float) for f in fields}
+            index_name = (history[tickers[0]].index.name if tickers else None) or 'Date'
+
+        dates = np.unique(row_dates)
+        ticker_ids = np.repeat(np.arange(len(tickers)), lengths)
+        date_ids = np.searchsorted(dates, row_dates)
+
+        values = np.full((len(tickers), len(dates), len(fields)), np.nan, dtype=dtype)
+        for k, f in enumerate(fields):
+            if columns[f] is not None:
+                values[ticker_ids, date_ids, k] = columns[f]
+        mask = np.zeros((len(tickers), len(dates)), dtype=bool)
+        mask[ticker_ids, date_ids] = True
+        return cls(values, mask, tickers, dates, fields, index_name)
+
+    # --- Mapping: {ticker: DataFrame of its own bars} ---
+
+    def __getitem__(self, ticker):
+        i = self.ticker_index[ticker]
+        rows = self.mask[i]
+        return pd.DataFrame(self.values[i, rows, :].astype(np.float64), index=self.dates[rows],
+                            columns=self.fields)
+
+    def __iter__(self):
+        return iter(self.tickers)
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def __contains__(self, ticker):
+        return ticker in self.ticker_index
+
+    # --- Array access ---
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def field(self, name):
+        """(N, T) view of one field (NaN where there is no bar)."""
+        return self.values[:, :, self.field_index[name]]
+
+    def lengths(self):
+        """Number of bars per ticker (N,)."""
+        if self._lengths is None:
+            self._lengths = self.mask.sum(axis=1)
+        return self._lengths
+
+    def _layout(self, width):
+        """
+        (target, source) bool masks of aligned(): target marks the (N, width) cells that hold a
+        bar, source the (N, T) cells they come from. Rows keep date order, so boolean indexing
+        with the two masks lines the bars up; built once per width (the panel is read-only).
+        """
+        if width not in self._layouts:
+            lengths = self.lengths()
+            source = self.mask
+            if len(lengths) and width < lengths.max():
+                # Keep each ticker's last `width` bars
+                source = source & (np.cumsum(source, axis=1) > (lengths - width)[:, None])
+            target = np.arange(width)[None, :] >= (width - np.minimum(lengths, width))[:, None]
+            self._layouts[width] = (target, source)
+        return self._layouts[width]
+
+    def _width(self, width):
+        lengths = self.lengths()
+        return int(lengths.max()) if width is None and len(lengths) else (width or 0)
+
+    def aligned(self, name, width=None):
+        """
+        (N, width) matrix of one field with each ticker's bars packed to the right
+        (its last bar in the last column, gaps in the shared calendar removed),
+        NaN-padded on the left. This is the layout of compute_period_returns.
+        """
+        width = self._width(width)
+        target, source = self._layout(width)
+        out = np.full((len(self.tickers), width), np.nan, dtype=self.values.dtype)
+        out[target] = self.values[:, :, self.field_index[name]][source]
+        return out
+
+    def aligned_dates(self, width=None):
+        """(N, width) datetime64 matrix matching aligned() (NaT padding)."""
+        width = self._width(width)
+        target, source = self._layout(width)
+        out = np.full((len(self.tickers), width), np.datetime64('NaT'), dtype=self.dates.values.dtype)
+        out[target] = np.broadcast_to(self.dates.values, source.shape)[source]
+        return out
+
+    def truncate(self, end):
+        """
+        Panel up to (excluding) date position `end`, or up to and including a date.
+        Arrays are views unless tickers without a bar by then are dropped (then copied).
+        """
+        if not isinstance(end, (int, np.integer)):
+            end = int(self.dates.searchsorted(pd.Timestamp(end), side='right'))
+        values, mask = self.values[:, :end], self.mask[:, :end]
+        keep = mask.any(axis=1)
+        if not keep.all():
+            values, mask = values[keep], mask[keep]
+        tickers = [t for t, k in zip(self.tickers, keep) if k]
+        return PricePanel(values, mask, tickers, self.dates[:end], self.fields, self.index_name)
+
+    def as_of(self, date, offset=None, dropna=False):
+        """
+        Panel as the history looked on `date`: each ticker's bars up to and including it.
+
+        Args:
+            offset: keep only bars after the ticker's last bar (as of the date) minus this
+                    pd.DateOffset, like PriceStore.load(period)
+            dropna: also leave out bars with a missing field (DataFrame.dropna)
+
+        The price arrays are a view of the date range while every ticker has a bar in the
+        window; tickers without one are dropped with a fancy index, which copies the values of
+        the rest. The window mask is always new, and aligned() / select() copy on top of that.
+        """
+        end = int(self.dates.searchsorted(pd.Timestamp(date), side='right'))
+        mask = self.mask[:, :end]
+        start = 0
+        if offset is not None and end:
+            has_bar = mask.any(axis=1)
+            last = self.dates.values[end - 1 - np.argmax(mask[:, ::-1], axis=1)]
+            cutoff = (pd.DatetimeIndex(last) - offset).values
+            if has_bar.any():
+                start = int(self.dates.searchsorted(cutoff[has_bar].min(), side='right'))
+            mask = mask[:, start:] & (self.dates.values[None, start:end] > cutoff[:, None])
+        values = self.values[:, start:end]
+        if dropna:
+            mask = mask & ~np.isnan(values).any(axis=2)
+        keep = mask.any(axis=1)
+        if not keep.all():
+            values, mask = values[keep], mask[keep]
+        tickers = [t for t, k in zip(self.tickers, keep) if k]
+        return PricePanel(values, mask, tickers, self.dates[start:end], self.fields, self.index_name)
+
+    def select(self, tickers):
+        """Panel restricted to the given tickers (in that order; unknown ones skipped)."""
+        return self.take([self.ticker_index[t] for t in tickers if t in self.ticker_index])
+
+    def take(self, rows):
+        """Panel of the given row positions (in that order; a ticker may appear more than once)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return PricePanel(self.values[rows], self.mask[rows], [self.tickers[i] for i in rows],
+                          self.dates, self.fields, self.index_name)
+
+    @classmethod
+    def stack(cls, panels):
+        """
+        Rows of several panels (e.g. as_of() windows of different dates) in one panel on the
+        union of their calendars. A ticker can occur once per panel, so address the rows by
+        position (take) rather than by ticker (select / the Mapping). Values are copied.
+
+        Returns:
+            PricePanel
+        """
+        panels = list(panels)
+        if not panels:
+            return cls(np.zeros((0, 0, len(FIELDS))), np.zeros((0, 0), dtype=bool), [], [])
+        dates = panels[0].dates
+        for p in panels[1:]:
+            dates = dates.union(p.dates)
+        n = sum(len(p.tickers) for p in panels)
+        first = panels[0]
+        values = np.full((n, len(dates), len(first.fields)), np.nan, dtype=first.values.dtype)
+        mask = np.zeros((n, len(dates)), dtype=bool)
+        row = 0
+        for p in panels:
+            cols = dates.get_indexer(p.dates)
+            values[row:row + len(p.tickers), cols] = p.values
+            mask[row:row + len(p.tickers), cols] = p.mask
+            row += len(p.tickers)
+        tickers = [t for p in panels for t in p.tickers]
+        return cls(values, mask, tickers, dates, first.fields, first.index_name)
+
+    # --- Frames ---
+
+    def to_frame(self, name='Close'):
+        """Wide DataFrame (dates x tickers) of one field."""
+        return pd.DataFrame(self.field(name).T, index=self.dates, columns=self.tickers)
+
+    def to_multiindex(self):
+        """Columns (ticker, field) on the shared calendar, like pd.concat(history.values(), axis=1, keys=...)."""
+        n, t, f = self.values.shape
+        data = self.values.transpose(1, 0, 2).reshape(t, n * f)
+        columns = pd.MultiIndex.from_product([self.tickers, self.fields])
+        return pd.DataFrame(data, index=self.dates, columns=columns)
+
+    def corr(self, name='Close', min_periods=20):
+        """Ticker x ticker correlation of daily returns on the shared calendar."""
+        daily = self.to_frame(name).pct_change(fill_method=None)
+        return daily.corr(min_periods=min_periods)
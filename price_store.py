@@ -0,0 +1,381 @@
+"""
+Persistent per-ticker OHLCV store (data/ohlcv/).
+
+Each ticker lives in its own append-only CSV file, and index.json records the
+last stored bar date per ticker. A nightly update only asks the provider for
+the missing range (usually one bar) and appends it, instead of re-downloading
+a full year for every candidate.
+
+Prices are auto-adjusted (same as yf.download(auto_adjust=True)), so a split or
+dividend silently rewrites the whole past series. Every incremental request
+overlaps the stored tail by a few days; if the overlapping closes no longer
+match, the ticker is re-downloaded in full.
+
+Tickers the provider keeps returning nothing for (delisted / renamed) are
+recorded in the quarantine registry and left out of the download for a while.
+
+as_of(date) answers "what did load_many() return on that day" from one
+in-memory panel of all stored bars, without re-reading or copying prices.
+"""
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import data_provider
+import quarantine
+import price_panel
+from data_provider import OHLCV_COLS, normalize_bars
+
+STORE_DIR = "data/ohlcv"
+INDEX_FILE = "index.json"
+
+# Keep ~2y of bars: 1y for the momentum metrics, plus YTD / 1y returns for indices
+FULL_PERIOD = "2y"
+RETENTION_DAYS = 740
+# Rewrite (trim) files only once they exceed retention by this much
+TRIM_SLACK_DAYS = 30
+
+# Incremental requests start this many calendar days before the last stored bar
+# (covers weekends/holidays so at least one settled bar overlaps)
+OVERLAP_DAYS = 7
+ADJUST_TOLERANCE = 1e-6
+# A ticker whose last bar is this far behind the newest stored bar no longer trades (delisted / halted)
+LIVE_LAG_DAYS = 7
+
+# Period strings accepted by load() (subset of yfinance periods)
+PERIOD_OFFSETS = {
+    '5d': pd.DateOffset(days=7),
+    '1mo': pd.DateOffset(months=1),
+    '3mo': pd.DateOffset(months=3),
+    '6mo': pd.DateOffset(months=6),
+    '1y': pd.DateOffset(years=1),
+    '2y': pd.DateOffset(years=2),
+}
+
+
+class PriceStore:
+    """
+    Append-only OHLCV store keyed by ticker.
+
+    index.json: {ticker: {'last': 'YYYY-MM-DD', 'rows': int, 'updated': ISO timestamp}}
+    """
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self._lock = threading.Lock()
+        self.index = self._load_index()
+        self._panel = None  # (index entries it was built from, PricePanel)
+
+    # --- Index ---
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Price store index unreadable, rebuilding: {e}")
+        return {}
+
+    def save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.index_path)
+
+    def _path(self, ticker):
+        return os.path.join(self.root, data_provider._file_name(ticker) + ".csv")
+
+    def tickers(self):
+        return list(self.index.keys())
+
+    def last_bar(self, ticker):
+        """Date of the last stored bar (pd.Timestamp) or None."""
+        entry = self.index.get(ticker)
+        if not entry or not entry.get('last'):
+            return None
+        return pd.Timestamp(entry['last'])
+
+    def is_fresh(self, ticker, max_age_hours):
+        """True if the ticker was synced with the provider less than max_age_hours ago."""
+        entry = self.index.get(ticker)
+        if not entry or not entry.get('updated'):
+            return False
+        try:
+            updated = datetime.fromisoformat(entry['updated'])
+        except ValueError:
+            return False
+        return datetime.now() - updated < timedelta(hours=max_age_hours)
+
+    # --- Read ---
+
+    def read_all(self, ticker):
+        """Every stored bar for a ticker (empty frame if unknown)."""
+        path = self._path(ticker)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=OHLCV_COLS)
+        try:
+            df = pd.read_csv(path, index_col='Date', parse_dates=['Date'], float_precision='round_trip')
+        except Exception as e:
+            print(f"Price store read failed for {ticker}: {e}")
+            return pd.DataFrame(columns=OHLCV_COLS)
+        return df[OHLCV_COLS]
+
+    def load(self, ticker, period="1y"):
+        """
+        Stored bars for the trailing period, anchored on the last stored bar.
+        Equivalent to yf.download(period=period, auto_adjust=True) from the store.
+        """
+        df = self.read_all(ticker)
+        if df.empty or period in (None, 'max'):
+            return df
+        offset = PERIOD_OFFSETS.get(period)
+        if offset is None:
+            raise ValueError(f"Unsupported period for price store: {period}")
+        cutoff = df.index[-1] - offset
+        return df[df.index > cutoff]
+
+    def load_many(self, tickers, period="1y"):
+        """{ticker: DataFrame} for every ticker with stored data."""
+        history = {}
+        for t in tickers:
+            df = self.load(t, period)
+            if not df.empty:
+                history[t] = df
+        return history
+
+    def panel(self, tickers=None):
+        """
+        Every stored bar of the tickers (default: all stored tickers) as one PricePanel.
+        Kept until one of the tickers is synced again, so as_of() windows share its arrays.
+        """
+        tickers = list(dict.fromkeys(tickers)) if tickers is not None else self.tickers()
+        key = tuple((t, tuple(sorted(self.index.get(t, {}).items()))) for t in tickers)
+        cached = self._panel
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        panel = price_panel.PricePanel.from_history({t: self.read_all(t) for t in tickers})
+        self._panel = (key, panel)
+        return panel
+
+    def as_of(self, date, tickers=None, period="1y", dropna=False):
+        """
+        The store as load_many(tickers, period) would have returned it on `date`: bars up to
+        the date, trailing period anchored on each ticker's last bar by then.
+        dropna: also leave out bars with a missing field
+
+        Returns:
+            PricePanel: window of panel(tickers) (nothing re-read; see PricePanel.as_of for when
+            the arrays are views and when they are copied)
+        """
+        offset = None
+        if period not in (None, 'max'):
+            offset = PERIOD_OFFSETS.get(period)
+            if offset is None:
+                raise ValueError(f"Unsupported period for price store: {period}")
+        return self.panel(tickers).as_of(date, offset=offset, dropna=dropna)
+
+    # --- Write ---
+
+    def write(self, ticker, df):
+        """Replace the stored series for a ticker."""
+        df = normalize_bars(df).dropna()
+        if df.empty:
+            return
+        cutoff = df.index[-1] - pd.Timedelta(days=RETENTION_DAYS)
+        df = df[df.index > cutoff]
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(ticker)
+        tmp_path = path + ".tmp"
+        df.to_csv(tmp_path, index_label='Date')
+        os.replace(tmp_path, path)
+        self._touch(ticker, df.index[-1], len(df))
+
+    def append(self, ticker, new_bars):
+        """
+        Merge new bars into the stored series.
+        Overlapping dates are overwritten (the previous last bar may have been partial).
+
+        Returns:
+            bool: False if the overlap no longer matches (split/dividend re-adjustment),
+                  in which case nothing is written and a full refetch is required.
+        """
+        new_bars = normalize_bars(new_bars).dropna()
+        if new_bars.empty:
+            return True
+
+        last = self.last_bar(ticker)
+        if last is None:
+            self.write(ticker, new_bars)
+            return True
+
+        existing = self.read_all(ticker)
+        if existing.empty:
+            # Indexed but the file is gone / unreadable: the new bars alone would lose the history
+            return False
+        overlap = existing.index.intersection(new_bars.index)
+        # Compare the oldest overlapping bar: it is settled, unlike a possibly intraday last bar
+        if len(overlap) > 1 or (len(overlap) == 1 and overlap[0] < last):
+            d = overlap[0]
+            old_close = existing.at[d, 'Close']
+            new_close = new_bars.at[d, 'Close']
+            if old_close and abs(new_close - old_close) / abs(old_close) > ADJUST_TOLERANCE:
+                return False
+        elif len(overlap) == 0 and new_bars.index[0] > last + pd.Timedelta(days=OVERLAP_DAYS + 7):
+            # Gap in coverage: safer to rebuild than to stitch
+            return False
+
+        fresh = new_bars[new_bars.index > last]
+        revised = new_bars[new_bars.index.isin(overlap)]
+        changed = not revised.empty and not np.allclose(
+            revised.values, existing.loc[revised.index].values, rtol=ADJUST_TOLERANCE, atol=0, equal_nan=True)
+        newest = fresh.index[-1] if not fresh.empty else last
+        too_old = existing.index[0] < newest - pd.Timedelta(days=RETENTION_DAYS + TRIM_SLACK_DAYS)
+
+        if changed or too_old:
+            # Previous tail was revised (partial bar) or retention exceeded -> full rewrite
+            merged = pd.concat([existing[~existing.index.isin(new_bars.index)], new_bars]).sort_index()
+            self.write(ticker, merged)
+        elif not fresh.empty:
+            # Pure append: one line per new bar
+            with open(self._path(ticker), 'a', encoding='utf-8') as f:
+                fresh.to_csv(f, header=False)
+            self._touch(ticker, fresh.index[-1], len(existing) + len(fresh))
+        else:
+            self._touch(ticker, last, len(existing))
+        return True
+
+    def _touch(self, ticker, last_date, rows):
+        with self._lock:
+            self.index[ticker] = {
+                'last': pd.Timestamp(last_date).strftime("%Y-%m-%d"),
+                'rows': int(rows),
+                'updated': datetime.now().isoformat(timespec='seconds'),
+            }
+
+    def mark_checked(self, ticker):
+        """Record a sync with the provider that returned no new bars."""
+        entry = self.index.get(ticker)
+        if entry:
+            with self._lock:
+                entry['updated'] = datetime.now().isoformat(timespec='seconds')
+
+    # --- Sync with provider ---
+
+    def plan_requests(self, tickers, max_age_hours=None):
+        """
+        Group tickers by the start date they need.
+
+        Returns:
+            dict: {start_date_str or None: [tickers]} (None = no stored data, full download)
+        """
+        groups = {}
+        for t in tickers:
+            if max_age_hours is not None and self.is_fresh(t, max_age_hours):
+                continue
+            last = self.last_bar(t)
+            start = None
+            if last is not None:
+                start = (last - pd.Timedelta(days=OVERLAP_DAYS)).strftime("%Y-%m-%d")
+            groups.setdefault(start, []).append(t)
+        return groups
+
+    def update(self, tickers, max_age_hours=None, provider=None):
+        """
+        Bring the store up to date for the given tickers, fetching only missing bars.
+        Chunk size and pacing come from the provider (yfinance: shared adaptive rate limiter).
+
+        Returns:
+            dict: stats {'requested', 'incremental', 'full', 'refetched', 'failed', 'quarantined'}
+        """
+        provider = provider or data_provider.get_provider()
+        registry = quarantine.get_registry()
+        stats = {'requested': 0, 'incremental': 0, 'full': 0, 'refetched': 0, 'failed': 0, 'quarantined': 0}
+        tickers, skipped = registry.filter(tickers, 'prices')
+        stats['quarantined'] = len(skipped)
+        groups = self.plan_requests(tickers, max_age_hours=max_age_hours)
+        needs_full = list(groups.pop(None, []))
+
+        for start, group in sorted(groups.items()):
+            print(f"  Incremental fetch for {len(group)} tickers since {start}...")
+            for chunk, batch in self._download_chunks(group, provider, start=start):
+                stats['requested'] += len(chunk)
+                # Requests overlap the stored tail, so a live ticker always gets bars back.
+                # Nothing for a ticker while its peers got data -> the provider has no data for it.
+                peers_ok = batch is not None and any(batch.get(t) is not None for t in chunk)
+                for t in chunk:
+                    bars = (batch or {}).get(t)
+                    if bars is None:
+                        # Keep what we have
+                        self.mark_checked(t)
+                        if peers_ok:
+                            registry.record_failure(t, 'prices', "no bars returned (incremental)")
+                        continue
+                    registry.record_success(t, 'prices')
+                    if self.append(t, bars):
+                        stats['incremental'] += 1
+                    else:
+                        needs_full.append(t)
+                        stats['refetched'] += 1
+                self.save_index()
+
+        if needs_full:
+            print(f"  Full history fetch for {len(needs_full)} tickers...")
+        for chunk, batch in self._download_chunks(needs_full, provider, period=FULL_PERIOD):
+            stats['requested'] += len(chunk)
+            for t in chunk:
+                bars = (batch or {}).get(t)
+                if bars is None:
+                    stats['failed'] += 1
+                    if batch is not None:  # a failed request says nothing about the ticker
+                        registry.record_failure(t, 'prices', "no bars returned (full history)")
+                    continue
+                registry.record_success(t, 'prices')
+                self.write(t, bars)
+                stats['full'] += 1
+            self.save_index()
+
+        registry.save()
+        return stats
+
+    def live_tickers(self, max_lag_days=LIVE_LAG_DAYS):
+        """Stored tickers whose last bar is within max_lag_days of the newest stored bar."""
+        lasts = {t: self.last_bar(t) for t in self.tickers()}
+        lasts = {t: d for t, d in lasts.items() if d is not None}
+        if not lasts:
+            return set()
+        newest = max(lasts.values())
+        return {t for t, d in lasts.items() if (newest - d).days <= max_lag_days}
+
+    def _download_chunks(self, tickers, provider, start=None, period=None):
+        """Yield (chunk, {ticker: bars} or None if the request failed) using the provider's current chunk size."""
+        # Tickers that should come back with bars: an all-empty chunk containing one means throttling
+        known_good = self.live_tickers()
+        i = 0
+        while i < len(tickers):
+            chunk = tickers[i:i + provider.chunk_size]
+            try:
+                batch = provider.download(chunk, start=start, period=period, known_good=known_good)
+            except Exception as e:
+                print(f"Batch fetch failed: {e}")
+                batch = None
+            i += len(chunk)
+            yield chunk, batch
+
+
+_default_store = None
+
+
+def get_store():
+    """Shared PriceStore instance (data/ohlcv)."""
+    global _default_store
+    if _default_store is None:
+        _default_store = PriceStore()
+    return _default_store
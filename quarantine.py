@@ -0,0 +1,228 @@
+"""
+Quarantine registry for tickers that keep failing (data/quarantine.json).
+
+Failures are recorded per ticker and per endpoint ('prices', 'info',
+'calendar', 'metrics') with the reason. After QUARANTINE_AFTER consecutive
+failures a ticker is skipped on that endpoint for an exponentially growing
+interval (1, 2, 4 ... days, capped); one success clears it. Delisted or
+broken symbols therefore stop costing requests every night, but are still
+retried now and then in case they come back.
+
+Rate-limit errors (HTTP 429) say nothing about the ticker and are ignored.
+'metrics' failures (errors computing a ticker's metrics from stored bars)
+cost no requests; they are recorded for visibility but never skipped.
+
+Usage:
+    python quarantine.py                   # what is quarantined and how many requests it saved
+    python quarantine.py --endpoint info
+    python quarantine.py --release SENT    # clear a ticker (all endpoints)
+"""
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+import rate_limiter
+import reference_cache
+
+QUARANTINE_PATH = "data/quarantine.json"
+
+ENDPOINTS = ('prices', 'info', 'calendar', 'metrics')
+# Endpoints whose failures are only recorded (no request to save)
+RECORD_ONLY_ENDPOINTS = {'metrics'}
+
+# Consecutive failures before a ticker is skipped at all (one failure may be transient)
+QUARANTINE_AFTER = 2
+# Skip for 1, 2, 4 ... days after that (capped)
+QUARANTINE_BASE_DAYS = 1
+QUARANTINE_MAX_DAYS = 32
+# Entries that have not failed for this long are dropped
+QUARANTINE_PRUNE_DAYS = 180
+
+REASON_MAX_CHARS = 200
+
+
+def _reason(error):
+    if isinstance(error, BaseException):
+        text = f"{type(error).__name__}: {error}"
+    else:
+        text = str(error)
+    return text[:REASON_MAX_CHARS]
+
+
+def backoff_days(failures):
+    """Days a ticker is skipped after `failures` consecutive failures (0 = not quarantined)."""
+    if failures < QUARANTINE_AFTER:
+        return 0
+    return min(QUARANTINE_MAX_DAYS, QUARANTINE_BASE_DAYS * 2 ** (failures - QUARANTINE_AFTER))
+
+
+class QuarantineRegistry(reference_cache.JsonCache):
+    """
+    {ticker: {endpoint: {'failures': int, 'reason': str, 'first_failed': ISO timestamp,
+                         'last_failed': ISO timestamp, 'until': ISO timestamp or None,
+                         'skipped': int}}}
+    'skipped' counts the requests saved by skipping the ticker on that endpoint.
+    """
+
+    def __init__(self, path=QUARANTINE_PATH):
+        super().__init__(path)
+        self._run_skipped = {}  # endpoint -> skips in this process
+        self._run_lock = threading.Lock()
+
+    def is_quarantined(self, ticker, endpoint, now=None):
+        if endpoint in RECORD_ONLY_ENDPOINTS:
+            return False
+        entry = (self.data.get(ticker) or {}).get(endpoint)
+        if not entry or not entry.get('until'):
+            return False
+        try:
+            return (now or datetime.now()) < datetime.fromisoformat(entry['until'])
+        except ValueError:
+            return False
+
+    def filter(self, tickers, endpoint):
+        """
+        Split tickers into (allowed, skipped) for an endpoint and count the skips.
+
+        Returns:
+            tuple: (allowed list, skipped list), both in input order
+        """
+        now = datetime.now()
+        allowed, skipped = [], []
+        for t in tickers:
+            (skipped if self.is_quarantined(t, endpoint, now) else allowed).append(t)
+        if skipped:
+            with self._lock:
+                for t in skipped:
+                    entry = self.data[t][endpoint]
+                    entry['skipped'] = entry.get('skipped', 0) + 1
+            with self._run_lock:
+                self._run_skipped[endpoint] = self._run_skipped.get(endpoint, 0) + len(skipped)
+        return allowed, skipped
+
+    def record_failure(self, ticker, endpoint, error):
+        """
+        Count a failure (exception or reason string). Rate-limit errors are ignored.
+
+        Returns:
+            bool: True if the ticker is now quarantined on this endpoint
+        """
+        if isinstance(error, BaseException) and rate_limiter.is_rate_limit_error(error):
+            return False
+        now = datetime.now()
+        with self._lock:
+            entry = self.data.setdefault(ticker, {}).setdefault(endpoint, {})
+            entry['failures'] = entry.get('failures', 0) + 1
+            entry['reason'] = _reason(error)
+            entry.setdefault('first_failed', now.isoformat(timespec='seconds'))
+            entry['last_failed'] = now.isoformat(timespec='seconds')
+            entry.setdefault('skipped', 0)
+            days = 0 if endpoint in RECORD_ONLY_ENDPOINTS else backoff_days(entry['failures'])
+            entry['until'] = (now + timedelta(days=days)).isoformat(timespec='seconds') if days else None
+            self._unsaved += 1
+        return days > 0
+
+    def record_success(self, ticker, endpoint):
+        """The endpoint answered for this ticker: clear its failure history there."""
+        if endpoint not in (self.data.get(ticker) or {}):
+            return
+        with self._lock:
+            endpoints = self.data.get(ticker) or {}
+            if endpoints.pop(endpoint, None) is not None:
+                self._unsaved += 1
+            if not endpoints:
+                self.data.pop(ticker, None)
+
+    def release(self, ticker, endpoint=None):
+        """Manually clear a ticker (one endpoint or all)."""
+        with self._lock:
+            if endpoint is None:
+                return self.data.pop(ticker, None) is not None
+            endpoints = self.data.get(ticker) or {}
+            found = endpoints.pop(endpoint, None) is not None
+            if ticker in self.data and not endpoints:
+                del self.data[ticker]
+            return found
+
+    def prune(self, max_age_days=QUARANTINE_PRUNE_DAYS):
+        """Drop failure records older than max_age_days."""
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat(timespec='seconds')
+        with self._lock:
+            for t in list(self.data):
+                endpoints = self.data[t]
+                for ep in [ep for ep, e in endpoints.items() if e.get('last_failed', '') < cutoff]:
+                    del endpoints[ep]
+                if not endpoints:
+                    del self.data[t]
+
+    def entries(self, endpoint=None):
+        """Flat list of failure records (optionally for one endpoint)."""
+        rows = []
+        now = datetime.now()
+        for t, endpoints in self.data.items():
+            for ep, e in endpoints.items():
+                if endpoint is not None and ep != endpoint:
+                    continue
+                rows.append(dict(e, ticker=t, endpoint=ep, active=self.is_quarantined(t, ep, now)))
+        return rows
+
+    def stats(self):
+        """
+        Returns:
+            dict: {endpoint: {'failing', 'quarantined', 'skipped_total', 'skipped_this_run'}}
+        """
+        out = {}
+        for row in self.entries():
+            s = out.setdefault(row['endpoint'], {'failing': 0, 'quarantined': 0,
+                                                 'skipped_total': 0, 'skipped_this_run': 0})
+            s['failing'] += 1
+            s['quarantined'] += int(row['active'])
+            s['skipped_total'] += row.get('skipped', 0)
+        with self._run_lock:
+            for ep, n in self._run_skipped.items():
+                out.setdefault(ep, {'failing': 0, 'quarantined': 0,
+                                    'skipped_total': 0, 'skipped_this_run': 0})['skipped_this_run'] = n
+        return out
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Process-wide registry (data/quarantine.json)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = QuarantineRegistry()
+        return _registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or edit the failing-ticker quarantine")
+    parser.add_argument('--endpoint', choices=ENDPOINTS, help="only this endpoint")
+    parser.add_argument('--release', metavar='TICKER', help="clear a ticker (with --endpoint: only there)")
+    args = parser.parse_args()
+
+    registry = get_registry()
+    if args.release:
+        if registry.release(args.release, args.endpoint):
+            registry.save()
+            print(f"Released {args.release}")
+        else:
+            print(f"{args.release} is not in the quarantine")
+        return
+
+    rows = sorted(registry.entries(args.endpoint), key=lambda r: (r['endpoint'], -r['failures'], r['ticker']))
+    for r in rows:
+        status = f"until {r['until']}" if r['active'] else "retrying"
+        print(f"{r['endpoint']:<9} {r['ticker']:<8} failures={r['failures']:<3} skipped={r.get('skipped', 0):<4} "
+              f"{status:<27} {r['reason']}")
+    for ep, s in sorted(registry.stats().items()):
+        if args.endpoint is None or ep == args.endpoint:
+            print(f"{ep}: {s['failing']} failing, {s['quarantined']} quarantined, "
+                  f"{s['skipped_total']} requests saved so far")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Rank history: period returns, top-N ranks and RVOL of every ticker on each
+of the last K dates of a price panel, computed in one vectorized pass.
+
+Day d (0 = the panel's last date, 1 = the date before, ...) sees each ticker
+as of that calendar date, exactly like the ranking on panel.truncate(...):
+returns and RVOL are taken on the ticker's own last bar up to that date, and
+the same penny filter decides which tickers are ranked. Instead of
+re-running the ranking per day, every ticker's bar position on each of the K
+dates is computed once and all returns are gathered from the aligned close
+matrix, so persistence questions are cheap queries on (K, N) arrays:
+
+    ranks = RankHistory.build(panel, STOCK_RETURN_LOOKBACKS, static=STATIC_MOMENTUM_WATCHLIST)
+    ranks.persistent('3mo', top_n=10, days=3, min_rvol=2.0)   # top 10 three days running, RVOL >= 2
+    ranks.streaks('1mo', top_n=20)                             # consecutive days in the top 20
+"""
+import numpy as np
+import pandas as pd
+
+import price_panel
+
+# Dates kept by default (persistence queries up to this many days)
+DEFAULT_DAYS = 20
+# Penny filter of the ranking (static watchlist tickers always pass)
+MIN_PRICE = 2.0
+MIN_VOLUME = 200000
+RVOL_WINDOW = 20
+
+
+class RankHistory:
+    """
+    dates:    the K dates, newest first
+    tickers:  N tickers
+    returns:  {period: (K, N) float} (%; NaN where the ticker is not ranked that day)
+    rvol:     (K, N) float (0 with <= 21 bars, as the ranking)
+    eligible: (K, N) bool, ticker has a bar by that date and passes the penny filter
+    """
+
+    def __init__(self, dates, tickers, returns, rvol, eligible):
+        self.dates = pd.DatetimeIndex(dates)
+        self.tickers = list(tickers)
+        self.returns = returns
+        self.rvol = rvol
+        self.eligible = eligible
+        self._ranks = {}
+
+    @classmethod
+    def build(cls, history, lookbacks, static=(), days=DEFAULT_DAYS):
+        """
+        Args:
+            history: PricePanel, HistoryStore or {ticker: OHLCV DataFrame}
+            lookbacks: {period: (k, short)} (see market_logic.STOCK_RETURN_LOOKBACKS); 'YTD' is added
+            static: tickers that skip the penny filter
+            days: number of dates (the last `days` dates of the panel's calendar)
+
+        Returns:
+            RankHistory
+        """
+        panel = price_panel.PricePanel.from_history(history)
+        n_dates = len(panel.dates)
+        days = max(0, min(days, n_dates))
+        tickers = panel.tickers
+        n = len(tickers)
+        lengths = panel.lengths()
+        width = int(lengths.max()) if n else 0
+        close = panel.aligned('Close').astype(float)
+        volume = panel.aligned('Volume').astype(float)
+        first_open = panel.aligned('Open').astype(float)[np.arange(n), width - lengths] if n else np.zeros(0)
+        bar_dates = panel.aligned_dates()
+        years = np.where(np.isnat(bar_dates), np.iinfo(np.int32).max,
+                         bar_dates.astype('datetime64[Y]').astype(np.int64) + 1970)
+
+        # Bars of each ticker up to each of the K dates (newest first) and the position of the last one
+        ends = n_dates - np.arange(days)
+        counts = np.cumsum(panel.mask, axis=1)[:, ends - 1].T if days and n else np.zeros((days, n), dtype=np.int64)
+        start = width - lengths
+        pos = np.maximum(start[None, :] + counts - 1, 0)
+        cols = np.broadcast_to(np.arange(n), (days, n))
+        present = counts > 0
+
+        last = close[cols, pos]
+        first = close[cols, np.broadcast_to(start, (days, n))] if n else np.zeros((days, n))
+        static = set(t.upper() for t in static)
+        is_static = np.array([t.upper() in static for t in tickers], dtype=bool)
+        eligible = present & (is_static[None, :] | ((last >= MIN_PRICE) & (volume[cols, pos] >= MIN_VOLUME)))
+
+        returns = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for period, (k, short) in lookbacks.items():
+                ok = counts >= k
+                base = np.where(ok, close[cols, np.maximum(pos - (k - 1), 0)], first)
+                ret = (last - base) / base * 100
+                if short == 'zero':
+                    ret = np.where(ok, ret, 0.0)
+                returns[period] = ret
+
+            # YTD vs last close of the previous year (new listings: first Open of the year)
+            year = years[cols, pos]
+            n_before = (years[None, :, :] < year[:, :, None]).sum(axis=2) if n else np.zeros((days, n), dtype=np.int64)
+            base = np.where(n_before > 0, close[cols, np.maximum(start[None, :] + n_before - 1, 0)], first_open[None, :])
+            returns['YTD'] = (last - base) / base * 100
+
+            # RVOL = volume of the day's bar / mean of the 20 bars before it
+            window = pos[:, :, None] - RVOL_WINDOW + np.arange(RVOL_WINDOW)[None, None, :]
+            avg_vol = volume[cols[:, :, None], np.maximum(window, 0)].mean(axis=2)
+            rvol = volume[cols, pos] / avg_vol
+        ok = (counts > RVOL_WINDOW + 1) & ~np.isnan(avg_vol) & (avg_vol != 0)
+        rvol = np.where(ok, rvol, 0.0)
+
+        returns = {period: np.where(eligible, ret, np.nan) for period, ret in returns.items()}
+        dates = panel.dates[ends - 1] if days else panel.dates[:0]
+        return cls(dates, tickers, returns, rvol, eligible)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def ranks(self, period):
+        """
+        (K, N) rank of each ticker by the period return on each day (1 = best, 0 = not ranked).
+        Ties keep the panel's ticker order; NaN returns rank after every number.
+        """
+        if period not in self._ranks:
+            ret = self.returns[period]
+            order = np.argsort(np.where(np.isnan(ret), np.inf, -ret), axis=1, kind='stable')
+            ranks = np.empty_like(order)
+            np.put_along_axis(ranks, order, np.arange(1, ret.shape[1] + 1)[None, :], axis=1)
+            self._ranks[period] = np.where(self.eligible, ranks, 0)
+        return self._ranks[period]
+
+    def top(self, period, top_n):
+        """(K, N) bool: in the top N of the day."""
+        ranks = self.ranks(period)
+        return (ranks > 0) & (ranks <= top_n)
+
+    def streaks(self, period, top_n):
+        """(N,) consecutive days in the top N, counting back from the last date."""
+        return np.cumprod(self.top(period, top_n), axis=0).sum(axis=0)
+
+    def persistent(self, period, top_n=10, days=3, min_rvol=0.0):
+        """
+        Tickers in the top N for each of the last `days` dates, with RVOL >= min_rvol on the last date.
+
+        Returns:
+            pd.DataFrame: index=ticker, Rank / Gain / RVOL / Streak of the last date, in rank order
+        """
+        if days < 1 or days > len(self):
+            return pd.DataFrame(columns=['Rank', 'Gain', 'RVOL', 'Streak'])
+        streak = self.streaks(period, top_n)
+        hit = (streak >= days) & (self.rvol[0] >= min_rvol)
+        idx = np.flatnonzero(hit)
+        idx = idx[np.argsort(self.ranks(period)[0, idx], kind='stable')]
+        return pd.DataFrame({
+            'Rank': self.ranks(period)[0, idx],
+            'Gain': self.returns[period][0, idx],
+            'RVOL': self.rvol[0, idx],
+            'Streak': streak[idx],
+        }, index=[self.tickers[i] for i in idx])
+
+    def as_frame(self, period):
+        """Long frame: Date, Ticker, Return, Rank, RVOL for every ranked ticker on every day."""
+        k, i = np.nonzero(self.eligible)
+        return pd.DataFrame({
+            'Date': self.dates[k],
+            'Ticker': [self.tickers[j] for j in i],
+            'Return': self.returns[period][k, i],
+            'Rank': self.ranks(period)[k, i],
+            'RVOL': self.rvol[k, i],
+        })
@@ -0,0 +1,159 @@
+"""
+Shared adaptive rate limiter for Yahoo Finance requests.
+
+Token bucket (requests/sec) with additive-increase / multiplicative-decrease
+(AIMD) control, like TCP congestion control:
+- every successful response nudges the request rate, the allowed number of
+  in-flight requests and the bulk download chunk size up a little,
+- an HTTP 429 (or a bulk download of several tickers, including ones known to
+  trade, that comes back completely empty, which is how yf.download reports
+  throttling) halves all three and pauses every caller for a cooldown that
+  doubles while the throttling persists.
+
+So a run takes as long as the provider's real limit requires instead of a
+hardcoded worst-case sleep.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+def is_rate_limit_error(exc):
+    """True if the exception means the provider is throttling us (HTTP 429)."""
+    if type(exc).__name__ == 'YFRateLimitError':
+        return True
+    msg = str(exc)
+    return '429' in msg or 'Too Many Requests' in msg or 'Rate limited' in msg
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, rate=2.0, min_rate=0.25, max_rate=20.0, burst=5.0,
+                 concurrency=2, max_concurrency=16,
+                 chunk_size=10, min_chunk_size=2, max_chunk_size=100,
+                 rate_step=0.25, chunk_step=2, decrease=0.5,
+                 cooldown=15.0, max_cooldown=300.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.rate_step = rate_step
+        self.chunk_step = chunk_step
+        self.decrease = decrease
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._cooldown = cooldown
+        self._streak = 0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._stats = {'requests': 0, 'successes': 0, 'throttled': 0, 'waited_sec': 0.0}
+
+    # --- Token bucket ---
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self, n=1):
+        """Block until n request tokens are available (and any throttle cooldown has passed)."""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            # Reserve now, pay the deficit by sleeping (tokens may go negative)
+            self._tokens -= n
+            wait = max(0.0, -self._tokens / self.rate, self._blocked_until - now)
+            self._stats['requests'] += n
+            self._stats['waited_sec'] += wait
+        if wait > 0:
+            time.sleep(wait)
+
+    @contextmanager
+    def slot(self):
+        """Limit the number of in-flight requests to the current concurrency."""
+        with self._cond:
+            while self._in_flight >= self.concurrency:
+                self._cond.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    # --- AIMD feedback ---
+
+    def on_success(self):
+        with self._cond:
+            self._stats['successes'] += 1
+            self._streak += 1
+            self._cooldown = self.base_cooldown
+            self.rate = min(self.max_rate, self.rate + self.rate_step)
+            self.chunk_size = min(self.max_chunk_size, self.chunk_size + self.chunk_step)
+            # One more worker after a full round of successes at the current width
+            if self._streak >= self.concurrency and self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+                self._streak = 0
+                self._cond.notify_all()
+
+    def on_throttle(self, reason=""):
+        with self._cond:
+            self._stats['throttled'] += 1
+            self._streak = 0
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.concurrency = max(1, int(self.concurrency * self.decrease))
+            self.chunk_size = max(self.min_chunk_size, int(self.chunk_size * self.decrease))
+            self._blocked_until = max(self._blocked_until, time.monotonic() + self._cooldown)
+            self._tokens = min(self._tokens, 0.0)
+            cooldown = self._cooldown
+            self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+        print(f"  Rate limited{f' ({reason})' if reason else ''}: backing off {cooldown:.0f}s "
+              f"-> {self.rate:.2f} req/s, {self.concurrency} workers, chunk {self.chunk_size}")
+
+    # --- Call wrapper ---
+
+    def call(self, fn, *args, cost=1, retries=3, **kwargs):
+        """
+        Run fn(*args, **kwargs) as one (or `cost`) rate-limited request.
+        Rate limit errors trigger backoff and a retry; other errors propagate.
+        """
+        for attempt in range(retries + 1):
+            with self.slot():
+                self.acquire(cost)
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    if is_rate_limit_error(e) and attempt < retries:
+                        self.on_throttle(type(e).__name__)
+                        continue
+                    raise
+            self.on_success()
+            return result
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s.update({'rate': round(self.rate, 2), 'concurrency': self.concurrency, 'chunk_size': self.chunk_size})
+        s['waited_sec'] = round(s['waited_sec'], 1)
+        return s
+
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+
+def get_limiter():
+    """Process-wide limiter shared by every data path (download, .info, .calendar, .history)."""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = AdaptiveRateLimiter()
+        return _shared_limiter
@@ -0,0 +1,396 @@
+"""
+Persistent reference-data caches (slow-changing per-ticker data), stored in
+the SQLite reference store (data/reference.db, see reference_store.py).
+Saving writes only the tickers that changed since the last save.
+
+FundamentalsCache (kind 'fundamentals')
+    Fields used by the crash-risk / scoring logic, each with its own TTL.
+    Only tickers with at least one expired field are re-fetched with .info.
+    Ownership / float / valuation fields also expire when an earnings date
+    has passed since the last fetch.
+
+MetadataCache (kind 'metadata', read by the app)
+    Name / industry / summary. Only new tickers, entries with empty fields and
+    entries past the staleness horizon are re-fetched; results are merged in.
+
+EarningsCalendar (kind 'earnings', read by the app)
+    Next earnings date per ticker. A ticker is only re-checked when its date
+    is missing, has passed or is close; tickers that return nothing are
+    retried on exponential backoff.
+"""
+import os
+import json
+import zlib
+import threading
+from datetime import datetime, timedelta
+
+import reference_store
+
+# Legacy JSON files (imported into an empty reference store once; the files are left alone)
+FUNDAMENTALS_PATH = "data/fundamentals_cache.json"
+METADATA_PATH = "data/metadata_cache.json"
+# {ticker: 'YYYY-MM-DD' or '-'} (tracked) / per-ticker check state written by later versions
+EARNINGS_PATH = "data/earnings_cache.json"
+EARNINGS_STATE_PATH = "data/earnings_state.json"
+
+# .info field -> max age in days
+FIELD_TTL_DAYS = {
+    'shortRatio': 15,               # short interest is published twice a month
+    'beta': 30,
+    'forwardPE': 30,
+    'marketCap': 90,
+    'heldPercentInstitutions': 90,
+    'heldPercentInsiders': 90,
+    'floatShares': 90,
+}
+
+# Fields that change with quarterly filings -> also refresh after each earnings date
+EARNINGS_REFRESH_FIELDS = {'floatShares', 'heldPercentInstitutions', 'heldPercentInsiders', 'marketCap', 'forwardPE'}
+
+# Price-dependent fields are rescaled by (current price / price at fetch) between refreshes
+PRICE_SCALED_FIELDS = {'forwardPE', 'marketCap'}
+
+# Metadata: names/industries almost never change
+METADATA_MAX_AGE_DAYS = 90
+# Entries with empty fields (fetch failed, or the provider has nothing) are retried sooner
+METADATA_RETRY_DAYS = 7
+# Tickers that left the universe are dropped after this long
+METADATA_PRUNE_DAYS = 365
+
+# Earnings: dates inside this window are re-checked every few days (they get confirmed / moved)
+EARNINGS_NEAR_DAYS = 7
+EARNINGS_NEAR_RECHECK_DAYS = 2
+# Never re-check the same ticker more often than this
+EARNINGS_MIN_RECHECK_HOURS = 20
+# Far-off dates are still re-checked occasionally
+EARNINGS_FAR_RECHECK_DAYS = 45
+# Empty results: retry after 1, 2, 4, ... days (capped)
+EARNINGS_BACKOFF_BASE_DAYS = 1
+EARNINGS_BACKOFF_MAX_DAYS = 64
+
+# Long fetch loops save the cache every N updates, so a crashed run keeps its progress
+CHECKPOINT_EVERY = 50
+
+# Spread refreshes over several nights instead of expiring the whole universe at once
+TTL_JITTER = 0.2
+
+
+def _now():
+    return datetime.now()
+
+
+def _jitter(ticker):
+    # Deterministic per ticker (crc32 is stable across processes)
+    return 1.0 - TTL_JITTER * (zlib.crc32(ticker.encode('utf-8')) % 1000) / 1000.0
+
+
+def load_earnings_dates(store=None):
+    """{ticker: datetime} from the earnings calendar (unknown entries skipped)."""
+    try:
+        return EarningsCalendar(store=store).dates()
+    except Exception:
+        return {}
+
+
+def _earnings_entries(dates, path):
+    """data/earnings_cache.json ({ticker: date or '-'}) -> calendar entries, checked when the file was written."""
+    checked_at = datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec='seconds')
+    return {t: {'date': d if d not in (None, '', '-') else None, 'checked_at': checked_at,
+                'misses': 0 if d not in (None, '', '-') else 1}
+            for t, d in dates.items()}
+
+
+def _age_days(entry, now):
+    """Days since entry['fetched_at'] (None if never fetched)."""
+    try:
+        return (now - datetime.fromisoformat(entry['fetched_at'])).total_seconds() / 86400
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class JsonCache:
+    """Dict-of-entries cache persisted as one JSON file (atomic replace on save)."""
+    indent = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.data = self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Cache unreadable, starting fresh ({self.path}): {e}")
+        return {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=self.indent, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self._unsaved = 0
+
+    def checkpoint(self, every=CHECKPOINT_EVERY):
+        """Count one update and save every `every` updates (crash-safe progress)."""
+        with self._lock:
+            self._unsaved += 1
+            due = self._unsaved >= every
+        if due:
+            self.save()
+
+    def __contains__(self, ticker):
+        return ticker in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class _TrackedDict(dict):
+    """dict that remembers which keys were set / deleted (entries are replaced, never mutated)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.changed = set()
+        self.removed = set()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.changed.add(key)
+        self.removed.discard(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.changed.discard(key)
+        self.removed.add(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self.changed.discard(key)
+            self.removed.add(key)
+        return super().pop(key, *default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+
+class SqliteCache(JsonCache):
+    """
+    Same interface as JsonCache, backed by one kind of the reference store.
+    The entries are loaded once; save() upserts / deletes only the changed tickers.
+    """
+
+    def __init__(self, kind, legacy_path=None, store=None, convert=None):
+        self.kind = kind
+        self.store = store if store is not None else reference_store.get_store()
+        if legacy_path:
+            self.store.import_json(kind, legacy_path, convert=convert)
+        super().__init__(self.store.path)
+
+    def _load(self):
+        return _TrackedDict(self.store.load_all(self.kind))
+
+    def save(self):
+        with self._lock:
+            changed = {t: self.data[t] for t in self.data.changed if t in self.data}
+            removed = list(self.data.removed)
+            self.store.upsert_many(self.kind, changed)
+            self.store.delete_many(self.kind, removed)
+            self.data.changed.clear()
+            self.data.removed.clear()
+            self._unsaved = 0
+
+
+class FundamentalsCache(SqliteCache):
+    """
+    {ticker: {'fetched_at': ISO timestamp, 'ref_price': float, 'fields': {field: value}}}
+    """
+
+    def __init__(self, store=None):
+        super().__init__(reference_store.FUNDAMENTALS, FUNDAMENTALS_PATH, store)
+
+    def stale_fields(self, ticker, earnings_dates=None, now=None):
+        """Fields of a ticker that must be re-fetched (all of them if unknown)."""
+        entry = self.data.get(ticker)
+        now = now or _now()
+        age_days = _age_days(entry, now) if entry else None
+        if age_days is None:
+            return set(FIELD_TTL_DAYS)
+        fetched_at = datetime.fromisoformat(entry['fetched_at'])
+        scale = _jitter(ticker)
+        stale = {f for f, ttl in FIELD_TTL_DAYS.items() if age_days >= ttl * scale}
+
+        # An earnings report since the last fetch invalidates filing-based fields
+        earnings = (earnings_dates or {}).get(ticker)
+        if earnings is not None and fetched_at < earnings + timedelta(days=1) <= now:
+            stale |= EARNINGS_REFRESH_FIELDS
+        return stale
+
+    def stale_tickers(self, tickers, earnings_dates=None):
+        now = _now()
+        return [t for t in tickers if self.stale_fields(t, earnings_dates, now)]
+
+    def put(self, ticker, info, price=None):
+        """Store the tracked fields from an .info dict."""
+        fields = {f: info.get(f) for f in FIELD_TTL_DAYS}
+        with self._lock:
+            self.data[ticker] = {
+                'fetched_at': _now().isoformat(timespec='seconds'),
+                'ref_price': float(price) if price else None,
+                'fields': fields,
+            }
+
+    def get(self, ticker, price=None):
+        """
+        Cached fields for a ticker (empty dict if unknown).
+        Price-dependent fields are rescaled to the given current price.
+        """
+        entry = self.data.get(ticker)
+        if not entry:
+            return {}
+        fields = dict(entry.get('fields', {}))
+        ref_price = entry.get('ref_price')
+        if price and ref_price:
+            ratio = float(price) / ref_price
+            for f in PRICE_SCALED_FIELDS:
+                if fields.get(f):
+                    fields[f] = fields[f] * ratio
+            if fields.get('marketCap'):
+                fields['marketCap'] = int(round(fields['marketCap']))
+        return fields
+
+
+class MetadataCache(SqliteCache):
+    """
+    {ticker: {'name': str, 'industry': str, 'summary': str, 'fetched_at': ISO timestamp}}
+    Entries without 'fetched_at' (older cache files) count as stale.
+    """
+
+    def __init__(self, store=None):
+        super().__init__(reference_store.METADATA, METADATA_PATH, store)
+
+    @staticmethod
+    def is_complete(ticker, entry):
+        return bool(entry.get('name')) and entry.get('name') != ticker \
+            and bool(entry.get('industry')) and bool(entry.get('summary'))
+
+    def needs_refresh(self, ticker, now=None):
+        entry = self.data.get(ticker)
+        if not entry:
+            return True
+        age_days = _age_days(entry, now or _now())
+        if age_days is None:
+            return True
+        horizon = METADATA_MAX_AGE_DAYS if self.is_complete(ticker, entry) else METADATA_RETRY_DAYS
+        return age_days >= horizon * _jitter(ticker)
+
+    def stale_tickers(self, tickers):
+        now = _now()
+        return [t for t in tickers if self.needs_refresh(t, now)]
+
+    def put(self, ticker, entry):
+        entry = dict(entry)
+        entry['fetched_at'] = _now().isoformat(timespec='seconds')
+        with self._lock:
+            self.data[ticker] = entry
+
+    def prune(self, keep, max_age_days=METADATA_PRUNE_DAYS):
+        """Drop entries outside `keep` that were not refreshed for max_age_days."""
+        keep = set(keep)
+        now = _now()
+        with self._lock:
+            for t in list(self.data):
+                if t in keep:
+                    continue
+                age_days = _age_days(self.data[t], now)
+                if age_days is None or age_days >= max_age_days:
+                    del self.data[t]
+
+
+class EarningsCalendar(SqliteCache):
+    """
+    {ticker: {'date': 'YYYY-MM-DD' or None, 'checked_at': ISO timestamp, 'misses': int}}
+    'misses' counts consecutive checks without a usable (future) date.
+    """
+
+    def __init__(self, store=None):
+        # The check state if a run left one, else the tracked date file
+        if os.path.exists(EARNINGS_STATE_PATH):
+            super().__init__(reference_store.EARNINGS, EARNINGS_STATE_PATH, store)
+        else:
+            super().__init__(reference_store.EARNINGS, EARNINGS_PATH, store, convert=_earnings_entries)
+
+    def needs_refresh(self, ticker, now=None):
+        entry = self.data.get(ticker)
+        if not entry:
+            return True
+        now = now or _now()
+        age_days = _age_days({'fetched_at': entry.get('checked_at')}, now)
+        if age_days is None:
+            return True
+        if age_days * 24 < EARNINGS_MIN_RECHECK_HOURS:
+            return False
+
+        misses = entry.get('misses', 0)
+        if misses:
+            backoff = min(EARNINGS_BACKOFF_MAX_DAYS, EARNINGS_BACKOFF_BASE_DAYS * 2 ** (misses - 1))
+            return age_days >= backoff
+
+        try:
+            next_date = datetime.strptime(entry['date'], "%Y-%m-%d")
+        except (KeyError, TypeError, ValueError):
+            return True
+        days_until = (next_date.date() - now.date()).days
+        if days_until <= 0:
+            return True  # passed (or today): look for the next one
+        if days_until <= EARNINGS_NEAR_DAYS:
+            return age_days >= EARNINGS_NEAR_RECHECK_DAYS - 0.5
+        return age_days >= EARNINGS_FAR_RECHECK_DAYS * _jitter(ticker)
+
+    def stale_tickers(self, tickers):
+        now = _now()
+        return [t for t in tickers if self.needs_refresh(t, now)]
+
+    def dates(self):
+        """{ticker: datetime} of the stored dates (same shape as load_earnings_dates())."""
+        out = {}
+        for t, entry in self.data.items():
+            try:
+                out[t] = datetime.strptime(entry['date'], "%Y-%m-%d")
+            except (KeyError, TypeError, ValueError):
+                continue
+        return out
+
+    def record(self, ticker, date_str):
+        """Store a check result (date_str None/'-' = provider returned nothing)."""
+        now = _now()
+        if date_str in (None, '', '-'):
+            date_str = None
+        with self._lock:
+            entry = self.data.get(ticker, {})
+            usable = date_str is not None and date_str >= now.strftime("%Y-%m-%d")
+            self.data[ticker] = {
+                # Keep the last known date if the provider returned nothing this time
+                'date': date_str or entry.get('date'),
+                'checked_at': now.isoformat(timespec='seconds'),
+                'misses': 0 if usable else entry.get('misses', 0) + 1,
+            }
+
+    def export(self, tickers, path=None):
+        """{ticker: 'YYYY-MM-DD' or '-'} (written as JSON if a path is given)."""
+        out = {t: (self.data.get(t) or {}).get('date') or "-" for t in tickers}
+        if path is None:
+            return out
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(out, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return out
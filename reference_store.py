@@ -0,0 +1,177 @@
+"""
+Embedded key-value store for the per-ticker reference caches (data/reference.db).
+
+One SQLite database in WAL mode holds the fundamentals, metadata and
+earnings-calendar entries as JSON values keyed by (kind, ticker):
+
+- point lookups (get / get_many) use the primary key, no whole-file parse
+- writes are batched upserts of the changed tickers in one transaction,
+  never a rewrite of the whole cache
+- WAL lets the app read while the nightly update (or another writer) writes;
+  concurrent writers wait on the lock (busy timeout) instead of failing
+
+Every published snapshot carries a consistent copy (backup()), which the app
+opens read-only / immutable.
+"""
+import os
+import json
+import sqlite3
+import threading
+
+DB_PATH = "data/reference.db"
+
+FUNDAMENTALS = 'fundamentals'
+METADATA = 'metadata'
+EARNINGS = 'earnings'
+
+BUSY_TIMEOUT_MS = 30000
+# SQLite limits the number of bound parameters per statement
+LOOKUP_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    kind   TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    value  TEXT NOT NULL,
+    PRIMARY KEY (kind, ticker)
+) WITHOUT ROWID
+"""
+
+
+class ReferenceStore:
+    """
+    Usage:
+        store = ReferenceStore()
+        store.upsert_many('metadata', {'NVDA': {'name': 'NVIDIA', ...}})
+        store.get('metadata', 'NVDA')
+
+    readonly=True opens an immutable copy (snapshot) without taking any lock.
+    Connections are per thread.
+    """
+
+    def __init__(self, path=DB_PATH, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._local = threading.local()
+        if not readonly:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = self._conn()
+            with conn:
+                conn.execute(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.readonly:
+                conn = sqlite3.connect(f"file:{self.path}?immutable=1", uri=True, check_same_thread=False)
+            else:
+                conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, kind, ticker, default=None):
+        row = self._conn().execute("SELECT value FROM entries WHERE kind = ? AND ticker = ?",
+                                   (kind, ticker)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def get_many(self, kind, tickers):
+        """{ticker: value} for the tickers that are stored."""
+        tickers = list(dict.fromkeys(tickers))
+        out = {}
+        conn = self._conn()
+        for i in range(0, len(tickers), LOOKUP_BATCH):
+            chunk = tickers[i:i + LOOKUP_BATCH]
+            marks = ",".join("?" * len(chunk))
+            for t, v in conn.execute(f"SELECT ticker, value FROM entries WHERE kind = ? AND ticker IN ({marks})",
+                                     [kind] + chunk):
+                out[t] = json.loads(v)
+        return out
+
+    def load_all(self, kind):
+        return {t: json.loads(v) for t, v in
+                self._conn().execute("SELECT ticker, value FROM entries WHERE kind = ?", (kind,))}
+
+    def count(self, kind):
+        return self._conn().execute("SELECT COUNT(*) FROM entries WHERE kind = ?", (kind,)).fetchone()[0]
+
+    def upsert_many(self, kind, items):
+        """Insert or replace {ticker: value} in one transaction."""
+        rows = [(kind, t, json.dumps(v, ensure_ascii=False, sort_keys=True)) for t, v in items.items()]
+        if not rows:
+            return 0
+        conn = self._conn()
+        with conn:
+            conn.executemany("INSERT INTO entries (kind, ticker, value) VALUES (?, ?, ?) "
+                             "ON CONFLICT (kind, ticker) DO UPDATE SET value = excluded.value", rows)
+        return len(rows)
+
+    def delete_many(self, kind, tickers):
+        rows = [(kind, t) for t in tickers]
+        if not rows:
+            return 0
+        conn = self._conn()
+        with conn:
+            conn.executemany("DELETE FROM entries WHERE kind = ? AND ticker = ?", rows)
+        return len(rows)
+
+    def import_json(self, kind, json_path, convert=None):
+        """
+        One-time migration of a legacy JSON cache file into an empty kind.
+        The file itself is left in place (it may be tracked data other readers still use).
+        convert: {ticker: value} -> {ticker: entry} for files in an older layout
+
+        Returns:
+            int: entries imported
+        """
+        if not os.path.exists(json_path) or self.count(kind):
+            return 0
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if convert is not None:
+                data = convert(data, json_path)
+        except Exception as e:
+            print(f"Legacy cache unreadable, not imported ({json_path}): {e}")
+            return 0
+        n = self.upsert_many(kind, data)
+        print(f"Imported {n} {kind} entries from {json_path} into {self.path}")
+        return n
+
+    def backup(self, dest):
+        """
+        Consistent copy of the database (readers / writers may keep going), as a
+        single file without WAL for read-only use.
+        """
+        tmp_path = dest + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        target = sqlite3.connect(tmp_path)
+        try:
+            self._conn().backup(target)
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+        os.replace(tmp_path, dest)
+        return dest
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide writable store (data/reference.db)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ReferenceStore()
+        return _store
+
+
+def open_readonly(path):
+    """Read-only store for a snapshot copy, or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    return ReferenceStore(path, readonly=True)
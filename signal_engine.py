@@ -0,0 +1,282 @@
+"""
+Vectorized signal engine.
+
+The signal rules are evaluated on right-aligned (tickers x bars) indicator
+matrices (Open, Close + indicators.SIGNAL_SET, as indicators.compute_aligned
+or IndicatorState.tails give them), for every ticker on every bar at once:
+
+- scan():   Breakout / Reversal / Reentry / Sell_Stop / Sell_Profit under the
+            daily-scan rules. The buy cooldown (no new buy when one of the
+            previous 4 bars already had a breakout or a MACD-cross reversal)
+            is a shifted rolling mask. get_todays_signals is the last column.
+- trades(): Buy / Sell markers of the deep-dive chart (5-bar buy and sell
+            cooldowns, at most 3 buys per trend, sells only while holding).
+            These depend on the path, so the dates are stepped through once,
+            all tickers at a time.
+- replay(): scan signals of every ticker on every date of a history (backtests,
+            re-running a past day; `python signal_engine.py --start 2025-12-01`).
+
+Types and reasons come back as small integer codes into SCAN_TYPES /
+SCAN_REASONS and TRADE_SIGNALS / TRADE_REASONS.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+import price_panel
+import indicators
+
+SCAN_TYPES = (None, 'Breakout', 'Reversal', 'Reentry', 'Sell_Stop', 'Sell_Profit')
+SCAN_REASONS = ('', 'BB Break', '50日高値圏', 'MACD GC', 'Early Turn (Hist↑)', 'Big Bounce',
+                'Dip Buy (押し目)', 'Stop Loss (Chandelier)', 'RSI Climax', 'Profit Take (MACD DC)')
+BUY_TYPES = (1, 2, 3)
+# Previous bars checked by the scan's buy cooldown
+SCAN_COOLDOWN = 4
+
+TRADE_SIGNALS = (None, 'Buy', 'Sell')
+TRADE_REASONS = ('', 'モメンタム始動 (ブレイク+出来高+MACD)', 'トレンド転換 (大陽線/MACD好転)',
+                 '再エントリー (押し目完了/MACD好転)', '損切り/撤退 (サポートライン割れ)',
+                 '利確推奨 (RSI90超/トレンド転換)')
+BUY_COOLDOWN = 5       # bars without a new buy after a buy (prevents cluster buys)
+SELL_COOLDOWN = 5      # bars without a new sell after a sell
+MAX_TREND_BUYS = 3     # buys per trend (reset by a sell)
+
+
+def _lag(values, k=1):
+    """Value k bars back (NaN / False before the first column), per row."""
+    out = np.full_like(values, False if values.dtype == bool else np.nan)
+    out[:, k:] = values[:, :-k]
+    return out
+
+
+def _bars(width, lengths):
+    """(N, width) number of the ticker's bars up to and including each column (<= 0 on the padding)."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    return np.arange(1, width + 1)[None, :] - (width - lengths)[:, None]
+
+
+def scan_reason(code, rsi):
+    """Reason text of a scan reason code (the RSI climax carries the RSI)."""
+    reason = SCAN_REASONS[code]
+    return f"{reason} ({rsi:.0f})" if reason == 'RSI Climax' else reason
+
+
+def scan(ind, lengths=None):
+    """
+    Daily-scan signal on every bar.
+
+    Args:
+        ind: {name: (N, width) array} with Open, Close and indicators.SIGNAL_SET, right-aligned
+        lengths: bars per ticker (default: every column is a bar)
+
+    Returns:
+        (types, reasons): int8 (N, width) codes into SCAN_TYPES / SCAN_REASONS
+    """
+    close, open_ = ind['Close'], ind['Open']
+    rsi, rvol = ind['RSI'], ind['RVOL']
+    macd, macd_sig, hist = ind['MACD'], ind['MACD_Signal'], ind['MACD_Hist']
+    n, width = close.shape
+    lengths = np.full(n, width) if lengths is None else lengths
+
+    above_sma50 = close > ind['SMA50']
+    below_sma50 = close < ind['SMA50']
+    macd_up = macd > macd_sig
+    cross_today = macd_up & (_lag(macd) <= _lag(macd_sig))
+    cross_yest = _lag(cross_today)
+    hist_up = (hist > _lag(hist)) & (_lag(hist) > _lag(hist, 2))
+
+    # BUY BREAKOUT
+    bb_break = close > ind['BB_Upper']
+    near_high = close >= ind['High50'] * 0.98
+    breakout = ((above_sma50 | (close > ind['SMA20'])) & (bb_break | near_high) & (rvol > 1.1)
+                & (macd_up | (macd > 0)) & (rsi < 80))
+
+    # BUY REVERSAL (Only for downtrend)
+    rsi_low = rsi < 55
+    rev_cross = below_sma50 & rsi_low & (cross_today | cross_yest)
+    rev_early = below_sma50 & rsi_low & hist_up & (hist < 0) & (rvol > 1.0)
+    rev_big = below_sma50 & (close > open_ * 1.03) & (rvol > 1.2)
+
+    # BUY REENTRY
+    reentry = (ind['ADX'] > 15) & above_sma50 & (rsi > 40) & (rsi < 60) & (cross_today | hist_up)
+
+    # SELL
+    chandelier = ind['Chandelier_Exit']
+    sell_stop = (close < chandelier) & (_lag(close) >= _lag(chandelier))
+    rsi_climax = (rsi > 90) & (_lag(rsi) <= 90)
+    # max RSI of the last 10 bars (NaN skipped), only once there are 10 bars
+    padded = np.concatenate([np.full((n, 9), np.nan), rsi], axis=1)
+    rsi_max10 = np.fmax.reduce(sliding_window_view(padded, 10, axis=1), axis=2)
+    rsi_was_high = (rsi_max10 > 70) & (_bars(width, lengths) >= 10)
+    macd_dead = (macd < macd_sig) & (_lag(macd) >= _lag(macd_sig))
+    profit_take = macd_dead & (rsi < 60) & rsi_was_high
+
+    # Priority: Breakout > Reversal > Reentry > Sell (Stop > Climax > Profit Take)
+    types = np.zeros((n, width), dtype=np.int8)
+    reasons = np.zeros((n, width), dtype=np.int8)
+    rules = [
+        (breakout & bb_break, 1, 1), (breakout, 1, 2),
+        (rev_cross, 2, 3), (rev_early, 2, 4), (rev_big, 2, 5),
+        (reentry, 3, 6),
+        (sell_stop, 4, 7), (rsi_climax, 5, 8), (profit_take, 5, 9),
+    ]
+    for mask, type_code, reason_code in rules:
+        hit = mask & (types == 0)
+        types[hit] = type_code
+        reasons[hit] = reason_code
+
+    # Cooldown: a buy is dropped when any of the previous 4 bars had a breakout or a MACD-cross reversal
+    quick_buy = breakout | (below_sma50 & rsi_low & cross_today)
+    recent_buy = np.zeros((n, width), dtype=bool)
+    for k in range(1, SCAN_COOLDOWN + 1):
+        recent_buy |= _lag(quick_buy, k)
+    cooled = np.isin(types, BUY_TYPES) & recent_buy
+    types[cooled] = 0
+    reasons[cooled] = 0
+    return types, reasons
+
+
+def trades(ind, lengths=None):
+    """
+    Deep-dive Buy / Sell markers on every bar.
+
+    Args:
+        ind: {name: (N, width) array} with Open, Close and indicators.SIGNAL_SET, right-aligned
+        lengths: bars per ticker (default: every column is a bar)
+
+    Returns:
+        (signals, reasons): int8 (N, width) codes into TRADE_SIGNALS / TRADE_REASONS
+    """
+    close, open_ = ind['Close'], ind['Open']
+    rsi, rvol = ind['RSI'], ind['RVOL']
+    macd, macd_sig, hist = ind['MACD'], ind['MACD_Signal'], ind['MACD_Hist']
+    n, width = close.shape
+    lengths = np.full(n, width) if lengths is None else lengths
+
+    # --- BUY (Breakout): trend + BB break / near 50d high + volume + MACD + RSI not > 80 ---
+    buy = (((close > ind['SMA50']) | (close > ind['SMA20']))
+           & ((close > ind['BB_Upper']) | (close >= ind['High50'] * 0.98))
+           & (rvol > 1.1) & ((macd > macd_sig) | (macd > 0)) & (rsi < 80))
+
+    # --- REVERSAL BUY (Bottom Fish): MACD cross today / yesterday, early turn, big bounce ---
+    rsi_low = rsi < 55
+    cross_today = (macd > macd_sig) & (_lag(macd) <= _lag(macd_sig))
+    cross_yest = (_lag(macd) > _lag(macd_sig)) & (_lag(macd, 2) <= _lag(macd_sig, 2))
+    macd_cross = cross_today | cross_yest
+    hist_improving = (hist > _lag(hist)) & (_lag(hist) > _lag(hist, 2))
+    reversal = ((rsi_low & macd_cross)
+                | (rsi_low & hist_improving & (hist < 0) & (rvol > 1.0))
+                | ((close > open_ * 1.03) & (rvol > 1.2)))
+
+    # --- RE-ENTRY BUY (Dip Buy): trend up + pullback + turn up ---
+    reentry = ((ind['ADX'] > 15) & (close > ind['SMA50']) & (rsi < 60) & (rsi > 40)
+               & (hist_improving | macd_cross))
+
+    # --- SELL (Profit): RSI climax above 90, or a MACD dead cross (immediate, or confirmed
+    # by RSI falling below 60) only if the max RSI of the last 10 bars was above 70 ---
+    rsi_was_high = price_panel.rolling_aligned(rsi, lengths, 10, how='max') > 70
+    rsi_climax = (rsi > 90) & (_lag(rsi) <= 90)
+    dc_immediate = (macd < macd_sig) & (_lag(macd) >= _lag(macd_sig)) & (rsi < 60) & rsi_was_high
+    dc_delayed = (macd < macd_sig) & (rsi < 60) & (_lag(rsi) >= 60) & rsi_was_high
+    sell_profit = rsi_climax | dc_immediate | dc_delayed
+
+    # --- SELL (Stop): close crosses below the Chandelier Exit ---
+    chandelier = ind['Chandelier_Exit']
+    sell_stop = (close < chandelier) & (_lag(close) >= _lag(chandelier))
+
+    signals = np.zeros((n, width), dtype=np.int8)
+    reasons = np.zeros((n, width), dtype=np.int8)
+    cooldown = np.zeros(n, dtype=np.int64)
+    cooldown_sell = np.zeros(n, dtype=np.int64)
+    trend_buys = np.zeros(n, dtype=np.int64)
+    for j in range(width):
+        np.maximum(cooldown - 1, 0, out=cooldown)
+        np.maximum(cooldown_sell - 1, 0, out=cooldown_sell)
+
+        # Sell first (Stop > Profit); only when holding (a buy since the last sell)
+        stop = sell_stop[:, j] & (cooldown_sell == 0)
+        profit = sell_profit[:, j] & (cooldown_sell == 0) & ~stop
+        is_sell = stop | profit
+        sold = is_sell & (trend_buys > 0)
+        signals[sold, j] = 2
+        reasons[sold, j] = np.where(stop[sold], 4, 5)
+        cooldown[sold] = 0
+        cooldown_sell[sold] = SELL_COOLDOWN
+        trend_buys[sold] = 0
+
+        # Buy (Breakout > Reversal > Reentry) when not cooling down and under the per-trend cap
+        can_buy = ~is_sell & (cooldown == 0) & (trend_buys < MAX_TREND_BUYS)
+        reason = np.where(buy[:, j], 1, np.where(reversal[:, j], 2, np.where(reentry[:, j], 3, 0)))
+        bought = can_buy & (reason > 0)
+        signals[bought, j] = 1
+        reasons[bought, j] = reason[bought]
+        cooldown[bought] = BUY_COOLDOWN
+        trend_buys[bought] += 1
+    return signals, reasons
+
+
+def frame_inputs(df):
+    """{name: (1, bars) array} of one ticker's indicator frame, for scan() / trades()."""
+    return {name: df[name].to_numpy(dtype=float)[None, :] for name in ('Open', 'Close') + indicators.SIGNAL_SET}
+
+
+def replay(history, start=None):
+    """
+    Scan signals of every ticker on every date of a history (from `start`).
+
+    Args:
+        history: PricePanel, HistoryStore or {ticker: OHLCV DataFrame}
+
+    Returns:
+        pd.DataFrame: Date, Ticker, Type, Reason, Close (by date, then ticker order)
+    """
+    panel = price_panel.PricePanel.from_history(history)
+    ind = indicators.get_engine().aligned_many(panel, indicators.SIGNAL_SET)
+    ind['Open'] = panel.aligned('Open')
+    ind['Close'] = panel.aligned('Close')
+    lengths = panel.lengths()
+    types, reasons = scan(ind, lengths)
+
+    dates = panel.aligned_dates()
+    hit = types > 0
+    if start is not None:
+        hit &= dates >= np.datetime64(pd.Timestamp(start).tz_localize(None))
+    rows, cols = np.nonzero(hit)
+    out = pd.DataFrame({
+        'Date': dates[rows, cols],
+        'Ticker': [panel.tickers[i] for i in rows],
+        'Type': [SCAN_TYPES[c] for c in types[rows, cols]],
+        'Reason': [scan_reason(c, r) for c, r in zip(reasons[rows, cols], ind['RSI'][rows, cols])],
+        'Close': ind['Close'][rows, cols],
+    })
+    return out.sort_values(['Date'], kind='stable').reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the daily-scan signals over the published history snapshot")
+    parser.add_argument('--start', default=None, help="first date to list (default: all dates)")
+    parser.add_argument('--ticker', default=None, help="only this ticker")
+    args = parser.parse_args()
+
+    import snapshot
+    import history_store
+    history = history_store.open_history(snapshot.resolve(snapshot.HISTORY))
+    if history is None:
+        print("No history snapshot to replay")
+        return
+    if args.ticker:
+        history = {args.ticker: history[args.ticker]} if args.ticker in history else {}
+    signals = replay(history, start=args.start)
+    if signals.empty:
+        print("No signals")
+        return
+    counts = signals.groupby([signals['Date'].dt.date, 'Type']).size().unstack(fill_value=0)
+    print(counts.to_string())
+    if args.ticker:
+        print(signals.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
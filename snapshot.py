@@ -0,0 +1,225 @@
+"""
+Versioned, atomically published snapshots of the nightly outputs.
+
+Each update run writes every artifact the app reads into its own directory,
+and the run becomes visible only once it is complete:
+
+    data/snapshots/<version>.staging/   written by the stages (kept across --resume)
+    data/snapshots/<version>/           after publish(), with manifest.json
+    data/CURRENT                        {'version', 'path'} of the published snapshot
+
+publish() hashes every artifact into manifest.json (sha256, bytes, rows,
+stage seconds), renames the staging directory to a version directory that
+does not exist yet and then replaces the pointer file with os.replace, so a
+reader sees either the old snapshot or the new one, never a mix. Readers
+resolve artifact paths through the pointer and can key all their caches on
+the version string (one small file read).
+
+Data written before snapshots existed (data/<artifact>) is still found by
+resolve() as long as no snapshot has been published.
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+from datetime import datetime
+
+DATA_DIR = "data"
+SNAPSHOT_ROOT = "data/snapshots"
+POINTER_PATH = "data/CURRENT"
+MANIFEST_FILE = "manifest.json"
+STAGING_SUFFIX = ".staging"
+# Published snapshots kept on disk (readers of an older version may still be open)
+KEEP_SNAPSHOTS = 2
+
+# Artifact names inside a snapshot
+METRICS = "momentum_cache.npz"
+METRICS_CSV = "momentum_cache.csv"
+HISTORY = "history"
+SIGNALS = "daily_signals_cache.json"
+INDICES = "indices_cache.json"
+TRENDING = "trending_cache.json"
+REFERENCE = "reference.db"
+LAST_UPDATED = "last_updated.txt"
+
+
+def _sha256(path):
+    """sha256 of a file, or of a directory's files (relative names + contents, sorted)."""
+    h = hashlib.sha256()
+    if os.path.isdir(path):
+        for dirpath, _, filenames in sorted(os.walk(path)):
+            for name in sorted(filenames):
+                full = os.path.join(dirpath, name)
+                h.update(os.path.relpath(full, path).encode('utf-8'))
+                h.update(bytes.fromhex(_sha256(full)))
+        return h.hexdigest()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(d, n)) for d, _, names in os.walk(path) for n in names)
+    return os.path.getsize(path)
+
+
+class SnapshotWriter:
+    """
+    Usage:
+        writer = SnapshotWriter(version)
+        df.to_csv(writer.path(METRICS_CSV)); writer.record(METRICS_CSV, rows=len(df))
+        manifest = writer.publish()
+    """
+
+    def __init__(self, version, root=SNAPSHOT_ROOT, pointer=POINTER_PATH):
+        self.version = version
+        self.root = root
+        self.pointer = pointer
+        self.dir = os.path.join(root, version + STAGING_SUFFIX)
+        self.final_dir = os.path.join(root, version)
+        self.entries = {}  # artifact -> {'rows': int, 'stage': str}
+        self._lock = threading.Lock()
+        os.makedirs(self.dir, exist_ok=True)
+        # A resumed run continues the interrupted run's staging directory
+        try:
+            with open(self.path(MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('artifacts', {})
+        except (OSError, ValueError):
+            pass
+
+    def path(self, name):
+        """Where a stage writes an artifact of this snapshot."""
+        return os.path.join(self.dir, name)
+
+    def record(self, name, rows=None, stage=None):
+        """Note row count / producing stage of an artifact for the manifest (kept in the staging dir)."""
+        with self._lock:
+            entry = self.entries.setdefault(name, {})
+            if rows is not None:
+                entry['rows'] = int(rows)
+            if stage is not None:
+                entry['stage'] = stage
+            tmp_path = self.path(MANIFEST_FILE) + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.version, 'artifacts': self.entries}, f, indent=1)
+            os.replace(tmp_path, self.path(MANIFEST_FILE))
+
+    def publish(self, timings=None, keep=KEEP_SNAPSHOTS):
+        """
+        Write the manifest, move the snapshot into place and swap the pointer.
+
+        Args:
+            timings: {stage: seconds} of this run (attached to each artifact's stage)
+
+        Returns:
+            dict: the manifest
+        """
+        timings = timings or {}
+        # Never replace a published directory in place (the pointer may name it): a version
+        # that already exists (e.g. a second run within the same second) gets the next free name
+        version, n = self.version, 1
+        while os.path.exists(os.path.join(self.root, version)):
+            n += 1
+            version = f"{self.version}-{n}"
+        if version != self.version:
+            print(f"Snapshot {self.version} already published, publishing as {version}")
+            self.version = version
+            self.final_dir = os.path.join(self.root, version)
+        artifacts = {}
+        for name in sorted(os.listdir(self.dir)):
+            if name == MANIFEST_FILE or name.endswith(".tmp"):
+                continue
+            full = self.path(name)
+            info = dict(self.entries.get(name, {}))
+            info['sha256'] = _sha256(full)
+            info['bytes'] = _size(full)
+            if info.get('stage') in timings:
+                info['seconds'] = round(timings[info['stage']], 3)
+            artifacts[name] = info
+        manifest = {
+            'version': self.version,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'artifacts': artifacts,
+            'stages': {k: round(v, 3) for k, v in timings.items()},
+        }
+        with open(self.path(MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+        os.rename(self.dir, self.final_dir)
+        self.dir = self.final_dir
+
+        tmp_path = self.pointer + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version,
+                       'path': os.path.relpath(self.final_dir, os.path.dirname(self.pointer) or ".")}, f)
+        os.replace(tmp_path, self.pointer)
+
+        prune(self.root, keep=keep, current=self.version)
+        return manifest
+
+
+def prune(root=SNAPSHOT_ROOT, keep=KEEP_SNAPSHOTS, current=None):
+    """Drop all but the newest `keep` published snapshots and any abandoned staging dirs."""
+    if not os.path.isdir(root):
+        return
+    names = sorted(os.listdir(root))
+    published = [n for n in names if not n.endswith(STAGING_SUFFIX) and os.path.isdir(os.path.join(root, n))]
+    stale = [n for n in names if n.endswith(STAGING_SUFFIX)]
+    stale += [n for n in published[:-keep] if n != current] if keep else []
+    for n in stale:
+        shutil.rmtree(os.path.join(root, n), ignore_errors=True)
+
+
+def read_pointer(pointer=POINTER_PATH):
+    """{'version', 'path'} of the published snapshot, or None."""
+    try:
+        with open(pointer, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def current_dir(pointer=POINTER_PATH):
+    """Directory of the published snapshot, or None."""
+    ref = read_pointer(pointer)
+    if not ref:
+        return None
+    return os.path.join(os.path.dirname(pointer) or ".", ref['path'])
+
+
+def current_version(pointer=POINTER_PATH):
+    """
+    Version of the published snapshot (cache key for readers).
+    Without a snapshot: the legacy metrics file's mtime, or None if there is no data at all.
+    """
+    ref = read_pointer(pointer)
+    if ref:
+        return ref['version']
+    for name in (METRICS, METRICS_CSV):
+        legacy = os.path.join(DATA_DIR, name)
+        if os.path.exists(legacy):
+            return f"legacy-{os.path.getmtime(legacy)}"
+    return None
+
+
+def resolve(name, pointer=POINTER_PATH):
+    """Path of an artifact in the published snapshot (legacy data/<name> if none)."""
+    root = current_dir(pointer)
+    if root is None:
+        return os.path.join(DATA_DIR, name)
+    return os.path.join(root, name)
+
+
+def load_manifest(pointer=POINTER_PATH):
+    """manifest.json of the published snapshot, or None."""
+    root = current_dir(pointer)
+    if root is None:
+        return None
+    try:
+        with open(os.path.join(root, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -1,368 +1,292 @@
 import pandas as pd
 import numpy as np
-import pickle
 import os
 import json
+import argparse
+import shutil
+import functools
 from datetime import datetime
-import yfinance as yf
 import market_logic # Custom Logic Module
+import candidate_sources
+import price_store
+import history_store
+import metrics_snapshot
+import rate_limiter
+import reference_store
+import enrichment
+import quarantine
+import pipeline
+import snapshot
+import metrics_archive
+import indicator_state
+import parallel
 
-def fetch_metadata_batch(tickers):
+def fetch_candidates():
+    """Stage 1: 候補取得"""
+    print("Fetching Candidates...")
+    candidates = market_logic.get_momentum_candidates()
+    print(f"Candidates Count: {len(candidates)}")
+    return candidates
+
+def sync_prices(candidates, max_age_hours=None):
+    """Stage 2a: price store sync (candidates + indices / VIX / SPY in one batched download)"""
+    return market_logic.sync_prices(candidates, max_age_hours=max_age_hours)
+
+def enrich_tickers(candidates, writer):
     """
-    複数ティッカーのメタデータを一括取得（並列処理）
-    Returns: dict {ticker: {'name': str, 'industry': str, 'summary': str}}
+    Stage 2b: fundamentals / metadata / earnings dates from one .info request per ticker
+    (.calendar only for tickers whose .info has no upcoming earnings date)
     """
-    import concurrent.futures
-    import threading
-    import time
-    
-    metadata = {}
-    total = len(tickers)
-    
-    # Existing cache handling restricted to NOT loading old file if we want to purge Japanese?
-    # Actually, let's load it ONLY if we want to preserve correct English entries? 
-    # But to be safe, let's start fresh or just rely on API. 
-    # If we want to be 100% sure, we should probably ignore the old file if it has Japanese.
-    # For now, let's just rely on the API and if it fails, we get empty (better than Japanese).
-    
-    metadata_path = "data/metadata_cache.json"
-    existing_metadata = {}
-    # Skip loading existing to force fresh English
-    # if os.path.exists(metadata_path):
-    #     try:
-    #         with open(metadata_path, 'r', encoding='utf-8') as f:
-    #             existing_metadata = json.load(f)
-    #     except:
-    #         pass
+    print("Enriching Tickers (fundamentals / metadata / earnings)...")
+    # Skip ETFs for earnings (they don't have standard earnings dates and cause 404s)
+    from market_logic import THEMATIC_ETFS
 
-    # 全て処理対象にする
-    targets = tickers 
-    
-    print(f"  Fetching metadata for {len(targets)} tickers in parallel (English, Slow Mode)...")
+    # Hide "HTTP Error 404" from yfinance. (redirect_stderr swaps sys.stderr for the
+    # whole process, which breaks when stages and workers run concurrently.)
+    import logging
+    logging.getLogger('yfinance').setLevel(logging.CRITICAL)
 
-    # スレッドセーフなカウンタ
-    lock = threading.Lock()
-    completed_count = 0
+    enricher = enrichment.Enricher(skip_earnings=set(THEMATIC_ETFS.values()))
+    stats = enricher.run(candidates)
+    earnings_data = enricher.save(export_tickers=candidates)
+    print(f"Saved {enricher.metadata.store.path} ({len(enricher.metadata)} metadata, "
+          f"{sum(1 for d in earnings_data.values() if d != '-')} earnings dates)")
+    # The app reads this run's copy of the reference store (the live one keeps changing)
+    reference_path = enricher.metadata.store.backup(writer.path(snapshot.REFERENCE))
+    writer.record(snapshot.REFERENCE, rows=len(enricher.fundamentals) + len(enricher.metadata) + len(enricher.calendar),
+                  stage='enrich')
+    print(f"Saved {reference_path}")
+    return stats
 
-    def fetch_single(tkr):
-        nonlocal completed_count
-        res = {'name': tkr, 'industry': '', 'summary': ''}
-        
-        try:
-            # Rate limit protection
-            time.sleep(0.2) 
-            
-            t = yf.Ticker(tkr)
-            info = t.info
-            
-            # 1. Name & Industry (English)
-            name = info.get('shortName', info.get('longName', tkr))
-            industry = info.get('industry', info.get('sector', ''))
+def save_metrics(candidates, writer, export_csv=False):
+    """Stage 3: metrics + chart history (momentum_cache.npz / history/, optionally momentum_cache.csv)"""
+    print("Calculating Metrics...")
+    # Prices are synced and fundamentals refreshed by the upstream stages
+    df_metrics, history_dict = market_logic.calculate_momentum_metrics(candidates, sync=False, enrich=False)
+    if df_metrics is None or df_metrics.empty:
+        raise RuntimeError("Data update failed (Empty DataFrame)")
+    
+    # 3. 保存 (スナップショットのステージングディレクトリへ)
+    # ランキングデータ (型付きバイナリ、CSVは任意でエクスポート)
+    df_metrics = metrics_snapshot.save_snapshot(df_metrics, writer.path(snapshot.METRICS))
+    writer.record(snapshot.METRICS, rows=len(df_metrics), stage='metrics')
+    print(f"Saved {writer.path(snapshot.METRICS)}")
+    if export_csv:
+        print(f"Saved {metrics_snapshot.export_csv(df_metrics, writer.path(snapshot.METRICS_CSV))}")
+        writer.record(snapshot.METRICS_CSV, rows=len(df_metrics), stage='metrics')
+    
+    # チャート用履歴データ (列ごとの .npy をメモリマップで開ける形式)
+    history_path = history_store.write_history(history_dict, writer.path(snapshot.HISTORY))
+    writer.record(snapshot.HISTORY, rows=sum(len(h) for h in history_dict.values()), stage='metrics')
+    print(f"Saved {history_path}/ ({len(history_dict)} tickers)")
+    return df_metrics, history_dict
 
-            # 2. Summary (English Only)
-            summary_en = info.get('longBusinessSummary', '')
-            if summary_en:
-                summary_en = summary_en[:300] + "..." if len(summary_en) > 300 else summary_en
-            
-            res = {
-                'name': name,
-                'industry': industry,
-                'summary': summary_en 
-            }
-        except Exception:
-            # Fallback to empty (English preference)
-            res = {'name': tkr, 'industry': '', 'summary': ''}
+def load_metrics(writer):
+    """Resume: rebuild the metrics stage result from its saved outputs"""
+    df_metrics = metrics_snapshot.load_snapshot(writer.path(snapshot.METRICS))
+    history = history_store.HistoryStore(writer.path(snapshot.HISTORY))
+    return df_metrics, history
 
-        with lock:
-            completed_count += 1
-            if completed_count % 10 == 0 or completed_count == len(targets):
-                print(f"    Processing... {completed_count}/{len(targets)}", end='\r')
+def save_daily_signals(metrics, writer, verify_indicators=False):
+    """
+    Stage 4: Pre-calculate Daily Signals (Speed up App Startup)
+    Indicators come from the persisted streaming state (only bars since the last run are folded in);
+    verify_indicators: also compare the state with a full recompute
+    """
+    print("Calculating Daily Signals...")
+    history_dict = metrics[1]
+    state = indicator_state.IndicatorState.load()
+    print(f"Indicator state: {state.update(history_dict)}")
+    if verify_indicators:
+        report = state.verify(history_dict)
+        indicator_state.print_report(report)
+        if report['mismatched']:
+            raise RuntimeError(f"Indicator state differs from a full recompute: {report['mismatched'][:10]}")
+    daily_signals = market_logic.get_todays_signals(history_dict, state=state)
+    state.save()
+    
+    # Save as JSON
+    sig_path = writer.path(snapshot.SIGNALS)
+    
+    # Helper to convert numpy/pandas types to native python for JSON
+    def convert_types(obj):
+        if isinstance(obj, dict):
+            return {k: convert_types(v) for k, v in obj.items()}
+        elif isinstance(obj, list):
+            return [convert_types(i) for i in obj]
+        elif isinstance(obj, (np.int64, np.int32, np.int16)):
+            return int(obj)
+        elif isinstance(obj, (np.float64, np.float32, float)):
+            return float(obj)
+        return obj
         
-        return tkr, res
+    daily_signals_clean = convert_types(daily_signals)
+    
+    with open(sig_path, "w", encoding='utf-8') as f:
+        json.dump(daily_signals_clean, f, ensure_ascii=False, indent=2)
+    writer.record(snapshot.SIGNALS, rows=sum(len(v) for v in daily_signals_clean.values()), stage='signals')
+    print(f"Saved {sig_path}")
+    return daily_signals_clean
 
-    # 並列実行 (レート制限回避のためスレッド数削減)
-    # 429防止のためシングルスレッドに近い動きにする (max_workers=1)
-    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-        future_to_ticker = {executor.submit(fetch_single, t): t for t in targets}
-        for future in concurrent.futures.as_completed(future_to_ticker):
-            tkr, data = future.result()
-            metadata[tkr] = data
-            
-    print("") # 改行
-    return metadata
+def archive_day(metrics, signals):
+    """Stage 4b: append today's metrics / signals to the date-partitioned archive (data/archive/)"""
+    df_metrics, history = metrics
+    stats = metrics_archive.archive_run(df_metrics, signals, metrics_archive.market_date(history))
+    print(f"Archived {stats['date']}: {stats['metrics_rows']} metrics rows, {stats['signals_rows']} signals"
+          f" ({stats['compacted']} daily partitions compacted)")
+    return stats
 
-def main():
-    print(f"Starting Data Update: {datetime.now()}")
+def save_indices(writer):
+    """Stage 5: 主要指数データ保存 (needs the price store sync)"""
+    # Index series are synced into the price store with the bulk download (stage 2a),
+    # returns use the same vectorized engine as the stock metrics -> no extra requests
+    print("Calculating Major Indices Data...")
+    indices_data = {}
+    from market_logic import MAJOR_INDICES, INDEX_RETURN_LOOKBACKS, compute_period_returns
     
-    # 1. 候補取得
-    print("Fetching Candidates...")
-    candidates = market_logic.get_momentum_candidates()
-    print(f"Candidates Count: {len(candidates)}")
+    index_history = price_store.get_store().load_many(list(MAJOR_INDICES), period="2y")
+    index_history = {t: h for t, h in index_history.items() if len(h) >= 2}
+    index_returns = compute_period_returns(index_history, INDEX_RETURN_LOOKBACKS,
+                                           ytd='first_close', ytd_year=datetime.now().year)
+    period_ids = ['1d', '5d', '1mo', '3mo', '6mo', 'YTD', '1y']
     
-    # 2. データ計算
-    print("Calculating Metrics...")
-    df_metrics, history_dict = market_logic.calculate_momentum_metrics(candidates)
+    for ticker, (jp_name, emoji) in MAJOR_INDICES.items():
+        if ticker not in index_history:
+            print(f"  No stored history for {ticker}")
+            indices_data[ticker] = {"name": jp_name, "emoji": emoji, "error": True}
+            continue
+        rets = index_returns.loc[ticker]
+        indices_data[ticker] = {
+            "name": jp_name, 
+            "emoji": emoji, 
+            "returns": {pid: (0.0 if pd.isna(rets[pid]) else float(rets[pid])) for pid in period_ids},
+            "price": float(index_history[ticker]['Close'].iloc[-1]),
+            "error": False
+        }
     
-    if df_metrics is not None and not df_metrics.empty:
-        # 3. 保存 (dataフォルダを作成して保存)
-        os.makedirs("data", exist_ok=True)
-        
-        # ランキングデータ
-        csv_path = "data/momentum_cache.csv"
-        df_metrics.to_csv(csv_path, index=False)
-        print(f"Saved {csv_path}")
-        
-        # チャート用履歴データ (Pickle形式が軽くて速い)
-        pkl_path = "data/history_cache.pkl"
-        with open(pkl_path, "wb") as f:
-            pickle.dump(history_dict, f)
-        print(f"Saved {pkl_path}")
-
-        # 🚨 Pre-calculate Daily Signals (Speed up App Startup)
-        print("Calculating Daily Signals...")
-        daily_signals = market_logic.get_todays_signals(history_dict)
-        
-        # Save as JSON
-        sig_path = "data/daily_signals_cache.json"
-        
-        # Helper to convert numpy/pandas types to native python for JSON
-        def convert_types(obj):
-            if isinstance(obj, dict):
-                return {k: convert_types(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [convert_types(i) for i in obj]
-            elif isinstance(obj, (np.int64, np.int32, np.int16)):
-                return int(obj)
-            elif isinstance(obj, (np.float64, np.float32, float)):
-                return float(obj)
-            return obj
-            
-        daily_signals_clean = convert_types(daily_signals)
-        
-        with open(sig_path, "w", encoding='utf-8') as f:
-            json.dump(daily_signals_clean, f, ensure_ascii=False, indent=2)
-        print(f"Saved {sig_path}")
-        
-        # 4. メタデータ取得・保存（新規追加）
-        print("Fetching Metadata for All Candidates...")
-        # metadata = fetch_metadata_batch(candidates) # Skip for speed during this fix
-        # Define metadata_path for safety in case we uncomment
-        metadata_path = "data/metadata_cache.json"
-        
-        # Check if we should run metadata fetch (Time consuming)
-        # For now, let's skip it if we just want to fix the indices/earnings
-        # But if the file is missing, we might need it. 
-        # Actually, let's run it because we need the file. 
-        # To make it faster for this run, maybe I can just load existing if available?
-        # The previous run CRASHED before writing. So we lost the data in memory.
-        # We have to fetch again.
-        
-        metadata = fetch_metadata_batch(candidates)
-        with open(metadata_path, "w", encoding='utf-8') as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
-        print(f"Saved {metadata_path} ({len(metadata)} tickers)")
-
-        # 5. 主要指数データ取得・保存
-        print("Fetching Major Indices Data...")
-        indices_data = {}
-        # Fetch 5 days history for calculation
-        period_days = {'1d': 5, '5d': 10, '1mo': 35, '3mo': 100, '6mo': 200, 'YTD': 400, '1y': 400}
-        
-        from market_logic import MAJOR_INDICES
-        
-        for ticker, (jp_name, emoji) in MAJOR_INDICES.items():
-            try:
-                # Fetch max needed history (approx 400 days for YTD/1y)
-                t_obj = yf.Ticker(ticker)
-                hist = t_obj.history(period="2y") # Fetch enough
-                
-                if len(hist) < 2:
-                    indices_data[ticker] = {"name": jp_name, "emoji": emoji, "error": True}
-                    continue
-
-                period_returns = {}
-                last_close = hist['Close'].iloc[-1]
-                
-                for pid, days_back_approx in period_days.items():
-                    try:
-                        base_close = None
-                        if pid == '1d':
-                            base_close = hist['Close'].iloc[-2]
-                        elif pid == 'YTD':
-                            this_year = datetime.now().year
-                            ytd_data = hist[hist.index.year == this_year]
-                            if not ytd_data.empty:
-                                base_close = ytd_data['Close'].iloc[0]
-                            else:
-                                base_close = hist['Close'].iloc[0]
-                        else:
-                            # Use business days approximation
-                            target_days = {'5d': 5, '1mo': 21, '3mo': 63, '6mo': 126, '1y': 252}
-                            db = target_days.get(pid, 5)
-                            if len(hist) > db:
-                                base_close = hist['Close'].iloc[-db - 1] 
-                            else:
-                                base_close = hist['Close'].iloc[0]
-                        
-                        if base_close:
-                            pct = ((last_close - base_close) / base_close) * 100
-                            period_returns[pid] = pct
-                        else:
-                            period_returns[pid] = 0.0
-                    except:
-                        period_returns[pid] = 0.0
-                
-                indices_data[ticker] = {
-                    "name": jp_name, 
-                    "emoji": emoji, 
-                    "returns": period_returns,
-                    "price": last_close,
-                    "error": False
-                }
-            except Exception as e:
-                print(f"  Error fetching {ticker}: {e}")
-                indices_data[ticker] = {"name": jp_name, "emoji": emoji, "error": True}
-        
-        indices_path = "data/indices_cache.json"
-        with open(indices_path, "w", encoding='utf-8') as f:
-            json.dump(indices_data, f, ensure_ascii=False, indent=2)
-        print(f"Saved {indices_path}")
+    indices_path = writer.path(snapshot.INDICES)
+    with open(indices_path, "w", encoding='utf-8') as f:
+        json.dump(indices_data, f, ensure_ascii=False, indent=2)
+    writer.record(snapshot.INDICES, rows=len(indices_data), stage='indices')
+    print(f"Saved {indices_path}")
 
-        # 6. 決算日データ取得・保存
-        print("Fetching Earnings Dates...")
-        earnings_data = {}
-        
-        import concurrent.futures
-        def fetch_earnings(tkr):
-            # Skip ETFs (they don't have standard earnings dates and cause 404s)
-            # We need to access etf_tickers here. It's not defined in this scope yet.
-            # Moving the import and set creation up.
-            pass 
+def save_trending(writer):
+    """Stage 6: Trending Tickers"""
+    print("Fetching Trending Tickers...")
+    try:
+        from market_logic import STATIC_MENU_ITEMS
 
-        # Import explicitly here for clarity or use the one from main scope if passed
-        from market_logic import THEMATIC_ETFS
-        etf_tickers = set(THEMATIC_ETFS.values())
+        fallback_tickers = ['RKLB', 'MU', 'OKLO', 'LLY', 'SOFI']
+        exclusion_set = {t for t in STATIC_MENU_ITEMS if not t.startswith('---')}
         
-        # Suppress yfinance error output context manager
-        import contextlib
-        import io
+        # Same most-active page as the candidate sources: shared request (and last-good fallback)
+        source = candidate_sources.TRENDING_SOURCE
+        candidates_tr = candidate_sources.fetch_sources([source])[source][:30]
 
-        def fetch_earnings_safe(tkr):
-            if tkr in etf_tickers:
-                return tkr, "-"
+        # Filter
+        filtered = [t for t in candidates_tr if t not in exclusion_set]
+        final_list = filtered[:5]
+        if not final_list: final_list = fallback_tickers
             
-            # Additional known problematic tickers
-            if tkr in ["SENT", "CDNS", "SNPS"]: # Add others if found
-                 return tkr, "-"
-                
-            try:
-                t = yf.Ticker(tkr)
-                
-                # Suppress stderr to hide "HTTP Error 404" from yfinance
-                f = io.StringIO()
-                with contextlib.redirect_stderr(f):
-                    cal = t.calendar
-                    
-                next_date_str = "-"
-                
-                if isinstance(cal, dict):
-                    dates = cal.get('Earnings Date', [])
-                    if dates:
-                        d = dates[0]
-                        if isinstance(d, (datetime, pd.Timestamp)):
-                             next_date_str = d.strftime("%Y-%m-%d")
-                        else:
-                             next_date_str = str(d)
-                elif isinstance(cal, pd.DataFrame):
-                     # Handle DataFrame return (sometimes yfinance returns DF)
-                     if not cal.empty:
-                         # Trying to find earnings date column
-                         if 'Earnings Date' in cal.columns:
-                             d = cal['Earnings Date'].iloc[0]
-                             if isinstance(d, (datetime, pd.Timestamp)):
-                                 next_date_str = d.strftime("%Y-%m-%d")
-                             else:
-                                 next_date_str = str(d)
-                         elif 'Earnings High' in cal.index: # Transposed?
-                             pass
-                         elif not cal.empty:
-                             pass
-                return tkr, next_date_str
-            except:
-                return tkr, "-"
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-            future_to_earnings = {executor.submit(fetch_earnings_safe, t): t for t in candidates}
-            count = 0
-            for future in concurrent.futures.as_completed(future_to_earnings):
-                t, d = future.result()
-                earnings_data[t] = d
-                count += 1
-                if count % 20 == 0: print(f"    Earnings: {count}/{len(candidates)}", end='\r')
+        data_tr = {"tickers": final_list}
+        with open(writer.path(snapshot.TRENDING), "w", encoding='utf-8') as f:
+            json.dump(data_tr, f)
+        writer.record(snapshot.TRENDING, rows=len(final_list), stage='trending')
+        print(f"Saved {writer.path(snapshot.TRENDING)}: {final_list}")
         
-        print("")
-        earnings_path = "data/earnings_cache.json"
-        with open(earnings_path, "w", encoding='utf-8') as f:
-            json.dump(earnings_data, f, ensure_ascii=False, indent=2) 
-        print(f"Saved {earnings_path}")
+    except Exception as e:
+        print(f"Trending Fetch Failed: {e}")
+        # Carry the last published list over so the snapshot stays complete
+        previous = snapshot.resolve(snapshot.TRENDING)
+        if os.path.exists(previous):
+            shutil.copyfile(previous, writer.path(snapshot.TRENDING))
+            writer.record(snapshot.TRENDING, stage='trending')
 
-        # 7. Trending Tickers (New)
-        print("Fetching Trending Tickers...")
-        try:
-            import requests # Lazy import
-            from io import StringIO
-            from market_logic import STATIC_MENU_ITEMS, THEMATIC_ETFS
-            
-            # Create a set of ETFs to skip earnings fetch
-            etf_tickers = set(THEMATIC_ETFS.values())
+def publish_snapshot(writer, timings):
+    """Final stage: runs only when every other stage succeeded -> make the snapshot visible"""
+    # 更新時刻を記録
+    txt_path = writer.path(snapshot.LAST_UPDATED)
+    # Use JST (UTC+9) for Japan time
+    from datetime import timezone, timedelta
+    JST = timezone(timedelta(hours=9))
+    with open(txt_path, "w") as f:
+        f.write(datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S"))
+    writer.record(snapshot.LAST_UPDATED, stage='publish')
+    print(f"Saved {txt_path}")
+    manifest = writer.publish(timings)
+    print(f"Published snapshot {manifest['version']} ({len(manifest['artifacts'])} artifacts) -> {writer.dir}")
+    print(f"Rate limiter: {rate_limiter.get_limiter().stats()}")
+    # Failing tickers and the requests their quarantine saved (details: python quarantine.py)
+    registry = quarantine.get_registry()
+    registry.prune()
+    registry.save()
+    print(f"Quarantine: {registry.stats()}")
 
-            url = "https://finance.yahoo.com/most-active"
-            fallback_tickers = ['RKLB', 'MU', 'OKLO', 'LLY', 'SOFI']
-            exclusion_set = {t for t in STATIC_MENU_ITEMS if not t.startswith('---')}
-            
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-            response = requests.get(url, headers=headers, timeout=10)
-            if response.status_code == 200:
-                dfs = pd.read_html(StringIO(response.text))
-                candidates_tr = []
-                if dfs:
-                    df_scrape = dfs[0]
-                    if 'Symbol' in df_scrape.columns:
-                        candidates_raw = df_scrape['Symbol'].head(30).dropna().astype(str).tolist()
-                        candidates_tr = [t.split()[0] for t in candidates_raw if t]
+def build_pipeline(state=None, export_csv=False, verify_indicators=False):
+    """
+    candidates ─┬─ prices ─┬─────────── indices ────┐
+                │          └─ metrics ─ signals ────┼─ publish
+                └─ enrich ──┘    └──────┴─ archive  │
+    trending ───────────────────────────────────────┘
+    prices: OHLCV sync, enrich: one .info per ticker for fundamentals / metadata / earnings.
+    Every output the app reads goes into data/snapshots/<version>.staging/; publish
+    writes the manifest and swaps data/CURRENT, so readers never see a half-written run.
+    On resume, tickers already synced by the interrupted run are not re-downloaded
+    (reference caches skip what they already refreshed on their own) and the
+    interrupted run's staging directory is reused (version = run start time).
+    """
+    sync_max_age_hours = state.hours_since_start() if state is not None and state.resumed else None
+    started = state.started if state is not None else datetime.now()
+    writer = snapshot.SnapshotWriter(started.strftime("%Y%m%d-%H%M%S"))
+    p = pipeline.Pipeline("Data update")
+    p.add('candidates', fetch_candidates)
+    p.add('prices', functools.partial(sync_prices, max_age_hours=sync_max_age_hours), deps=['candidates'],
+          outputs=[price_store.STORE_DIR])
+    p.add('enrich', functools.partial(enrich_tickers, writer=writer), deps=['candidates'],
+          outputs=[reference_store.DB_PATH, writer.path(snapshot.REFERENCE)])
+    metrics_outputs = [writer.path(snapshot.METRICS), writer.path(snapshot.HISTORY)]
+    if export_csv:
+        metrics_outputs.append(writer.path(snapshot.METRICS_CSV))
+    p.add('metrics', functools.partial(save_metrics, writer=writer, export_csv=export_csv),
+          deps=['candidates'], after=['prices', 'enrich'], outputs=metrics_outputs,
+          load=functools.partial(load_metrics, writer))
+    p.add('signals', functools.partial(save_daily_signals, writer=writer, verify_indicators=verify_indicators),
+          deps=['metrics'], outputs=[writer.path(snapshot.SIGNALS), indicator_state.STATE_PATH])
+    p.add('archive', archive_day, deps=['metrics', 'signals'], outputs=[metrics_archive.ARCHIVE_DIR])
+    p.add('indices', functools.partial(save_indices, writer=writer), after=['prices'],
+          outputs=[writer.path(snapshot.INDICES)])
+    p.add('trending', functools.partial(save_trending, writer=writer), outputs=[writer.path(snapshot.TRENDING)])
+    p.add('publish', functools.partial(publish_snapshot, writer=writer, timings=p.timings),
+          after=['signals', 'indices', 'enrich', 'trending'], outputs=[snapshot.POINTER_PATH])
+    return p
 
-                        # Filter
-                        filtered = [t for t in candidates_tr if t not in exclusion_set]
-                        final_list = filtered[:5]
-                        if not final_list: final_list = fallback_tickers
-                    else:
-                        final_list = fallback_tickers
-                else:
-                    final_list = fallback_tickers
-            else:
-                final_list = fallback_tickers
-                
-            data_tr = {"tickers": final_list}
-            with open("data/trending_cache.json", "w", encoding='utf-8') as f:
-                json.dump(data_tr, f)
-            print(f"Saved data/trending_cache.json: {final_list}")
-            
-        except Exception as e:
-            print(f"Trending Fetch Failed: {e}")
+def main():
+    parser = argparse.ArgumentParser(description="Nightly market data update")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted run: skip completed stages and already-synced tickers")
+    parser.add_argument('--export-csv', action='store_true',
+                        help="also write momentum_cache.csv into the snapshot (text export of the metrics table)")
+    parser.add_argument('--verify-indicators', action='store_true',
+                        help="check the streaming indicator state against a full recompute (fails the run on a mismatch)")
+    parser.add_argument('--workers', default=None,
+                        help="worker processes for the ranking / signal scans (N or 'auto'; default MM_WORKERS, serial)")
+    args = parser.parse_args()
+    if args.workers is not None:
+        os.environ[parallel.WORKERS_ENV] = str(args.workers)
 
-        # 更新時刻を記録
-        txt_path = "data/last_updated.txt"
-        # Use JST (UTC+9) for Japan time
-        from datetime import timezone, timedelta
-        JST = timezone(timedelta(hours=9))
-        with open(txt_path, "w") as f:
-            f.write(datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S"))
-        print(f"Saved {txt_path}")
-            
-    else:
-        print("Data update failed (Empty DataFrame)")
+    print(f"Starting Data Update: {datetime.now()}")
+    os.makedirs("data", exist_ok=True)
+    
+    # Every finished stage is checkpointed under data/checkpoints (cleared after a successful run)
+    state = pipeline.RunState(resume=args.resume)
+    
+    # Independent stages run concurrently (all requests share the adaptive rate limiter)
+    results, status = build_pipeline(state, export_csv=args.export_csv,
+                                     verify_indicators=args.verify_indicators).run(state=state)
+    
+    failed = [name for name, st in status.items() if st != 'done']
+    if failed:
+        print(f"Data update failed: {failed}")
         exit(1) # エラー終了
 
 if __name__ == "__main__":